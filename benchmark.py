@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from scatter_data import DATA_GROUPS, STATION_COLUMN, StationPartitions, read_columns
+from scatter_engine import DataGroupSettings, FigureTemplate, generate, render_plot
+from scatter_profile import StageProfiler
+from scatter_stats import compute_group_stats
+
+DEFAULT_SIZES = [10000, 1000000, 10000000]
+DEFAULT_STATIONS = [2, 10, 50]
+EXCEL_MAX_ROWS = 1048575
+RESULTS_DIR = 'benchmark_results'
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def dataset_path(data_dir, rows, stations, fmt):
+    return os.path.join(data_dir, f"synthetic_{rows}_{stations}.{fmt}")
+
+
+def make_dataset(path, rows, stations, seed=0):
+    if os.path.isfile(path):
+        return path
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        STATION_COLUMN: rng.integers(1, stations + 1, rows),
+        'DeltaX': rng.normal(0.0, 1.0, rows).round(4),
+        'DeltaY': rng.normal(0.5, 2.0, rows).round(4),
+        'DeltaAngle': rng.normal(0.0, 0.2, rows).round(4),
+        'Timestamp': np.arange(rows),
+    })
+    temp_path = path + '.tmp'
+    if path.endswith('.csv'):
+        df.to_csv(temp_path, index=False)
+    else:
+        df.to_excel(temp_path, index=False, engine='openpyxl')
+    os.replace(temp_path, path)
+    return path
+
+
+def bench_dataset(path, settings, output_path, plots, workers, memory=False):
+    timer = StageProfiler(memory)
+    with timer.stage('load'):
+        df = read_columns(path)
+    with timer.stage('partition'):
+        partitions = StationPartitions.from_frame(df)
+    with timer.stage('stats'):
+        stats = compute_group_stats(partitions)
+    partitions.stats.update(stats.to_dict('index'))
+
+    jobs = [(station, group) for station in partitions.stations for group in DATA_GROUPS][:plots]
+    for station, group in jobs:
+        # the same call generate makes, so the cache, render and save stages time the real PNG path
+        render_plot(partitions.values(station, group), station, group, settings, 'Bench', 'Bench', output_path,
+                    stats=partitions.stats[(station, group)], force=True, profiler=timer)
+
+    preview = FigureTemplate(DATA_GROUPS[0], settings, preview=True)
+    station = partitions.stations[0]
+    with timer.stage('preview'):
+        preview.render(partitions.values(station, DATA_GROUPS[0]), station, 'Bench',
+                       partitions.stats[(station, DATA_GROUPS[0])])
+        preview.fig.canvas.draw()
+
+    timer.close()
+    if memory:
+        return {'stages': timer.stages}
+
+    stations = sorted({station for station, _ in jobs})
+    start = time.perf_counter()
+    generated, errors = generate(partitions, stations, DATA_GROUPS, settings, 'Bench', 'Bench', output_path,
+                                 workers=workers, force=True)
+    generate_seconds = time.perf_counter() - start
+
+    # render includes the tight_layout pass the template runs when the y-limits change
+    per_plot = sum(timer.stages[name]['seconds'] for name in ('cache', 'render', 'save')) / max(len(jobs), 1)
+    return {
+        'rows': len(df),
+        'stations': len(partitions.stations),
+        'plots': len(jobs),
+        'stages': timer.stages,
+        'plots_per_second': 1.0 / per_plot if per_plot else None,
+        'generate': {'plots': len(generated), 'errors': len(errors), 'workers': workers,
+                     'seconds': generate_seconds,
+                     'plots_per_second': len(generated) / generate_seconds if generate_seconds else None},
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+        'commit': commit,
+    }
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def print_result(name, result):
+    print(f"{name}: {result['rows']} rows, {result['stations']} stations, {result['plots']} plots")
+    for stage, timing in result['stages'].items():
+        print(f"  {stage:<13}{timing['seconds'] * 1000 / timing['calls']:>10.1f} ms/call"
+              f"{timing['peak_bytes'] / 2 ** 20:>10.1f} MiB peak")
+    if result['plots_per_second']:
+        print(f"  {'plots/sec':<13}{result['plots_per_second']:>10.2f} (cache key + render + save)")
+    generated = result['generate']
+    if generated['plots_per_second']:
+        print(f"  {'generate':<13}{generated['plots_per_second']:>10.2f} plots/sec "
+              f"with {generated['workers']} worker(s)")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline['environment'].get('commit')}):")
+    for name, result in results['datasets'].items():
+        old = baseline['datasets'].get(name)
+        if not old:
+            continue
+        for stage, timing in result['stages'].items():
+            old_timing = old['stages'].get(stage)
+            if not old_timing or not old_timing['seconds']:
+                continue
+            ratio = (timing['seconds'] / timing['calls']) / (old_timing['seconds'] / old_timing['calls'])
+            print(f"  {name} {stage:<13}{ratio:>7.2f}x")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark loading, partitioning, stats, rendering and saving "
+                                                 "on synthetic station data.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Row counts to benchmark")
+    parser.add_argument('--stations', type=int, nargs='+', default=DEFAULT_STATIONS,
+                        help="Station counts to benchmark")
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv'],
+                        help=f"Data file formats (xlsx is skipped above {EXCEL_MAX_ROWS} rows)")
+    parser.add_argument('--plots', type=int, default=12, help="Plots rendered per dataset (default: 12)")
+    parser.add_argument('-j', '--workers', type=int, default=1, help="Workers for the end-to-end generate run")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'scatter_benchmark'),
+                        help="Where synthetic datasets are generated and reused")
+    parser.add_argument('-o', '--output', default=RESULTS_DIR, help="Directory for the JSON results")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the extra tracemalloc pass that records peak memory per stage")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.makedirs(args.output, exist_ok=True)
+    settings = DataGroupSettings()
+    results = {'created': datetime.now().isoformat(timespec='seconds'), 'environment': environment(),
+               'datasets': {}}
+
+    with tempfile.TemporaryDirectory() as output_path:
+        for fmt in args.formats:
+            for rows in args.sizes:
+                if fmt == 'xlsx' and rows > EXCEL_MAX_ROWS:
+                    continue
+                for stations in args.stations:
+                    name = f"{fmt}_{rows}_{stations}"
+                    path = make_dataset(dataset_path(args.data_dir, rows, stations, fmt), rows, stations)
+                    result = bench_dataset(path, settings, output_path, args.plots, max(1, args.workers))
+                    if not args.no_memory:
+                        # tracemalloc slows allocation-heavy stages, so peaks come from a separate pass
+                        traced = bench_dataset(path, settings, output_path, 1, 1, memory=True)
+                        for stage, timing in traced['stages'].items():
+                            result['stages'][stage]['peak_bytes'] = timing['peak_bytes']
+                    results['datasets'][name] = result
+                    print_result(name, result)
+
+    results['peak_rss_bytes'] = peak_rss_bytes()
+    results_path = os.path.join(args.output, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(results_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {results_path}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
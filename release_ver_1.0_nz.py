@@ -1,61 +1,34 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, StringVar
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import logging
 import os
+import queue
 import sys
+import threading
+import time
+from datetime import datetime
 
+STARTUP_TIME = time.perf_counter()
+logger = logging.getLogger(__name__)
 
-class DataGroupSettings:
-    def __init__(self):
-        self.default_settings = {
-            'DeltaX': {
-                'y_min': 2,
-                'y_max': 5,
-                'ref_lines': [3.0, 4.0, 3.5],
-                'ref_colors': ['red', 'red', 'orange'],
-                'ref_styles': ['-', '-', '--'],
-                'ref_labels': ['Ref Line 1', 'Ref Line 2', 'Ref Line 3'],
-                'point_size': 15,
-                'point_color': 'royalblue',
-                'title_prefix': 'NoName',
-                'file_prefix': 'NoName'
-            },
-            'DeltaY': {
-                'y_min': -1,
-                'y_max': 2,
-                'ref_lines': [0.0, 1.0, 0.5],
-                'ref_colors': ['red', 'red', 'orange'],
-                'ref_styles': ['-', '-', '--'],
-                'ref_labels': ['Ref Line 1', 'Ref Line 2', 'Ref Line 3'],
-                'point_size': 15,
-                'point_color': 'forestgreen',
-                'title_prefix': 'NoName',
-                'file_prefix': 'NoName'
-            },
-            'DeltaAngle': {
-                'y_min': -1,
-                'y_max': 5,
-                'ref_lines': [0.0, 4.0],
-                'ref_colors': ['green', 'green'],
-                'ref_styles': ['-', '-'],
-                'ref_labels': ['Min Value', 'Max Value'],
-                'point_size': 15,
-                'point_color': 'red',
-                'title_prefix': 'NoName',
-                'file_prefix': 'NoName'
-            }
-        }
+if __name__ == "__main__" and len(sys.argv) > 1:
+    from scatter_engine import main
+    sys.exit(main())
 
-        self.settings = {group: values.copy() for group, values in self.default_settings.items()}
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, StringVar
+from scatter_output import DEFAULT_DPI, DPI_PRESETS, IMAGE_FORMATS, parse_dpi
+from scatter_profile import StageProfiler, profile_stage
+from scatter_settings import DataGroupSettings, EXPORT_FORMATS, RENDER_MODES, SUMMARY_KINDS, format_limit
 
-    def get_setting(self, data_group, setting_name):
-        return self.settings[data_group].get(setting_name)
+# pandas (scatter_data/scatter_stats) and matplotlib (scatter_engine, TkAgg) are imported on first use
+# so the window appears without waiting for them.
 
-    def update_setting(self, data_group, setting_name, value):
-        if data_group in self.settings:
-            self.settings[data_group][setting_name] = value
+ALL_STATIONS = "All Stations"
+ALL_SHEETS = "All Sheets"
+NO_SUMMARY = "none"
+ALL_SUMMARIES = "all"
+GENERATION_POLL_MS = 50
+WATCH_INTERVAL_SECONDS = 2.0
+WATCH_POLL_BYTES = 4 * 1024 * 1024
 
 
 class ScatterPlotGenerator:
@@ -67,7 +40,10 @@ class ScatterPlotGenerator:
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.data_settings = DataGroupSettings()
         self.current_data_group = None
-        self.station_var = tk.StringVar(value="both")
+        self.station_var = tk.StringVar(value=ALL_STATIONS)
+        self.sheet_var = tk.StringVar(value="")
+        self.sheet_names = []
+        self.sheet_source = None
         self.preview_frame = None
         self.preview_fig = None
         self.current_preview = None
@@ -80,10 +56,33 @@ class ScatterPlotGenerator:
         self.title_prefix_vars = {}
         self.file_prefix_vars = {}
         self.point_size_displays = {}
+        self.generation_thread = None
+        self.generation_queue = None
+        self.cancel_event = None
+        self.progress_widgets = None
+        self.preview_templates = {}
+        self.preview_frames = {}
+        self.preview_keys = {}
+        self.preview_group = None
+        self.preview_sheet = None
+        self.preview_refresh_pending = False
+        self.preview_thread = None
+        self.preview_queue = None
+        self.watch_tail = None
+        self.watch_job = None
+        self.watch_added = 0
+        self.watch_preview_pending = False
         self.create_widgets()
 
+    def report_startup(self):
+        self.root.update_idletasks()
+        self.startup_seconds = time.perf_counter() - STARTUP_TIME
+        logger.info("Window ready in %.0f ms", self.startup_seconds * 1000)
+
     def on_close(self):
-        plt.close('all')
+        self.stop_watch()
+        if self.cancel_event is not None:
+            self.cancel_event.set()
         self.root.destroy()
         sys.exit(0)
 
@@ -100,6 +99,12 @@ class ScatterPlotGenerator:
         self.root.rowconfigure(0, weight=1)
         self.create_settings_ui(settings_frame)
         self.create_preview_ui(preview_frame)
+        preview_vars = [self.global_title_prefix, self.render_mode_var, self.highlight_var]
+        for group in self.data_groups:
+            preview_vars += [self.y_min_vars[group], self.y_max_vars[group],
+                             self.point_size_vars[group], self.point_color_vars[group]]
+        for var in preview_vars:
+            var.trace_add('write', self.schedule_preview_refresh)
 
         button_frame = ttk.Frame(settings_frame, padding="5")
         button_frame.grid(row=12, column=0, columnspan=3, pady=10)
@@ -133,11 +138,82 @@ class ScatterPlotGenerator:
         ttk.Button(file_frame, text="Browse...", command=self.browse_save_path).grid(row=1, column=2, padx=5, pady=2)
 
         ttk.Label(file_frame, text="Stations:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
-        station_combo = ttk.Combobox(file_frame, textvariable=self.station_var,
-                                     values=["Station 1", "Station 2", "Both Stations"],
-                                     state="readonly", width=20)
-        station_combo.set("Both Stations")
-        station_combo.grid(row=2, column=1, padx=5, pady=2, sticky=tk.W)
+        self.station_combo = ttk.Combobox(file_frame, textvariable=self.station_var,
+                                          values=[ALL_STATIONS, "Station 1", "Station 2"],
+                                          state="readonly", width=20)
+        self.station_combo.set(ALL_STATIONS)
+        self.station_combo.grid(row=2, column=1, padx=5, pady=2, sticky=tk.W)
+
+        ttk.Label(file_frame, text="Workers:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=2)
+        self.worker_count = tk.IntVar(value=1)
+        ttk.Spinbox(file_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.worker_count,
+                    state="readonly", width=5).grid(row=4, column=1, padx=5, pady=2, sticky=tk.W)
+
+        ttk.Label(file_frame, text="Render mode:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=2)
+        render_frame = ttk.Frame(file_frame)
+        render_frame.grid(row=5, column=1, padx=5, pady=2, sticky=tk.W)
+        self.render_mode_var = tk.StringVar(value=self.data_settings.render_mode)
+        ttk.Combobox(render_frame, textvariable=self.render_mode_var, values=list(RENDER_MODES),
+                     state="readonly", width=10).pack(side=tk.LEFT)
+        self.highlight_var = tk.BooleanVar(value=self.data_settings.highlight_violations)
+        ttk.Checkbutton(render_frame, text="Mark out-of-spec points",
+                        variable=self.highlight_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        ttk.Label(file_frame, text="Watch file:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=2)
+        watch_frame = ttk.Frame(file_frame)
+        watch_frame.grid(row=6, column=1, padx=5, pady=2, sticky=tk.W)
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(watch_frame, variable=self.watch_var, command=self.toggle_watch).pack(side=tk.LEFT)
+        ttk.Label(watch_frame, text="Refresh (s):").pack(side=tk.LEFT, padx=(10, 2))
+        self.watch_interval = tk.DoubleVar(value=WATCH_INTERVAL_SECONDS)
+        ttk.Spinbox(watch_frame, from_=0.5, to=60, increment=0.5, textvariable=self.watch_interval,
+                    width=5).pack(side=tk.LEFT)
+
+        force_frame = ttk.Frame(file_frame)
+        force_frame.grid(row=7, column=1, padx=5, pady=2, sticky=tk.W)
+        self.force_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(force_frame, text="Re-render unchanged plots", variable=self.force_var).pack(side=tk.LEFT)
+        self.index_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(force_frame, text="Write plot index",
+                        variable=self.index_var).pack(side=tk.LEFT, padx=(10, 0))
+        self.spec_report_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(force_frame, text="Write out-of-spec report",
+                        variable=self.spec_report_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        profile_frame = ttk.Frame(file_frame)
+        profile_frame.grid(row=8, column=1, padx=5, pady=2, sticky=tk.W)
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(profile_frame, text="Profile stages", variable=self.profile_var).pack(side=tk.LEFT)
+        self.profile_memory_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(profile_frame, text="Track memory",
+                        variable=self.profile_memory_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        ttk.Label(file_frame, text="Export as:").grid(row=9, column=0, sticky=tk.W, padx=5, pady=2)
+        export_frame = ttk.Frame(file_frame)
+        export_frame.grid(row=9, column=1, padx=5, pady=2, sticky=tk.W)
+        self.export_var = tk.StringVar(value=EXPORT_FORMATS[0])
+        ttk.Combobox(export_frame, textvariable=self.export_var, values=list(EXPORT_FORMATS),
+                     state="readonly", width=10).pack(side=tk.LEFT)
+        ttk.Label(export_frame, text="Image:").pack(side=tk.LEFT, padx=(10, 2))
+        self.image_format_var = tk.StringVar(value=IMAGE_FORMATS[0])
+        ttk.Combobox(export_frame, textvariable=self.image_format_var, values=list(IMAGE_FORMATS),
+                     state="readonly", width=6).pack(side=tk.LEFT)
+        ttk.Label(export_frame, text="DPI:").pack(side=tk.LEFT, padx=(10, 2))
+        self.dpi_var = tk.StringVar(value=next(name for name, dpi in DPI_PRESETS.items() if dpi == DEFAULT_DPI))
+        ttk.Combobox(export_frame, textvariable=self.dpi_var, values=list(DPI_PRESETS),
+                     width=9).pack(side=tk.LEFT)
+
+        ttk.Label(file_frame, text="Sheets:").grid(row=10, column=0, sticky=tk.W, padx=5, pady=2)
+        self.sheet_combo = ttk.Combobox(file_frame, textvariable=self.sheet_var, values=[], state="disabled",
+                                        width=20)
+        self.sheet_combo.grid(row=10, column=1, padx=5, pady=2, sticky=tk.W)
+        self.sheet_combo.bind("<<ComboboxSelected>>", self.on_sheet_changed)
+
+        ttk.Label(file_frame, text="Summary chart:").grid(row=11, column=0, sticky=tk.W, padx=5, pady=2)
+        self.summary_var = tk.StringVar(value=NO_SUMMARY)
+        ttk.Combobox(file_frame, textvariable=self.summary_var,
+                     values=[NO_SUMMARY] + list(SUMMARY_KINDS) + [ALL_SUMMARIES],
+                     state="readonly", width=10).grid(row=11, column=1, padx=5, pady=2, sticky=tk.W)
 
         prefix_frame = ttk.LabelFrame(file_frame, text="Global Prefixes")
         prefix_frame.grid(row=3, column=0, columnspan=3, sticky=tk.W + tk.E, pady=5)
@@ -159,83 +235,89 @@ class ScatterPlotGenerator:
         self.data_groups = ["DeltaX", "DeltaY", "DeltaAngle"]
         self.notebook = ttk.Notebook(data_frame)
         self.notebook.pack(fill='both', expand=True, padx=5, pady=5)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         for group in self.data_groups:
             tab_frame = ttk.Frame(self.notebook, padding="5")
             self.notebook.add(tab_frame, text=group)
             self.tab_frames[group] = tab_frame
             tab_frame.columnconfigure(0, weight=1)
             tab_frame.rowconfigure(0, weight=1)
-            prefix_frame = ttk.LabelFrame(tab_frame, text="Title and Filename Prefix")
-            prefix_frame.grid(row=0, column=0, sticky=tk.W + tk.E, pady=5)
-            range_frame = ttk.LabelFrame(tab_frame, text="Y-axis Range")
-            range_frame.grid(row=0, column=0, sticky=tk.W + tk.E, pady=5)
-            ttk.Label(range_frame, text="Minimum:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
-            self.y_min_vars[group] = tk.StringVar(
-                value=str(self.data_settings.get_setting(group, 'y_min')))
-            ttk.Entry(range_frame, textvariable=self.y_min_vars[group], width=10).grid(row=0, column=1, padx=5, pady=2,
-                                                                                       sticky=tk.W)
-            ttk.Label(range_frame, text="Maximum:").grid(row=0, column=2, sticky=tk.W, padx=5, pady=2)
-            self.y_max_vars[group] = tk.StringVar(
-                value=str(self.data_settings.get_setting(group, 'y_max')))
-            ttk.Entry(range_frame, textvariable=self.y_max_vars[group], width=10).grid(row=0, column=3, padx=5, pady=2,
-                                                                                       sticky=tk.W)
-            ref_frame = ttk.LabelFrame(tab_frame, text="Reference Lines")
-            ref_frame.grid(row=2, column=0, sticky=tk.W + tk.E, pady=5)
-            columns = ("Value", "Style", "Color", "Label")
-            ref_tree = ttk.Treeview(ref_frame, columns=columns, show="headings", height=5)
-            self.ref_trees[group] = ref_tree
-            for col in columns:
-                ref_tree.heading(col, text=col)
-                ref_tree.column(col, width=110, anchor="center")
-            ref_tree.grid(row=0, column=0, columnspan=4, padx=5, pady=5, sticky=tk.W + tk.E)
-            ref_lines = self.data_settings.get_setting(group, 'ref_lines') or []
-            ref_colors = self.data_settings.get_setting(group, 'ref_colors') or []
-            ref_styles = self.data_settings.get_setting(group, 'ref_styles') or []
-            ref_labels = self.data_settings.get_setting(group, 'ref_labels') or []
-            for i in range(len(ref_lines)):
-                ref_tree.insert("", "end", values=(
-                    ref_lines[i],
-                    ref_styles[i] if i < len(ref_styles) else "-",
-                    ref_colors[i] if i < len(ref_colors) else "red",
-                    ref_labels[i] if i < len(ref_labels) else "Reference"
-                ))
-
-            btn_frame = ttk.Frame(ref_frame)
-            btn_frame.grid(row=1, column=0, columnspan=4, sticky=tk.W + tk.E)
-
-            ttk.Button(btn_frame, text="Add Line",
-                       command=lambda g=group: self.add_ref_line(g)).grid(row=0, column=0, padx=2, pady=5)
-            ttk.Button(btn_frame, text="Remove Line",
-                       command=lambda g=group: self.remove_ref_line(g)).grid(row=0, column=1, padx=2, pady=5)
-            ttk.Button(btn_frame, text="Edit Line",
-                       command=lambda g=group: self.edit_ref_line(g)).grid(row=0, column=2, padx=2, pady=5)
-
-            point_frame = ttk.LabelFrame(tab_frame, text="Point Settings")
-            point_frame.grid(row=3, column=0, sticky=tk.W + tk.E, pady=5)
-
-            ttk.Label(point_frame, text="Point size:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-            self.point_size_vars[group] = tk.IntVar(
-                value=self.data_settings.get_setting(group, 'point_size') or 15)
-            ttk.Scale(point_frame, from_=10, to=40, orient=tk.HORIZONTAL,
-                      variable=self.point_size_vars[group],
-                      command=lambda v, g=group: self.update_point_size_display(g, v)).grid(row=0, column=1, padx=5,
-                                                                                            pady=5)
-
-            self.point_size_displays[group] = ttk.Label(point_frame, text=str(self.point_size_vars[group].get()))
-            self.point_size_displays[group].grid(row=0, column=2, padx=5, pady=5)
-
-            ttk.Label(point_frame, text="Point color:").grid(row=0, column=3, sticky=tk.W, padx=5, pady=5)
-            point_colors = ["royalblue", "forestgreen", "red", "purple", "orange", "black"]
-            self.point_color_vars[group] = tk.StringVar(
-                value=self.data_settings.get_setting(group, 'point_color') or "royalblue")
-            ttk.Combobox(point_frame, textvariable=self.point_color_vars[group],
-                         values=point_colors, state="readonly", width=12).grid(row=0, column=4, padx=5, pady=5)
+            self.y_min_vars[group] = tk.StringVar(value=format_limit(self.data_settings[group].y_min))
+            self.y_max_vars[group] = tk.StringVar(value=format_limit(self.data_settings[group].y_max))
+            self.point_size_vars[group] = tk.IntVar(value=self.data_settings[group].point_size or 15)
+            self.point_color_vars[group] = tk.StringVar(value=self.data_settings[group].point_color or "royalblue")
+        self.build_tab(self.data_groups[0])
+
+    def build_tab(self, group):
+        if group in self.ref_trees:
+            return
+        tab_frame = self.tab_frames[group]
+        prefix_frame = ttk.LabelFrame(tab_frame, text="Title and Filename Prefix")
+        prefix_frame.grid(row=0, column=0, sticky=tk.W + tk.E, pady=5)
+        range_frame = ttk.LabelFrame(tab_frame, text="Y-axis Range")
+        range_frame.grid(row=0, column=0, sticky=tk.W + tk.E, pady=5)
+        ttk.Label(range_frame, text="Minimum:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(range_frame, textvariable=self.y_min_vars[group], width=10).grid(row=0, column=1, padx=5, pady=2,
+                                                                                   sticky=tk.W)
+        ttk.Label(range_frame, text="Maximum:").grid(row=0, column=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(range_frame, textvariable=self.y_max_vars[group], width=10).grid(row=0, column=3, padx=5, pady=2,
+                                                                                   sticky=tk.W)
+        ref_frame = ttk.LabelFrame(tab_frame, text="Reference Lines")
+        ref_frame.grid(row=2, column=0, sticky=tk.W + tk.E, pady=5)
+        columns = ("Value", "Style", "Color", "Label")
+        ref_tree = ttk.Treeview(ref_frame, columns=columns, show="headings", height=5)
+        self.ref_trees[group] = ref_tree
+        for col in columns:
+            ref_tree.heading(col, text=col)
+            ref_tree.column(col, width=110, anchor="center")
+        ref_tree.grid(row=0, column=0, columnspan=4, padx=5, pady=5, sticky=tk.W + tk.E)
+        self.fill_ref_tree(group)
+
+        btn_frame = ttk.Frame(ref_frame)
+        btn_frame.grid(row=1, column=0, columnspan=4, sticky=tk.W + tk.E)
+
+        ttk.Button(btn_frame, text="Add Line",
+                   command=lambda g=group: self.add_ref_line(g)).grid(row=0, column=0, padx=2, pady=5)
+        ttk.Button(btn_frame, text="Remove Line",
+                   command=lambda g=group: self.remove_ref_line(g)).grid(row=0, column=1, padx=2, pady=5)
+        ttk.Button(btn_frame, text="Edit Line",
+                   command=lambda g=group: self.edit_ref_line(g)).grid(row=0, column=2, padx=2, pady=5)
+
+        point_frame = ttk.LabelFrame(tab_frame, text="Point Settings")
+        point_frame.grid(row=3, column=0, sticky=tk.W + tk.E, pady=5)
+
+        ttk.Label(point_frame, text="Point size:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Scale(point_frame, from_=10, to=40, orient=tk.HORIZONTAL,
+                  variable=self.point_size_vars[group],
+                  command=lambda v, g=group: self.update_point_size_display(g, v)).grid(row=0, column=1, padx=5,
+                                                                                        pady=5)
+
+        self.point_size_displays[group] = ttk.Label(point_frame, text=str(self.point_size_vars[group].get()))
+        self.point_size_displays[group].grid(row=0, column=2, padx=5, pady=5)
+
+        ttk.Label(point_frame, text="Point color:").grid(row=0, column=3, sticky=tk.W, padx=5, pady=5)
+        point_colors = ["royalblue", "forestgreen", "red", "purple", "orange", "black"]
+        ttk.Combobox(point_frame, textvariable=self.point_color_vars[group],
+                     values=point_colors, state="readonly", width=12).grid(row=0, column=4, padx=5, pady=5)
+
+    def on_tab_changed(self, event=None):
+        self.build_tab(self.data_groups[self.notebook.index(self.notebook.select())])
+        if self.current_preview is not None:
+            self.preview_plot()
 
     def update_point_size_display(self, data_group, value):
         self.point_size_displays[data_group].config(text=str(round(float(value))))
 
+    def fill_ref_tree(self, data_group):
+        ref_tree = self.ref_trees[data_group]
+        ref_tree.delete(*ref_tree.get_children())
+        for ref in self.data_settings.get_ref_lines(data_group):
+            ref_tree.insert("", "end", values=(f"{ref['value']:g}", ref['style'], ref['color'], ref['label']))
+
     def add_ref_line(self, data_group):
-        self.ref_trees[data_group].insert("", "end", values=(0.0, '-', 'red', 'Reference'))
+        self.data_settings[data_group].ref_lines.append(0.0)
+        self.fill_ref_tree(data_group)
+        self.schedule_preview_refresh()
 
     def edit_ref_line(self, data_group):
         ref_tree = self.ref_trees[data_group]
@@ -277,29 +359,95 @@ class ScatterPlotGenerator:
         button_frame.grid(row=row_idx, column=0, columnspan=2, pady=15)
 
         def save_changes():
-            new_values = (
-                value_var.get(),
-                style_var.get(),
-                color_var.get(),
-                label_var.get()
-            )
-            ref_tree.item(item, values=new_values)
+            try:
+                value = float(value_var.get())
+            except ValueError:
+                messagebox.showerror("Error", "Reference line value must be a number", parent=edit_win)
+                return
+            self.data_settings[data_group].ref_lines.update(ref_tree.index(item), value, style_var.get(),
+                                                            color_var.get(), label_var.get())
+            self.fill_ref_tree(data_group)
             edit_win.destroy()
+            self.schedule_preview_refresh()
 
         ttk.Button(button_frame, text="Save", command=save_changes, width=10).grid(row=0, column=0, padx=10)
         ttk.Button(button_frame, text="Cancel", command=edit_win.destroy, width=10).grid(row=0, column=1, padx=10)
 
     def remove_ref_line(self, data_group):
-        selected = self.ref_trees[data_group].selection()
+        ref_tree = self.ref_trees[data_group]
+        selected = ref_tree.selection()
         if selected:
-            self.ref_trees[data_group].delete(selected)
+            self.data_settings[data_group].ref_lines.remove([ref_tree.index(item) for item in selected])
+            self.fill_ref_tree(data_group)
+            self.schedule_preview_refresh()
 
     def browse_file(self):
         file_path = filedialog.askopenfilename(
-            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("All files", "*.*")]
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("Station column files", "*.stcol"),
+                       ("All files", "*.*")]
         )
         if file_path:
+            self.stop_watch()
             self.file_path.set(file_path)
+            # the data is parsed by Preview or Generate, off the Tk thread and with errors reported
+            self.refresh_sheets()
+            self.station_combo.config(values=[ALL_STATIONS])
+            self.station_var.set(ALL_STATIONS)
+
+    def refresh_sheets(self):
+        file_path = self.file_path.get()
+        if file_path == self.sheet_source:
+            return
+        from scatter_data import list_sheets
+        self.sheet_source = file_path
+        try:
+            sheets = list_sheets(file_path) if os.path.isfile(file_path) else []
+        except ValueError:
+            sheets = []
+        # a single-sheet workbook is loaded as before, sidecar included
+        self.sheet_names = sheets if len(sheets) > 1 else []
+        if self.sheet_names:
+            self.sheet_combo.config(values=[ALL_SHEETS] + self.sheet_names, state="readonly")
+            if self.sheet_var.get() not in self.sheet_names:
+                self.sheet_var.set(self.sheet_names[0])
+        else:
+            self.sheet_combo.config(values=[], state="disabled")
+            self.sheet_var.set("")
+
+    def current_sheet(self):
+        self.refresh_sheets()
+        if not self.sheet_names:
+            return None
+        sheet = self.sheet_var.get()
+        return self.sheet_names[0] if sheet == ALL_SHEETS else sheet
+
+    def selected_sheets(self):
+        self.refresh_sheets()
+        if not self.sheet_names:
+            return [None]
+        if self.sheet_var.get() == ALL_SHEETS:
+            return list(self.sheet_names)
+        return [self.sheet_var.get()]
+
+    def on_sheet_changed(self, event=None):
+        if self.current_preview is not None:
+            self.preview_plot()
+
+    def preview_title_prefix(self):
+        from scatter_engine import sheet_prefixes
+        return sheet_prefixes(self.global_title_prefix.get(), self.global_file_prefix.get(), self.preview_sheet)[0]
+
+    def refresh_stations(self, partitions):
+        values = [ALL_STATIONS] + [f"Station {station}" for station in partitions.stations]
+        self.station_combo.config(values=values)
+        if self.station_var.get() not in values:
+            self.station_var.set(ALL_STATIONS)
+
+    def selected_stations(self, partitions):
+        station_selection = self.station_var.get()
+        if station_selection == ALL_STATIONS:
+            return list(partitions.stations)
+        return [int(station_selection.split()[-1])]
 
     def browse_save_path(self):
         save_path = filedialog.askdirectory()
@@ -315,38 +463,23 @@ class ScatterPlotGenerator:
         self.clear_preview()
 
     def reset_settings(self):
+        self.stop_watch()
         self.file_path.set("")
         self.save_path.set(os.getcwd())
-        self.station_var.set("Both Stations")
+        self.station_var.set(ALL_STATIONS)
 
+        self.data_settings = DataGroupSettings()
         for group in self.data_groups:
-            default_min = self.data_settings.default_settings[group]['y_min']
-            default_max = self.data_settings.default_settings[group]['y_max']
-            self.y_min_vars[group].set(str(default_min))
-            self.y_max_vars[group].set(str(default_max))
-
-            ref_tree = self.ref_trees[group]
-            for item in ref_tree.get_children():
-                ref_tree.delete(item)
-
-            ref_lines = self.data_settings.default_settings[group]['ref_lines']
-            ref_colors = self.data_settings.default_settings[group]['ref_colors']
-            ref_styles = self.data_settings.default_settings[group]['ref_styles']
-            ref_labels = self.data_settings.default_settings[group]['ref_labels']
-
-            for i in range(len(ref_lines)):
-                ref_tree.insert("", "end", values=(
-                    ref_lines[i],
-                    ref_styles[i],
-                    ref_colors[i],
-                    ref_labels[i]
-                ))
-
-            self.point_size_vars[group].set(self.data_settings.default_settings[group]['point_size'])
-            self.point_size_displays[group].config(text=str(self.point_size_vars[group].get()))
-            self.point_color_vars[group].set(self.data_settings.default_settings[group]['point_color'])
-            self.title_prefix_vars[group].set(self.data_settings.default_settings[group]['title_prefix'])
-            self.file_prefix_vars[group].set(self.data_settings.default_settings[group]['file_prefix'])
+            defaults = self.data_settings[group]
+            self.y_min_vars[group].set(format_limit(defaults.y_min))
+            self.y_max_vars[group].set(format_limit(defaults.y_max))
+            if group in self.ref_trees:
+                self.fill_ref_tree(group)
+
+            self.point_size_vars[group].set(defaults.point_size)
+            if group in self.point_size_displays:
+                self.point_size_displays[group].config(text=str(self.point_size_vars[group].get()))
+            self.point_color_vars[group].set(defaults.point_color)
 
         self.clear_preview()
 
@@ -366,27 +499,34 @@ class ScatterPlotGenerator:
         placeholder.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
         self.current_preview = placeholder_frame
 
-        if hasattr(self, 'preview_fig'):
-            plt.close(self.preview_fig)
-            del self.preview_fig
-
+        self.preview_fig = None
         self.current_preview = None
+        self.preview_templates = {}
+        self.preview_frames = {}
+        self.preview_keys = {}
+        self.preview_group = None
+        self.preview_sheet = None
 
     def validate_inputs(self):
+        from scatter_data import SUPPORTED_EXTENSIONS
         errors = []
         if not self.file_path.get():
             errors.append("Please select an Excel file")
         elif not os.path.isfile(self.file_path.get()):
             errors.append("Selected file does not exist")
-        elif not (self.file_path.get().endswith('.xlsx') or self.file_path.get().endswith('.csv')):
-            errors.append("Only .xlsx or .csv files are supported")
+        elif not self.file_path.get().endswith(SUPPORTED_EXTENSIONS):
+            errors.append("Only .xlsx, .csv or .stcol files are supported")
         if not self.save_path.get():
             errors.append("Please select a save path")
         elif not os.path.isdir(self.save_path.get()):
             errors.append("Selected save path does not exist")
         station = self.station_var.get()
-        if station not in ["Station 1", "Station 2", "Both Stations"]:
+        if station != ALL_STATIONS and not (station.startswith("Station ") and station.split()[-1].isdigit()):
             errors.append("Invalid station selection")
+        try:
+            parse_dpi(self.dpi_var.get().strip())
+        except ValueError as e:
+            errors.append(str(e))
         for group in self.data_groups:
             ymin = self.y_min_vars[group].get()
             ymax = self.y_max_vars[group].get()
@@ -400,111 +540,82 @@ class ScatterPlotGenerator:
                 except ValueError:
                     errors.append(f"{group}: Y-axis values must be numbers")
 
-            for item in self.ref_trees[group].get_children():
-                values = self.ref_trees[group].item(item, "values")
-                if len(values) > 0:
-                    try:
-                        float(values[0])
-                    except ValueError:
-                        errors.append(f"{group}: Reference line value must be a number")
-
         return errors
 
-    def get_ref_lines(self, data_group):
-        ref_lines = []
-        for item in self.ref_trees[data_group].get_children():
-            values = self.ref_trees[data_group].item(item, "values")
-            if len(values) < 4:
-                continue
-
-            try:
-                ref_lines.append({
-                    'value': float(values[0]),
-                    'style': values[1],
-                    'color': values[2],
-                    'label': values[3]
-                })
-            except ValueError:
-                continue
-
-        return ref_lines
-
-    def create_plot(self, df, station, data_group, output_path=None, preview=False):
-        if preview:
-            fig, ax = plt.subplots(figsize=(6, 4))
-        else:
-            fig, ax = plt.subplots(figsize=(8, 6))
-
-        ref_lines = self.get_ref_lines(data_group)
-        x_values = range(1, len(df) + 1)
-        point_size = self.point_size_vars[data_group].get()
-        point_color = self.point_color_vars[data_group].get()
-        ax.scatter(x=x_values, y=df[data_group],
-                   s=point_size,
-                   alpha=0.7,
-                   color=point_color)
-        title_prefix = self.global_title_prefix.get()
-        title = f"{title_prefix}-Station {station}-{data_group} Distribution"
-        ax.set_title(title, fontsize=14)
-        ax.set_xlabel('', fontsize=12)
-        ax.set_ylabel(data_group, fontsize=12)
-        ax.set_xticks([])
-        values = df[data_group]
-        min_value = values.min()
-        max_value = values.max()
-        mean_value = values.mean()
-        stats_text = (f"Min: {min_value:.2f}\n"
-                      f"Max: {max_value:.2f}\n"
-                      f"Mean: {mean_value:.2f}")
-        ax.legend([stats_text], loc='upper right', frameon=True,
-                  handlelength=0, handletextpad=0,
-                  fontsize=11, markerscale=0, fancybox=True)
-        for ref in ref_lines:
-            ax.axhline(y=ref['value'],
-                       linestyle=ref['style'],
-                       color=ref['color'],
-                       linewidth=1.5 if ref['style'] == '--' else 1.2,
-                       alpha=0.7)
-            ax.text(len(df) * 1.02, ref['value'] + 0.02, ref['label'],
-                    fontsize=10, color=ref['color'],
-                    ha='left', va='bottom')
+    def collect_settings(self):
+        settings = self.data_settings.copy()
+        settings.render_mode = self.render_mode_var.get()
+        settings.highlight_violations = self.highlight_var.get()
+        for group in self.data_groups:
+            settings.update_setting(group, 'y_min', self.y_min_vars[group].get())
+            settings.update_setting(group, 'y_max', self.y_max_vars[group].get())
+            settings.update_setting(group, 'point_size', self.point_size_vars[group].get())
+            settings.update_setting(group, 'point_color', self.point_color_vars[group].get())
+        return settings
+
+    def update_preview(self, partitions, station, data_group, stats):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from scatter_data import file_stamp
+        from scatter_engine import FigureTemplate, settings_signature
+        settings = self.collect_settings()
+        template = self.preview_templates.get(data_group)
+        if template is None:
+            if not self.preview_templates:
+                for widget in self.preview_frame.winfo_children():
+                    widget.destroy()
+            frame = ttk.Frame(self.preview_frame, width=500, height=400)
+            template = FigureTemplate(data_group, settings, preview=True)
+            canvas = FigureCanvasTkAgg(template.fig, master=frame)
+            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            self.preview_templates[data_group] = template
+            self.preview_frames[data_group] = (frame, canvas)
+        elif template.signature != settings_signature(settings, data_group):
+            template.apply_settings(settings)
+
+        path = self.file_path.get()
         try:
-            y_min = float(self.y_min_vars[data_group].get())
-            y_max = float(self.y_max_vars[data_group].get())
-            ax.set_ylim(y_min, y_max)
-        except (ValueError, TypeError):
-            ref_values = [ref['value'] for ref in ref_lines] if ref_lines else []
-            if ref_values:
-                y_min = min(min(values) - 0.5, min(ref_values) - 1)
-                y_max = max(max(values) + 0.5, max(ref_values) + 1)
-            else:
-                y_min = min(values) - 0.5
-                y_max = max(values) + 0.5
-            ax.set_ylim(y_min, y_max)
-        plt.tight_layout()
-        if preview:
-            return fig
-        file_prefix = self.global_file_prefix.get()
-        safe_group_name = data_group.replace("/", "_").replace(" ", "_")
-        filename = f"{file_prefix}_Station_{station}_{safe_group_name}_Plot.png"
-        filepath = os.path.join(output_path, filename)
-
-        fig.savefig(filepath, dpi=150, bbox_inches='tight')
-        plt.close(fig)
-
-        return filename
-
-    def update_preview(self, fig):
-        for widget in self.preview_frame.winfo_children():
-            widget.destroy()
-
-        frame = ttk.Frame(self.preview_frame, width=500, height=400)
-        frame.pack(fill=tk.BOTH, expand=True)
-        self.preview_fig = fig
-        self.preview_canvas = FigureCanvasTkAgg(fig, master=frame)
-        self.preview_canvas.draw()
-        self.preview_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            stamp = file_stamp(path)
+        except OSError:
+            stamp = None
+        # a watched file is tailed between stamps, so its row count is part of the key too
+        key = (path, self.preview_sheet, stamp, len(partitions), station)
+        if self.preview_keys.get(data_group) != key:
+            template.render(partitions.values(station, data_group), station, self.preview_title_prefix(), stats)
+            self.preview_keys[data_group] = key
+        else:
+            template.set_title(station, self.preview_title_prefix())
+
+        frame, canvas = self.preview_frames[data_group]
+        if self.preview_group != data_group:
+            if self.preview_group in self.preview_frames:
+                self.preview_frames[self.preview_group][0].pack_forget()
+            frame.pack(fill=tk.BOTH, expand=True)
+        self.preview_group = data_group
+        self.preview_fig = template.fig
+        self.preview_canvas = canvas
         self.current_preview = frame
+        canvas.draw_idle()
+
+    def schedule_preview_refresh(self, *args):
+        if self.current_preview is None or self.preview_refresh_pending:
+            return
+        self.preview_refresh_pending = True
+        self.root.after_idle(self.refresh_preview_settings)
+
+    def refresh_preview_settings(self):
+        from scatter_engine import settings_signature
+        self.preview_refresh_pending = False
+        template = self.preview_templates.get(self.preview_group)
+        if template is None:
+            return
+        try:
+            settings = self.collect_settings()
+            if template.signature != settings_signature(settings, self.preview_group):
+                template.apply_settings(settings)
+        except (tk.TclError, ValueError):
+            return
+        template.set_title(template.station, self.preview_title_prefix())
+        self.preview_canvas.draw_idle()
 
     def preview_plot(self):
         errors = self.validate_inputs()
@@ -512,123 +623,387 @@ class ScatterPlotGenerator:
             messagebox.showerror("Input Error", "\n".join(errors))
             return
 
+        file_path = self.file_path.get()
+        if self.watch_tail is not None and self.watch_tail.path == file_path:
+            self.preview_sheet = None
+            self.show_preview(self.watch_tail)
+            return
+        if self.preview_thread is not None:
+            # the running load re-checks the selection when it finishes
+            return
+        from scatter_data import dataset_cache
+        sheet = self.current_sheet()
+        try:
+            partitions = dataset_cache.cached_partitions(file_path, sheet)
+        except OSError:
+            partitions = None
+        if partitions is not None:
+            self.preview_sheet = sheet
+            self.show_preview(partitions)
+            return
+        # a file that is not cached yet is parsed on a worker thread so the window stays responsive
+        self.root.config(cursor="watch")
+        self.preview_queue = queue.Queue()
+        self.preview_thread = threading.Thread(target=self.load_preview, args=(file_path, sheet), daemon=True)
+        self.preview_thread.start()
+        self.root.after(GENERATION_POLL_MS, self.poll_preview, file_path, sheet)
+
+    def load_preview(self, file_path, sheet):
+        try:
+            from scatter_data import load_partitions
+            self.preview_queue.put(('done', load_partitions(file_path, sheet=sheet)))
+        except ValueError as e:
+            self.preview_queue.put(('data_error', str(e)))
+        except Exception as e:
+            self.preview_queue.put(('error', str(e)))
+
+    def poll_preview(self, file_path, sheet):
         try:
-            df = pd.read_excel(self.file_path.get())
-            station_column = 'Station'
-            if station_column not in df.columns:
-                messagebox.showerror("Data Error", f"Missing '{station_column}' column in Excel file")
-                return
+            kind, result = self.preview_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(GENERATION_POLL_MS, self.poll_preview, file_path, sheet)
+            return
+        self.preview_thread = None
+        self.root.config(cursor="")
+        if kind == 'data_error':
+            messagebox.showerror("Data Error", result)
+        elif kind == 'error':
+            messagebox.showerror("Error", f"Error generating preview:\n{result}")
+        elif file_path != self.file_path.get() or sheet != self.current_sheet():
+            # the selection changed while loading
+            self.preview_plot()
+        else:
+            self.preview_sheet = sheet
+            self.show_preview(result)
+
+    def show_preview(self, partitions):
+        from scatter_stats import ensure_stats
+        try:
+            self.refresh_stations(partitions)
 
             tab_index = self.notebook.index(self.notebook.select())
             data_group = self.data_groups[tab_index]
 
-            if data_group not in df.columns:
-                messagebox.showerror("Data Error", f"Missing data column: {data_group}")
-                return
-
-            station_selection = self.station_var.get()
-            station_map = {
-                "Station 1": 1,
-                "Station 2": 2,
-                "Both Stations": 1
-            }
-            station = station_map.get(station_selection, 1)
-            station_df = df[df['Station'] == station]
-            if station_df.empty:
+            stations = self.selected_stations(partitions)
+            station = stations[0] if stations else None
+            if station not in partitions:
                 messagebox.showinfo("Info", f"No data found for Station {station}")
                 return
-            fig = self.create_plot(station_df, station, data_group, preview=True)
-            self.update_preview(fig)
+            stats = ensure_stats(partitions, [data_group])
+            self.update_preview(partitions, station, data_group, stats[(station, data_group)])
 
         except Exception as e:
             messagebox.showerror("Error", f"Error generating preview:\n{str(e)}")
 
+    def toggle_watch(self):
+        if not self.watch_var.get():
+            self.stop_watch()
+            return
+        file_path = self.file_path.get()
+        if not file_path.endswith('.csv') or not os.path.isfile(file_path):
+            messagebox.showerror("Watch Error", "Watch mode requires an existing .csv data file")
+            self.watch_var.set(False)
+            return
+        from scatter_data import CsvTail
+        try:
+            self.watch_tail = CsvTail(file_path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Watch Error", str(e))
+            self.stop_watch()
+            return
+        self.watch_added = 0
+        self.watch_preview_pending = True
+        self.poll_watch()
+
+    def schedule_watch(self):
+        try:
+            interval = max(self.watch_interval.get(), 0.1)
+        except tk.TclError:
+            interval = WATCH_INTERVAL_SECONDS
+        self.watch_job = self.root.after(int(interval * 1000), self.poll_watch)
+
+    def poll_watch(self):
+        self.watch_job = None
+        if self.watch_tail is None:
+            return
+        try:
+            self.watch_added += self.watch_tail.poll(WATCH_POLL_BYTES)
+        except (OSError, ValueError) as e:
+            self.stop_watch()
+            messagebox.showerror("Watch Error", str(e))
+            return
+        if not self.watch_tail.caught_up:
+            # a long log is read a few MiB per tick so the window stays responsive while it catches up
+            self.watch_job = self.root.after(1, self.poll_watch)
+            return
+        added, self.watch_added = self.watch_added, 0
+        if self.watch_preview_pending:
+            self.watch_preview_pending = False
+            self.refresh_stations(self.watch_tail)
+            self.preview_plot()
+        elif added:
+            self.refresh_stations(self.watch_tail)
+            template = self.preview_templates.get(self.preview_group)
+            if template is not None and template.station in self.watch_tail:
+                self.update_preview(self.watch_tail, template.station, self.preview_group,
+                                    self.watch_tail.stats[(template.station, self.preview_group)])
+        self.schedule_watch()
+
+    def stop_watch(self):
+        if self.watch_job is not None:
+            self.root.after_cancel(self.watch_job)
+            self.watch_job = None
+        self.watch_tail = None
+        if hasattr(self, 'watch_var'):
+            self.watch_var.set(False)
+
     def generate_plots(self):
+        if self.generation_thread is not None and self.generation_thread.is_alive():
+            messagebox.showinfo("Info", "Plot generation is already running")
+            return
         errors = self.validate_inputs()
         if errors:
             messagebox.showerror("Input Error", "\n".join(errors))
             return
+
+        job = {
+            'file_path': self.file_path.get(),
+            'sheets': self.selected_sheets(),
+            'save_path': self.save_path.get(),
+            'station_selection': self.station_var.get(),
+            'data_groups': list(self.data_groups),
+            'settings': self.collect_settings(),
+            'title_prefix': self.global_title_prefix.get(),
+            'file_prefix': self.global_file_prefix.get(),
+            'workers': self.worker_count.get(),
+            'force': self.force_var.get(),
+            'export': self.export_var.get(),
+            'summary': self.selected_summaries(),
+            'image_format': self.image_format_var.get(),
+            'dpi': self.dpi_var.get().strip(),
+            'index': self.index_var.get(),
+            'spec_report': self.spec_report_var.get(),
+            'profile': self.profile_var.get() or self.profile_memory_var.get(),
+            'profile_memory': self.profile_memory_var.get(),
+        }
+
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Generation Progress")
+        progress_window.geometry("300x150")
+        progress_window.transient(self.root)
+        progress_window.grab_set()
+        progress_window.protocol("WM_DELETE_WINDOW", self.cancel_generation)
+        status_label = ttk.Label(progress_window, text="Loading data file...")
+        status_label.pack(pady=5)
+        progress = ttk.Progressbar(progress_window, orient=tk.HORIZONTAL,
+                                   length=280, mode='determinate', maximum=100)
+        progress.pack(pady=5)
+        progress_label = ttk.Label(progress_window, text="")
+        progress_label.pack(pady=5)
+        cancel_btn = ttk.Button(progress_window, text="Cancel", command=self.cancel_generation)
+        cancel_btn.pack(pady=5)
+        self.progress_widgets = {
+            'window': progress_window,
+            'status': status_label,
+            'bar': progress,
+            'label': progress_label,
+            'cancel': cancel_btn,
+        }
+
+        self.cancel_event = threading.Event()
+        self.generation_queue = queue.Queue()
+        self.generation_thread = threading.Thread(target=self.run_generation, args=(job,), daemon=True)
+        self.generation_thread.start()
+        self.root.after(GENERATION_POLL_MS, self.poll_generation, job['save_path'], job['export'])
+
+    def selected_summaries(self):
+        summary = self.summary_var.get()
+        if summary == ALL_SUMMARIES:
+            return list(SUMMARY_KINDS)
+        return [summary] if summary in SUMMARY_KINDS else []
+
+    def cancel_generation(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        if self.progress_widgets:
+            self.progress_widgets['status'].config(text="Cancelling, finishing current plots...")
+            self.progress_widgets['cancel'].config(state=tk.DISABLED)
+
+    def run_generation(self, job):
+        post = self.generation_queue.put
+        profiler = StageProfiler(memory=job['profile_memory']) if job['profile'] else None
         try:
-            if self.file_path.get().endswith('.csv'):
-                df = pd.read_csv(self.file_path.get())
-            else:
-                df = pd.read_excel(self.file_path.get())
-            station_column = 'Station'
-            if station_column not in df.columns:
-                messagebox.showerror("Data Error", f"Missing '{station_column}' column in data file")
-                return
-            data_groups = self.data_groups
-            missing_groups = [group for group in data_groups if group not in df.columns]
-            if missing_groups:
-                messagebox.showerror("Data Error", f"Missing data columns: {', '.join(missing_groups)}")
-                return
-            save_path = self.save_path.get()
-            station_selection = self.station_var.get()
-            stations = []
-            if station_selection == "Station 1" or station_selection == "Both Stations":
-                stations.append(1)
-            if station_selection == "Station 2" or station_selection == "Both Stations":
-                stations.append(2)
-            total_plots = len(stations) * len(data_groups)
-            if total_plots == 0:
-                messagebox.showinfo("Info", "No plots to generate")
+            from scatter_data import load_partitions, load_sheets
+            from scatter_engine import generate, sheet_prefixes, write_spec_report, write_spec_rows
+            from scatter_output import OutputOptions, write_index
+            from scatter_stats import find_violations, out_of_spec_summary, spec_report
+            output = OutputOptions(job['image_format'], job['dpi'])
+            plot_errors = []
+            try:
+                if job['sheets'] == [None]:
+                    datasets = {None: load_partitions(job['file_path'],
+                                                      progress=lambda done, total: post(('load', done, total)),
+                                                      profiler=profiler)}
+                else:
+                    datasets, sheet_errors = load_sheets(job['file_path'], job['sheets'], job['workers'], profiler)
+                    plot_errors.extend(sheet_errors.values())
+                    if not datasets:
+                        raise ValueError("\n".join(plot_errors))
+            except ValueError as e:
+                post(('data_error', str(e)))
                 return
-            progress_window = tk.Toplevel(self.root)
-            progress_window.title("Generation Progress")
-            progress_window.geometry("300x120")
-            progress_window.transient(self.root)
-            progress_window.grab_set()
-            ttk.Label(progress_window, text="Generating plots, please wait...").pack(pady=5)
-            progress = ttk.Progressbar(progress_window, orient=tk.HORIZONTAL,
-                                       length=280, mode='determinate', maximum=total_plots)
-            progress.pack(pady=5)
-            progress_label = ttk.Label(progress_window, text=f"0/{total_plots}")
-            progress_label.pack(pady=5)
-
+            post(('stations', next(iter(datasets.values()))))
             generated_files = []
-            count = 0
-            for station in stations:
-                station_df = df[df['Station'] == station]
-                if station_df.empty:
-                    messagebox.showwarning("Warning", f"No data found for Station {station}")
+            skipped = []
+            spec_lines = []
+            index = []
+            for sheet, partitions in datasets.items():
+                if self.cancel_event.is_set():
+                    break
+                if job['station_selection'] == ALL_STATIONS:
+                    stations = list(partitions.stations)
+                else:
+                    stations = [int(job['station_selection'].split()[-1])]
+                if not stations:
                     continue
+                title_prefix, file_prefix = sheet_prefixes(job['title_prefix'], job['file_prefix'], sheet)
+                records = []
+                files, errors = generate(partitions, stations, job['data_groups'], job['settings'], title_prefix,
+                                         file_prefix, job['save_path'],
+                                         progress=lambda count, total: post(('progress', count, total)),
+                                         workers=job['workers'], cancel_event=self.cancel_event,
+                                         force=job['force'], profiler=profiler, export=job['export'],
+                                         summary=job['summary'], output=output, index=records, skipped=skipped)
+                generated_files += files
+                index += [{'data_file': job['file_path'], 'sheet': sheet, **record} for record in records]
+                plot_errors += [f"{sheet}: {error}" for error in errors] if sheet is not None else errors
+                if self.cancel_event.is_set():
+                    break
+                with profile_stage(profiler, 'spec'):
+                    # the row-level index is only built when the report asks for it
+                    if job['spec_report']:
+                        violations = find_violations(partitions, job['settings'], job['data_groups'])
+                        report = spec_report(partitions, job['settings'], job['data_groups'], violations)
+                        try:
+                            write_spec_report(report, job['save_path'], file_prefix)
+                            write_spec_rows(violations, job['save_path'], file_prefix)
+                        except OSError as e:
+                            plot_errors.append(f"Could not write out-of-spec report: {e}")
+                    else:
+                        report = out_of_spec_summary(partitions, job['settings'], job['data_groups'])
+                report = report[report.index.get_level_values('station').isin(stations)]
+                label = f"{sheet} " if sheet is not None else ""
+                for group, rows in report.groupby(level='data_group', sort=False):
+                    count, out_of_spec = rows['count'].sum(), rows['out_of_spec'].sum()
+                    line = f"{label}{group}: {out_of_spec} of {count} points ({100 * out_of_spec / max(count, 1):.1f}%)"
+                    deviation = rows['worst_deviation'].abs() if 'worst_deviation' in rows else None
+                    if deviation is not None and deviation.notna().any():
+                        worst = rows.loc[deviation.idxmax()]
+                        line += (f", worst {worst['worst_deviation']:+.2f} at Station {deviation.idxmax()[0]} "
+                                 f"row {int(worst['worst_row'])}")
+                    spec_lines.append(line)
+            if job['index'] and index:
+                try:
+                    write_index(index, job['save_path'])
+                except OSError as e:
+                    plot_errors.append(f"Could not write plot index: {e}")
+            post(('done', generated_files, skipped, plot_errors, self.cancel_event.is_set(), profiler, spec_lines))
+        except Exception as e:
+            post(('error', str(e)))
+        finally:
+            if profiler is not None:
+                profiler.close()
+
+    def poll_generation(self, save_path, export='png'):
+        widgets = self.progress_widgets
+        finished = None
+        try:
+            while True:
+                message = self.generation_queue.get_nowait()
+                kind = message[0]
+                if kind == 'load':
+                    widgets['bar'].config(maximum=max(message[2], 1), value=message[1])
+                    widgets['label'].config(text=f"{100 * message[1] // max(message[2], 1)}%")
+                elif kind == 'stations':
+                    self.refresh_stations(message[1])
+                elif kind == 'progress':
+                    if not self.cancel_event.is_set():
+                        widgets['status'].config(text="Generating plots, please wait...")
+                    widgets['bar'].config(maximum=message[2], value=message[1])
+                    widgets['label'].config(text=f"{message[1]}/{message[2]}")
+                else:
+                    finished = message
+        except queue.Empty:
+            pass
 
-                for data_group in data_groups:
-                    try:
-                        filename = self.create_plot(station_df, station, data_group, save_path)
-                        generated_files.append(filename)
-                    except Exception as e:
-                        messagebox.showwarning("Plot Error",
-                                               f"Error generating plot for Station {station} - {data_group}:\n{str(e)}")
-
-                    count += 1
-                    progress['value'] = count
-                    progress_label.config(text=f"{count}/{total_plots}")
-                    progress_window.update()
-
-            progress_window.destroy()
+        if finished is None:
+            self.root.after(GENERATION_POLL_MS, self.poll_generation, save_path, export)
+            return
 
-            msg = f"Successfully generated {len(generated_files)} plots:\n" + "\n".join(generated_files[:3])
-            if len(generated_files) > 3:
-                msg += f"\n... and {len(generated_files) - 3} more"
+        widgets['window'].destroy()
+        self.progress_widgets = None
+        kind = finished[0]
+        if kind == 'data_error':
+            messagebox.showerror("Data Error", finished[1])
+            return
+        if kind == 'error':
+            messagebox.showerror("Error", f"Error generating plots:\n{finished[1]}")
+            return
 
-            messagebox.showinfo("Completed", msg)
+        generated_files, skipped, plot_errors, cancelled, profiler, spec_lines = finished[1:]
+        if not generated_files and not plot_errors and not cancelled:
+            messagebox.showinfo("Info", "No plots to generate")
+            return
 
+        kind = "plots" if export == 'png' else "files"
+        # plots left as they were because their PlotKey still matched are counted apart from the new ones
+        unchanged = set(skipped)
+        rendered = [filename for filename in generated_files if filename not in unchanged]
+        if cancelled:
+            msg = f"Generation cancelled after {len(rendered)} {kind}"
+        else:
+            msg = f"Successfully generated {len(rendered)} {kind}"
+        if skipped:
+            msg += f", skipped {len(skipped)} unchanged"
+        if rendered:
+            msg += ":\n" + "\n".join(rendered[:3])
+        if len(rendered) > 3:
+            msg += f"\n... and {len(rendered) - 3} more"
+        if plot_errors:
+            msg += f"\n\n{len(plot_errors)} problems:\n" + "\n".join(plot_errors[:5])
+            if len(plot_errors) > 5:
+                msg += f"\n... and {len(plot_errors) - 5} more"
+        if spec_lines:
+            msg += "\n\nOutside reference lines:\n" + "\n".join(spec_lines)
+        if profiler is not None:
+            msg += "\n\nStage timings:\n" + "\n".join(profiler.summary_lines())
             try:
-                if sys.platform == "win32":
-                    os.startfile(save_path)
-                elif sys.platform == "darwin":
-                    os.system(f'open "{save_path}"')
-                else:
-                    os.system(f'xdg-open "{save_path}"')
-            except:
-                pass
+                profile_path = os.path.join(save_path, f"scatter_profile_{datetime.now():%Y%m%d_%H%M%S}.json")
+                profiler.write_json(profile_path, data_file=self.file_path.get(), plots=len(generated_files))
+                msg += f"\nSaved to {os.path.basename(profile_path)}"
+            except OSError as e:
+                msg += f"\nCould not save profile: {e}"
+        if plot_errors:
+            messagebox.showwarning("Completed with errors", msg)
+        else:
+            messagebox.showinfo("Completed", msg)
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Error generating plots:\n{str(e)}")
+        if cancelled or not generated_files:
+            return
+        try:
+            if sys.platform == "win32":
+                os.startfile(save_path)
+            elif sys.platform == "darwin":
+                os.system(f'open "{save_path}"')
+            else:
+                os.system(f'xdg-open "{save_path}"')
+        except:
+            pass
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     root = tk.Tk()
     app = ScatterPlotGenerator(root)
+    root.after_idle(app.report_startup)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,590 @@
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+from scatter_profile import profile_stage
+
+logger = logging.getLogger(__name__)
+
+STATION_COLUMN = 'Station'
+ROW_COLUMN = 'Row'
+DATA_GROUPS = ["DeltaX", "DeltaY", "DeltaAngle"]
+SIDECAR_EXTENSION = '.stcol'
+SUPPORTED_EXTENSIONS = ('.xlsx', '.csv', SIDECAR_EXTENSION)
+REQUIRED_COLUMNS = [STATION_COLUMN] + DATA_GROUPS
+DELTA_DTYPE = np.float32
+
+SIDECAR_MAGIC = b'STCOL1\n'
+SIDECAR_VERSION = 2
+SIDECAR_READ_VERSIONS = (1, 2)
+SIDECAR_ALIGNMENT = 64
+STATION_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+STREAM_CHUNK_ROWS = 250000
+STREAM_THRESHOLD_BYTES = 256 * 1024 * 1024
+TAIL_INITIAL_CAPACITY = 1024
+TAIL_BLOCK_BYTES = 1 << 20
+WORKBOOK_PART = 'xl/workbook.xml'
+WORKBOOK_NAMESPACE = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def read_data(path, sheet=None):
+    if sheet is not None:
+        return read_columns(path, sheet)
+    if path.endswith(SIDECAR_EXTENSION):
+        return read_sidecar(path)
+    sidecar = sidecar_path(path)
+    if os.path.isfile(sidecar) and sidecar_is_fresh(sidecar, path):
+        return read_sidecar(sidecar)
+    return read_columns(path)
+
+
+def find_data_files(pattern):
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern)
+    paths = sorted(path for path in paths
+                   if os.path.isfile(path) and path.endswith(SUPPORTED_EXTENSIONS)
+                   and not os.path.basename(path).startswith('~$'))
+    sources = set(paths)
+    return [path for path in paths
+            if not (path.endswith(SIDECAR_EXTENSION) and path[:-len(SIDECAR_EXTENSION)] in sources)]
+
+
+def data_file_stem(path):
+    name = os.path.basename(path)
+    if name.endswith(SIDECAR_EXTENSION):
+        name = name[:-len(SIDECAR_EXTENSION)]
+    return os.path.splitext(name)[0]
+
+
+def list_sheets(path):
+    if not path.endswith('.xlsx'):
+        return []
+    try:
+        with zipfile.ZipFile(path) as workbook, workbook.open(WORKBOOK_PART) as f:
+            return [element.get('name') for _, element in ElementTree.iterparse(f)
+                    if element.tag == WORKBOOK_NAMESPACE + 'sheet']
+    except (KeyError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+        raise ValueError(f"Could not read the sheet list of {os.path.basename(path)}: {e}")
+
+
+def read_header(path, sheet=None):
+    if path.endswith('.csv'):
+        return list(pd.read_csv(path, nrows=0).columns)
+    return list(pd.read_excel(path, sheet_name=sheet or 0, nrows=0).columns)
+
+
+def read_columns(path, sheet=None):
+    errors = check_header(read_header(path, sheet))
+    if errors:
+        if sheet is not None:
+            errors = [f"Sheet '{sheet}': {error}" for error in errors]
+        raise ValueError("\n".join(errors))
+    # no fixed dtype: a stray text cell becomes NaN in compact_columns instead of failing the whole file
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, usecols=REQUIRED_COLUMNS)
+    else:
+        df = pd.read_excel(path, sheet_name=sheet or 0, usecols=REQUIRED_COLUMNS)
+    return frame_from_columns(compact_columns(df))
+
+
+def frame_from_columns(columns):
+    # the index holds each row's position in the source file, counted from the first line after the header
+    columns = dict(columns)
+    rows = columns.pop(ROW_COLUMN, None)
+    return pd.DataFrame(columns, index=rows, copy=False)
+
+
+def check_header(columns, data_groups=DATA_GROUPS):
+    errors = []
+    if STATION_COLUMN not in columns:
+        errors.append(f"Missing '{STATION_COLUMN}' column in data file")
+    missing_groups = [group for group in data_groups if group not in columns]
+    if missing_groups:
+        errors.append(f"Missing data columns: {', '.join(missing_groups)}")
+    return errors
+
+
+def check_columns(df, data_groups=DATA_GROUPS):
+    return check_header(df.columns, data_groups)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sidecar_path(source_path, sidecar_dir=None):
+    source_path = os.path.abspath(source_path)
+    directory = sidecar_dir or os.path.dirname(source_path)
+    return os.path.join(directory, os.path.basename(source_path) + SIDECAR_EXTENSION)
+
+
+def station_numbers(column):
+    # rows without a whole station number are dropped later rather than truncated to a wrong station
+    station = pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64)
+    fractional = np.isfinite(station) & (station != np.trunc(station))
+    if fractional.any():
+        logger.warning("Dropped %d rows with a non-integer %s, e.g. %g", np.count_nonzero(fractional),
+                       STATION_COLUMN, station[fractional][0])
+    return np.where(np.isfinite(station) & ~fractional, station, np.nan)
+
+
+def delta_values(column):
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=DELTA_DTYPE)
+
+
+def _align(offset):
+    return -(-offset // SIDECAR_ALIGNMENT) * SIDECAR_ALIGNMENT
+
+
+def compact_columns(df):
+    errors = check_columns(df)
+    if errors:
+        raise ValueError("\n".join(errors))
+    station = station_numbers(df[STATION_COLUMN])
+    keep = ~np.isnan(station)
+    station = station[keep]
+    rows = df.index.to_numpy()[keep]
+    station_dtype = STATION_DTYPES[-1]
+    if len(station):
+        for dtype in STATION_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= station.min() and station.max() <= info.max:
+                station_dtype = dtype
+                break
+    columns = {STATION_COLUMN: station.astype(station_dtype)}
+    for group in DATA_GROUPS:
+        columns[group] = delta_values(df[group])[keep]
+    # source rows are only stored when some were dropped; otherwise they are just 0..n-1
+    if not np.array_equal(rows, np.arange(len(rows))):
+        columns[ROW_COLUMN] = rows.astype(np.int64)
+    return columns
+
+
+def write_sidecar(df, path, source_path=None):
+    columns = compact_columns(df)
+    rows = len(columns[STATION_COLUMN])
+    header = {'version': SIDECAR_VERSION, 'rows': rows, 'columns': [], 'source': None}
+    offset = 0
+    for name, values in columns.items():
+        header['columns'].append({'name': name, 'dtype': values.dtype.str, 'offset': offset})
+        offset = _align(offset + values.nbytes)
+    if source_path:
+        stat = os.stat(source_path)
+        header['source'] = {
+            'name': os.path.basename(source_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(source_path),
+        }
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(len(SIDECAR_MAGIC) + 4 + len(header_bytes))
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SIDECAR_MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for column, values in zip(header['columns'], columns.values()):
+                f.seek(data_start + column['offset'])
+                f.write(values.tobytes())
+            f.truncate(data_start + offset)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return path
+
+
+def read_sidecar_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(SIDECAR_MAGIC)) != SIDECAR_MAGIC:
+            raise ValueError(f"Not a station column file: {path}")
+        (header_length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    if header.get('version') not in SIDECAR_READ_VERSIONS:
+        raise ValueError(f"Unsupported station column file version: {header.get('version')}")
+    header['data_start'] = _align(len(SIDECAR_MAGIC) + 4 + header_length)
+    return header
+
+
+def read_sidecar(path, mmap=True):
+    header = read_sidecar_header(path)
+    rows = header['rows']
+    columns = {}
+    for column in header['columns']:
+        dtype = np.dtype(column['dtype'])
+        offset = header['data_start'] + column['offset']
+        if rows == 0:
+            columns[column['name']] = np.empty(0, dtype=dtype)
+        elif mmap:
+            columns[column['name']] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(rows,))
+        else:
+            columns[column['name']] = np.fromfile(path, dtype=dtype, count=rows, offset=offset)
+    return frame_from_columns(columns)
+
+
+def sidecar_is_fresh(sidecar, source_path):
+    try:
+        header = read_sidecar_header(sidecar)
+    except (OSError, ValueError):
+        return False
+    # older sidecars did not record dropped source rows, so they are rebuilt
+    source = header.get('source') if header.get('version') == SIDECAR_VERSION else None
+    if not source:
+        return False
+    stat = os.stat(source_path)
+    if stat.st_size != source['size']:
+        return False
+    if stat.st_mtime_ns == source['mtime_ns']:
+        return True
+    return file_sha256(source_path) == source['sha256']
+
+
+def convert_to_sidecar(source_path, sidecar_dir=None):
+    df = read_columns(source_path)
+    return write_sidecar(df, sidecar_path(source_path, sidecar_dir), source_path)
+
+
+class StationPartitions:
+    def __init__(self, order, stations, starts, counts, columns, stats=None):
+        self.order = order
+        self.stations = [int(value) for value in stations]
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self._slices = {int(value): slice(int(start), int(start + count))
+                        for value, start, count in zip(stations, starts, counts)}
+        self.columns = columns
+        self.stats = stats or {}
+
+    @classmethod
+    def from_frame(cls, df, data_groups=DATA_GROUPS):
+        station = df[STATION_COLUMN].to_numpy()
+        order = np.argsort(station, kind='stable')
+        stations, starts, counts = np.unique(station[order], return_index=True, return_counts=True)
+        columns = {group: df[group].to_numpy()[order] for group in data_groups}
+        return cls(df.index.to_numpy()[order], stations, starts, counts, columns)
+
+    def __contains__(self, station):
+        return station in self._slices
+
+    def __len__(self):
+        return len(self.order)
+
+    def count(self, station):
+        station_slice = self._slices[station]
+        return station_slice.stop - station_slice.start
+
+    def values(self, station, data_group):
+        return self.columns[data_group][self._slices[station]]
+
+    def bounds(self, station):
+        station_slice = self._slices[station]
+        return station_slice.start, station_slice.stop
+
+    def rows(self, station):
+        return self.order[self._slices[station]]
+
+
+def read_csv_partitions(path, chunk_rows=STREAM_CHUNK_ROWS, progress=None):
+    errors = check_header(read_header(path))
+    if errors:
+        raise ValueError("\n".join(errors))
+    blocks = {}
+    totals = {}
+    total_bytes = os.path.getsize(path)
+    row_offset = 0
+    with open(path, 'rb') as f:
+        for chunk in pd.read_csv(f, usecols=REQUIRED_COLUMNS, chunksize=chunk_rows):
+            station = station_numbers(chunk[STATION_COLUMN])
+            rows = np.arange(row_offset, row_offset + len(chunk))
+            row_offset += len(chunk)
+            keep = np.flatnonzero(~np.isnan(station))
+            order = keep[np.argsort(station[keep], kind='stable')]
+            stations, starts = np.unique(station[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            chunk_columns = {group: delta_values(chunk[group])[order] for group in DATA_GROUPS}
+
+            for value, start, end in zip(stations.astype(np.int64), starts, ends):
+                block = blocks.setdefault(int(value), {'rows': [], **{group: [] for group in DATA_GROUPS}})
+                block['rows'].append(rows[order[start:end]])
+                for group in DATA_GROUPS:
+                    block[group].append(chunk_columns[group][start:end])
+
+            accumulate_stats(totals, stations, starts, chunk_columns)
+
+            if progress:
+                progress(min(f.tell(), total_bytes), total_bytes)
+
+    stations = sorted(blocks)
+    counts = [sum(len(rows) for rows in blocks[station]['rows']) for station in stations]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if stations else []
+    order = np.concatenate([np.concatenate(blocks[station]['rows']) for station in stations]) \
+        if stations else np.empty(0, dtype=np.int64)
+    columns = {group: np.concatenate([np.concatenate(blocks[station][group]) for station in stations])
+               if stations else np.empty(0, dtype=DELTA_DTYPE) for group in DATA_GROUPS}
+    stats = {key: running_stats(running) for key, running in totals.items()}
+    return StationPartitions(order, stations, starts, counts, columns, stats)
+
+
+def accumulate_stats(totals, stations, starts, columns, data_groups=DATA_GROUPS):
+    if not len(starts):
+        return
+    for group in data_groups:
+        values = columns[group].astype(np.float64)
+        valid = ~np.isnan(values)
+        minimums = np.fmin.reduceat(values, starts)
+        maximums = np.fmax.reduceat(values, starts)
+        sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        counts = np.add.reduceat(valid, starts)
+        for value, minimum, maximum, total, count in zip(np.asarray(stations, dtype=np.int64), minimums,
+                                                         maximums, sums, counts):
+            running = totals.setdefault((int(value), group), [0, np.nan, np.nan, 0.0])
+            running[0] += int(count)
+            running[1] = np.fmin(running[1], minimum)
+            running[2] = np.fmax(running[2], maximum)
+            running[3] += total
+
+
+def running_stats(running):
+    count, minimum, maximum, total = running
+    return {'min': float(minimum), 'max': float(maximum),
+            'mean': total / count if count else float('nan'), 'count': count}
+
+
+class CsvTail:
+    def __init__(self, path, data_groups=DATA_GROUPS):
+        self.path = path
+        self.data_groups = data_groups
+        self.reset()
+
+    def reset(self):
+        self.header = read_header(self.path)
+        errors = check_header(self.header, self.data_groups)
+        if errors:
+            raise ValueError("\n".join(errors))
+        with open(self.path, 'rb') as f:
+            f.readline()
+            self.offset = f.tell()
+        self.stations = []
+        self.stats = {}
+        self.caught_up = True
+        self._rows = 0
+        self._counts = {}
+        self._buffers = {}
+        self._totals = {}
+
+    def __contains__(self, station):
+        return station in self._counts
+
+    def __len__(self):
+        return self._rows
+
+    def count(self, station):
+        return self._counts[station]
+
+    def values(self, station, data_group):
+        return self._buffers[station][data_group][:self._counts[station]]
+
+    def poll(self, max_bytes=None):
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            self.reset()
+        # a large backlog is read in bounded blocks, and at most max_bytes of it per call
+        stop = size if max_bytes is None else min(size, self.offset + max_bytes)
+        start = position = self.offset
+        added = 0
+        partial = b''
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            # a line longer than max_bytes is still read whole so the tail always moves on
+            while position < stop or (position < size and self.offset == start):
+                block = f.read(min(TAIL_BLOCK_BYTES, stop - position) if position < stop else TAIL_BLOCK_BYTES)
+                if not block:
+                    break
+                position += len(block)
+                data = partial + block
+                end = data.rfind(b'\n') + 1
+                partial = data[end:]
+                if end:
+                    self.offset += end
+                    added += self._parse(data[:end])
+        self.caught_up = position >= size
+        return added
+
+    def _parse(self, data):
+        chunk = pd.read_csv(io.BytesIO(data), header=None, names=self.header,
+                            usecols=[STATION_COLUMN] + self.data_groups)
+        return self._append(chunk)
+
+    def _append(self, chunk):
+        station = station_numbers(chunk[STATION_COLUMN])
+        keep = np.flatnonzero(~np.isnan(station))
+        order = keep[np.argsort(station[keep], kind='stable')]
+        stations, starts = np.unique(station[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        chunk_columns = {group: delta_values(chunk[group])[order] for group in self.data_groups}
+
+        for value, start, end in zip(stations.astype(np.int64), starts, ends):
+            value = int(value)
+            count = self._counts.get(value, 0)
+            needed = count + end - start
+            buffers = self._buffers.get(value)
+            if buffers is None or needed > len(buffers[self.data_groups[0]]):
+                capacity = max(TAIL_INITIAL_CAPACITY, 2 * needed)
+                grown = {group: np.empty(capacity, dtype=DELTA_DTYPE) for group in self.data_groups}
+                if buffers is not None:
+                    for group in self.data_groups:
+                        grown[group][:count] = buffers[group][:count]
+                buffers = self._buffers[value] = grown
+            for group in self.data_groups:
+                buffers[group][count:needed] = chunk_columns[group][start:end]
+            self._counts[value] = needed
+
+        accumulate_stats(self._totals, stations, starts, chunk_columns, self.data_groups)
+        for value in stations.astype(np.int64):
+            for group in self.data_groups:
+                self.stats[(int(value), group)] = running_stats(self._totals[(int(value), group)])
+        self.stations = sorted(self._counts)
+        self._rows += len(order)
+        return len(order)
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def should_stream(path):
+    if not path.endswith('.csv') or os.path.getsize(path) < STREAM_THRESHOLD_BYTES:
+        return False
+    sidecar = sidecar_path(path)
+    return not (os.path.isfile(sidecar) and sidecar_is_fresh(sidecar, path))
+
+
+class DatasetCache:
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['stamp'] == stamp:
+                self._entries.move_to_end(key)
+                return entry
+        return None
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _entry(self, path, stream=None, progress=None, profiler=None, sheet=None):
+        path = os.path.abspath(path)
+        stamp = file_stamp(path)
+        entry = self._lookup((path, sheet), stamp)
+        if entry is not None:
+            return entry
+
+        if stream is None:
+            stream = sheet is None and should_stream(path)
+        with profile_stage(profiler, 'load'):
+            if stream and path.endswith('.csv'):
+                entry = {'stamp': stamp, 'partitions': read_csv_partitions(path, progress=progress)}
+            else:
+                entry = {'stamp': stamp, 'df': read_data(path, sheet), 'partitions': None}
+        return self._store((path, sheet), entry)
+
+    def cached(self, path, sheet=None):
+        path = os.path.abspath(path)
+        return self._lookup((path, sheet), file_stamp(path)) is not None
+
+    def cached_partitions(self, path, sheet=None, stamp=None):
+        # never parses: None unless partitions for the current file are already built
+        path = os.path.abspath(path)
+        entry = self._lookup((path, sheet), stamp or file_stamp(path))
+        return entry['partitions'] if entry is not None else None
+
+    def add_frame(self, path, sheet, df, stamp=None):
+        path = os.path.abspath(path)
+        self._store((path, sheet), {'stamp': stamp or file_stamp(path), 'df': df, 'partitions': None})
+
+    def get_partitions(self, path, stream=None, progress=None, profiler=None, sheet=None):
+        entry = self._entry(path, stream, progress, profiler, sheet)
+        # the frame is read before the check: another thread drops it only after publishing the partitions
+        df = entry.get('df')
+        if entry['partitions'] is None:
+            with profile_stage(profiler, 'partition'):
+                entry['partitions'] = StationPartitions.from_frame(df)
+            # the partitions hold their own copy of the columns, so the frame (or .stcol mapping) is released
+            entry.pop('df', None)
+        return entry['partitions']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+dataset_cache = DatasetCache()
+
+
+def load_partitions(path, stream=None, progress=None, profiler=None, sheet=None):
+    return dataset_cache.get_partitions(path, stream, progress, profiler, sheet)
+
+
+def sheet_error(sheet, error):
+    # header problems already name the sheet; anything else gets the sheet and exception type added
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"Sheet '{sheet}': {type(error).__name__}: {error}"
+
+
+def load_sheets(path, sheets, workers=1, profiler=None):
+    missing = [sheet for sheet in sheets if not dataset_cache.cached(path, sheet)]
+    partitions = {sheet: load_partitions(path, profiler=profiler, sheet=sheet)
+                  for sheet in sheets if sheet not in missing}
+    errors = {}
+    if len(missing) > 1 and workers > 1:
+        stamp = file_stamp(path)
+        with profile_stage(profiler, 'load'):
+            with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+                futures = {sheet: pool.submit(read_columns, path, sheet) for sheet in missing}
+                for sheet, future in futures.items():
+                    try:
+                        dataset_cache.add_frame(path, sheet, future.result(), stamp)
+                        partitions[sheet] = load_partitions(path, profiler=profiler, sheet=sheet)
+                    except Exception as e:
+                        errors[sheet] = sheet_error(sheet, e)
+    else:
+        for sheet in missing:
+            try:
+                partitions[sheet] = load_partitions(path, profiler=profiler, sheet=sheet)
+            except Exception as e:
+                errors[sheet] = sheet_error(sheet, e)
+    return {sheet: partitions[sheet] for sheet in sheets if sheet in partitions}, errors
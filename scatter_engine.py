@@ -0,0 +1,1024 @@
+import argparse
+import hashlib
+import logging
+import os
+import struct
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from scatter_data import (DATA_GROUPS, convert_to_sidecar, data_file_stem, dataset_cache, file_stamp, find_data_files,
+                          list_sheets, load_partitions, read_columns)
+from scatter_output import (DPI_PRESETS, IMAGE_FORMATS, IMAGE_QUALITY, INDEX_FORMATS, PNG_COMPRESS_LEVEL, OutputOptions,
+                            atomic_file, atomic_write, plot_record, write_index, write_json)
+from scatter_profile import StageProfiler, profile_stage
+from scatter_settings import DataGroupSettings, EXPORT_FORMATS, RENDER_MODES, SUMMARY_KINDS, load_config
+from scatter_stats import TREND_WINDOW, aggregate_table, ensure_stats, find_violations, outside_band, spec_report
+from scatter_summary import render_summary
+
+logger = logging.getLogger(__name__)
+
+PLOT_DPI = 150
+FULL_FIGSIZE = (8, 6)
+PREVIEW_FIGSIZE = (6, 4)
+LARGE_N_THRESHOLD = 200000
+DECIMATE_BUCKETS = 4000
+DECIMATE_SAMPLE = 20000
+BATCH_LOAD_AHEAD = 2
+BATCH_RENDER_BACKLOG = 64
+BATCH_MANIFEST = 'batch_manifest.json'
+SPEC_SUMMARY_SUFFIX = '_out_of_spec.csv'
+SPEC_ROWS_SUFFIX = '_out_of_spec_rows.csv'
+PROFILE_FILENAME = 'scatter_profile.json'
+PLOT_KEY_FIELD = 'PlotKey'
+PLOT_KEY_VERSION = 2
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+SHEET_COLUMNS = 6
+SHEET_CELL_SIZE = (4.8, 3.6)
+SHEET_DPI = 100
+VIOLATION_COLOR = 'black'
+VIOLATION_MARKER = 'x'
+DEFAULT_OUTPUT = OutputOptions(dpi=PLOT_DPI)
+
+
+def plot_filename(file_prefix, station, data_group, extension='png'):
+    safe_group_name = data_group.replace("/", "_").replace(" ", "_")
+    return f"{file_prefix}_Station_{station}_{safe_group_name}_Plot.{extension}"
+
+
+def pdf_filename(file_prefix):
+    return f"{file_prefix}_Plots.pdf"
+
+
+def sheet_filename(file_prefix, index, extension='png'):
+    return f"{file_prefix}_Sheet_{index:03d}.{extension}"
+
+
+class FigureTemplate:
+    def __init__(self, data_group, settings, preview=False, ax=None):
+        self.data_group = data_group
+        if ax is None:
+            self.fig = Figure(figsize=PREVIEW_FIGSIZE if preview else FULL_FIGSIZE)
+            FigureCanvasAgg(self.fig)
+            self.ax = self.fig.subplots()
+        else:
+            self.fig, self.ax = ax.figure, ax
+        self.own_layout = ax is None
+
+        self.scatter = self.ax.scatter(x=[], y=[], alpha=0.7)
+        self.violators = self.ax.scatter(x=[], y=[], marker=VIOLATION_MARKER, color=VIOLATION_COLOR, linewidths=1.0)
+        self.title = self.ax.set_title('', fontsize=14)
+        self.ax.set_xlabel('', fontsize=12)
+        self.ax.set_ylabel(data_group, fontsize=12)
+        self.ax.set_xticks([])
+        legend = self.ax.legend([''], loc='upper right', frameon=True,
+                                handlelength=0, handletextpad=0,
+                                fontsize=11, markerscale=0, fancybox=True)
+        self.stats_text = legend.get_texts()[0]
+
+        self.values = None
+        self.count = 0
+        self.station = None
+        self.value_range = None
+        self.summary_values = None
+        self.violation_count = None
+        self.render_mode = None
+        self.highlight = False
+        self.ref_values = None
+        self.ref_lines = []
+        self.ref_artists = []
+        self.ref_texts = []
+        self.layout_ylim = None
+        self.apply_settings(settings)
+
+    def apply_settings(self, settings):
+        group = settings[self.data_group]
+        self.signature = settings_signature(settings, self.data_group)
+        self.scatter.set_sizes([group.point_size])
+        self.scatter.set_color(group.point_color)
+        self.violators.set_sizes([group.point_size * 1.5])
+
+        for artist in self.ref_artists:
+            artist.remove()
+        self.ref_values = group.ref_lines.values.copy()
+        self.ref_lines = group.ref_lines.as_dicts()
+        self.ref_artists = []
+        self.ref_texts = []
+        for ref in self.ref_lines:
+            line = self.ax.axhline(y=ref['value'],
+                                   linestyle=ref['style'],
+                                   color=ref['color'],
+                                   linewidth=1.5 if ref['style'] == '--' else 1.2,
+                                   alpha=0.7)
+            text = self.ax.text(self.count * 1.02, ref['value'] + 0.02, ref['label'],
+                                fontsize=10, color=ref['color'],
+                                ha='left', va='bottom')
+            self.ref_artists.extend((line, text))
+            self.ref_texts.append(text)
+
+        self.fixed_ylim = group.ylim
+
+        highlight = settings.highlight_violations and len(self.ref_values) > 0
+        # the violator split depends on the reference band, which may just have changed
+        if settings.render_mode != self.render_mode or highlight or highlight != self.highlight:
+            self.render_mode = settings.render_mode
+            self.highlight = highlight
+            if self.values is not None:
+                self._update_offsets()
+                self._update_stats_text()
+        self._update_ylim()
+
+    def render(self, values, station, title_prefix, stats=None):
+        self.values = np.asarray(values, dtype=float)
+        self.count = len(self.values)
+        self._update_offsets()
+
+        self.set_title(station, title_prefix)
+        if stats:
+            min_value, max_value, mean_value = stats['min'], stats['max'], stats['mean']
+        else:
+            min_value = np.nanmin(self.values)
+            max_value = np.nanmax(self.values)
+            mean_value = np.nanmean(self.values)
+        self.summary_values = (min_value, max_value, mean_value)
+        self._update_stats_text()
+        self.value_range = (min_value, max_value)
+        for text in self.ref_texts:
+            text.set_x(self.count * 1.02)
+
+        self._update_ylim()
+        return self.fig
+
+    def set_title(self, station, title_prefix):
+        self.station = station
+        self.title.set_text(f"{title_prefix}-Station {station}-{self.data_group} Distribution")
+
+    def _update_stats_text(self):
+        if self.summary_values is None:
+            return
+        min_value, max_value, mean_value = self.summary_values
+        text = f"Min: {min_value:.2f}\nMax: {max_value:.2f}\nMean: {mean_value:.2f}"
+        if self.violation_count is not None:
+            text += f"\nOut of spec: {self.violation_count}"
+        self.stats_text.set_text(text)
+
+    def _update_offsets(self):
+        mode = self.render_mode
+        if mode == 'auto':
+            mode = 'decimate' if self.count > LARGE_N_THRESHOLD else 'full'
+        if mode == 'decimate':
+            x_values, y_values = minmax_decimate(self.values)
+        else:
+            x_values, y_values = np.arange(1, self.count + 1, dtype=float), self.values
+        offsets = np.column_stack((x_values, y_values))
+        if self.highlight:
+            band = (self.ref_values.min(), self.ref_values.max())
+            self.violation_count = int(np.count_nonzero(np.logical_or(*outside_band(self.values, band))))
+            outside = np.logical_or(*outside_band(y_values, band))
+            self.scatter.set_offsets(offsets[~outside])
+            self.violators.set_offsets(offsets[outside])
+        else:
+            self.violation_count = None
+            self.scatter.set_offsets(offsets)
+            self.violators.set_offsets(np.empty((0, 2)))
+        self.scatter.set_rasterized(mode == 'decimate')
+        self.violators.set_rasterized(mode == 'decimate')
+        self.ax.ignore_existing_data_limits = True
+        self.ax.update_datalim(offsets)
+        self.ax.autoscale_view(scaley=False)
+
+    def _update_ylim(self):
+        if self.fixed_ylim is not None:
+            self.ax.set_ylim(*self.fixed_ylim)
+        elif self.value_range is not None:
+            min_value, max_value = self.value_range
+            if len(self.ref_values):
+                y_min = min(min_value - 0.5, self.ref_values.min() - 1)
+                y_max = max(max_value + 0.5, self.ref_values.max() + 1)
+            else:
+                y_min = min_value - 0.5
+                y_max = max_value + 0.5
+            self.ax.set_ylim(y_min, y_max)
+        else:
+            return
+        ylim = self.ax.get_ylim()
+        if self.own_layout and self.values is not None and ylim != self.layout_ylim:
+            self.fig.tight_layout()
+            self.layout_ylim = ylim
+
+
+def minmax_decimate(values, buckets=DECIMATE_BUCKETS, sample=DECIMATE_SAMPLE):
+    count = len(values)
+    if count <= 2 * buckets + sample:
+        return np.arange(1, count + 1, dtype=float), values
+    size = -(-count // buckets)
+    padded = size * -(-count // size)
+    missing = np.isnan(values)
+    low = np.full(padded, np.inf)
+    low[:count] = np.where(missing, np.inf, values)
+    high = np.full(padded, -np.inf)
+    high[:count] = np.where(missing, -np.inf, values)
+    starts = np.arange(0, padded, size)
+    keep = np.unique(np.concatenate((low.reshape(-1, size).argmin(axis=1) + starts,
+                                     high.reshape(-1, size).argmax(axis=1) + starts,
+                                     np.arange(0, count, -(-count // sample)))))
+    keep = keep[keep < count]
+    return (keep + 1).astype(float), values[keep]
+
+
+def settings_signature(settings, data_group):
+    group = settings[data_group]
+    return (
+        settings.render_mode,
+        settings.highlight_violations,
+        group.y_min,
+        group.y_max,
+        group.ref_lines.signature(),
+        group.point_size,
+        group.point_color,
+    )
+
+
+_template_cache = threading.local()
+
+
+def get_template(data_group, settings, preview=False):
+    templates = getattr(_template_cache, 'templates', None)
+    if templates is None:
+        templates = _template_cache.templates = {}
+    template = templates.get((data_group, preview))
+    if template is None or template.signature != settings_signature(settings, data_group):
+        template = templates[(data_group, preview)] = FigureTemplate(data_group, settings, preview)
+    return template
+
+
+def plot_key(values, station, data_group, settings, title_prefix, file_prefix, output=DEFAULT_OUTPUT):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    digest.update(repr((PLOT_KEY_VERSION, station, data_group, settings_signature(settings, data_group),
+                        title_prefix, file_prefix, output.signature())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_plot_key(path):
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                return None
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    return None
+                length, kind = struct.unpack('>I4s', chunk_header)
+                if kind in (b'IDAT', b'IEND'):
+                    return None
+                data = f.read(length)
+                f.seek(4, os.SEEK_CUR)
+                if kind == b'tEXt':
+                    name, _, text = data.partition(b'\0')
+                    if name == PLOT_KEY_FIELD.encode('latin-1'):
+                        return text.decode('latin-1')
+    except OSError:
+        return None
+
+
+def render_plot(values, station, data_group, settings, title_prefix, file_prefix, output_path, output=DEFAULT_OUTPUT,
+                stats=None, force=False, profiler=None):
+    return render_plot_cached(values, station, data_group, settings, title_prefix, file_prefix, output_path, output,
+                              stats, force, profiler)[0]
+
+
+def render_plot_cached(values, station, data_group, settings, title_prefix, file_prefix, output_path,
+                       output=DEFAULT_OUTPUT, stats=None, force=False, profiler=None):
+    filename = plot_filename(file_prefix, station, data_group, output.extension)
+    filepath = os.path.join(output_path, filename)
+    with profile_stage(profiler, 'cache'):
+        key = plot_key(values, station, data_group, settings, title_prefix, file_prefix, output)
+        # only PNG output carries the key, so JPEG and WebP plots are always re-rendered
+        unchanged = not force and read_plot_key(filepath) == key
+    if unchanged:
+        return filename, True
+    with profile_stage(profiler, 'render'):
+        fig = get_template(data_group, settings).render(values, station, title_prefix, stats)
+    with profile_stage(profiler, 'save'):
+        output.save(fig, filepath, {PLOT_KEY_FIELD: key})
+    return filename, False
+
+
+def render_image(values, station, data_group, settings, title_prefix, output=DEFAULT_OUTPUT, stats=None):
+    fig = get_template(data_group, settings).render(values, station, title_prefix, stats)
+    return output.encode(fig)
+
+
+class ContactSheet:
+    def __init__(self, data_groups, settings, columns=SHEET_COLUMNS):
+        width, height = SHEET_CELL_SIZE
+        self.fig = Figure(figsize=(width * columns, height * len(data_groups)))
+        FigureCanvasAgg(self.fig)
+        axes = self.fig.subplots(len(data_groups), columns, squeeze=False)
+        self.cells = [[FigureTemplate(group, settings, ax=ax) for ax in row] for group, row in zip(data_groups, axes)]
+        self.laid_out = False
+
+    def render(self, stations, columns, title_prefix, stats):
+        for row in self.cells:
+            for index, cell in enumerate(row):
+                cell.ax.set_visible(index < len(stations))
+                if index < len(stations):
+                    key = (stations[index], cell.data_group)
+                    cell.render(columns[key], stations[index], title_prefix, stats.get(key))
+        if not self.laid_out:
+            self.fig.tight_layout()
+            self.laid_out = True
+        return self.fig
+
+
+def _export_pdf(columns, stats, settings, title_prefix, file_prefix, output_path, profiler=None):
+    # pages have no file until the PDF is closed and in place, which a final record without a station reports
+    filename = pdf_filename(file_prefix)
+    try:
+        with atomic_file(os.path.join(output_path, filename)) as temp_path, PdfPages(temp_path) as pdf:
+            for (station, data_group), values in columns.items():
+                try:
+                    with profile_stage(profiler, 'render'):
+                        fig = get_template(data_group, settings).render(values, station, title_prefix,
+                                                                        stats.get((station, data_group)))
+                    with profile_stage(profiler, 'save'):
+                        pdf.savefig(fig)
+                    yield station, data_group, None, None, None, False
+                except Exception as e:
+                    error = f"Error generating plot for Station {station} - {data_group}: {e}"
+                    yield station, data_group, None, error, None, False
+    except Exception as e:
+        yield None, None, None, f"Error writing {filename}: {e}", None, False
+    else:
+        yield None, None, filename, None, None, False
+
+
+def _settle_pages(results):
+    settled = []
+    pending = []
+    for station, data_group, filename, error, stages, skipped in results:
+        if station is None and data_group is None:
+            if error:
+                settled.append((None, None, None, error, None, False))
+            else:
+                settled.extend((page_station, page_group, filename, None, None, False)
+                               for page_station, page_group in pending)
+            pending = []
+        elif filename is None and error is None:
+            pending.append((station, data_group))
+        else:
+            settled.append((station, data_group, filename, error, stages, skipped))
+    return settled
+
+
+def _export_sheets(columns, stats, settings, title_prefix, file_prefix, output_path, sheet_columns=SHEET_COLUMNS,
+                   profiler=None, output=DEFAULT_OUTPUT):
+    stations = list(dict.fromkeys(station for station, _ in columns))
+    data_groups = list(dict.fromkeys(data_group for _, data_group in columns))
+    sheet = ContactSheet(data_groups, settings, sheet_columns)
+    for index, start in enumerate(range(0, len(stations), sheet_columns), 1):
+        chunk = stations[start:start + sheet_columns]
+        filename = sheet_filename(file_prefix, index, output.extension)
+        error = None
+        try:
+            with profile_stage(profiler, 'render'):
+                fig = sheet.render(chunk, columns, title_prefix, stats)
+            with profile_stage(profiler, 'save'):
+                output.save(fig, os.path.join(output_path, filename), dpi=output.scaled_dpi(SHEET_DPI),
+                            bbox_inches=None)
+        except Exception as e:
+            filename = None
+            error = f"Error generating contact sheet {index}: {e}"
+        for station in chunk:
+            for data_group in data_groups:
+                yield station, data_group, filename, error, None, False
+                error = None
+
+
+def export_plots(columns, stats, settings, title_prefix, file_prefix, output_path, export,
+                 sheet_columns=SHEET_COLUMNS, profiler=None, output=DEFAULT_OUTPUT):
+    if export == 'pdf':
+        return _export_pdf(columns, stats, settings, title_prefix, file_prefix, output_path, profiler)
+    return _export_sheets(columns, stats, settings, title_prefix, file_prefix, output_path, sheet_columns, profiler,
+                          output)
+
+
+def _export_job(columns, stats, settings, title_prefix, file_prefix, output_path, export, sheet_columns=SHEET_COLUMNS,
+                profile=None, output=DEFAULT_OUTPUT):
+    profiler = StageProfiler(memory=profile) if profile is not None else None
+    try:
+        results = _settle_pages(export_plots(columns, stats, settings, title_prefix, file_prefix, output_path,
+                                             export, sheet_columns, profiler, output))
+        return results, profiler and profiler.stages
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+
+def export_summaries(table, kinds, settings, data_groups, title_prefix, file_prefix, output_path,
+                     window=TREND_WINDOW, profiler=None, output=DEFAULT_OUTPUT):
+    for kind in kinds:
+        try:
+            with profile_stage(profiler, 'render'):
+                filename = render_summary(table, kind, settings, data_groups, title_prefix, file_prefix, output_path,
+                                          output, window)
+            yield None, kind, filename, None, None, False
+        except Exception as e:
+            yield None, kind, None, f"Error generating {kind} summary: {e}", None, False
+
+
+def _summary_job(table, kinds, settings, data_groups, title_prefix, file_prefix, output_path, window=TREND_WINDOW,
+                 profile=None, output=DEFAULT_OUTPUT):
+    profiler = StageProfiler(memory=profile) if profile is not None else None
+    try:
+        results = list(export_summaries(table, kinds, settings, data_groups, title_prefix, file_prefix, output_path,
+                                        window, profiler, output))
+        return results, profiler and profiler.stages
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+
+def summary_table(partitions, stations, data_groups, window=TREND_WINDOW, profiler=None):
+    with profile_stage(profiler, 'summary'):
+        table = aggregate_table(partitions, data_groups, window=window)
+        return table[table.index.get_level_values('station').isin(stations)]
+
+
+class SharedColumns:
+    def __init__(self, columns, dtype):
+        self.layout = {}
+        self.dtype = np.dtype(dtype)
+        total = 0
+        for key, values in columns.items():
+            self.layout[key] = (total, len(values))
+            total += len(values)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * self.dtype.itemsize)
+        buffer = np.ndarray((total,), dtype=self.dtype, buffer=self.shm.buf)
+        for key, values in columns.items():
+            start, length = self.layout[key]
+            buffer[start:start + length] = values
+        del buffer
+
+    def spec(self):
+        return self.shm.name, self.layout, self.dtype.str
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach_columns(spec):
+    name, layout, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    total = sum(length for _, length in layout.values())
+    buffer = np.ndarray((total,), dtype=dtype, buffer=shm.buf)
+    return shm, {key: buffer[start:start + length] for key, (start, length) in layout.items()}
+
+
+_worker_state = {}
+
+
+def _init_worker(columns_spec, stats, settings, title_prefix, file_prefix, output_path, output=DEFAULT_OUTPUT,
+                 force=False, profile=None):
+    shm, columns = attach_columns(columns_spec)
+    _worker_state.update(shm=shm, columns=columns, stats=stats, settings=settings, title_prefix=title_prefix,
+                         file_prefix=file_prefix, output_path=output_path, output=output, force=force,
+                         profile=profile)
+
+
+def _render_shared(station, data_group):
+    state = _worker_state
+    key = (station, data_group)
+    return _render_job(state['columns'][key], station, data_group, state['settings'], state['title_prefix'],
+                       state['file_prefix'], state['output_path'], state['stats'].get(key), state['force'],
+                       state['profile'], state['output'])
+
+
+def _render_job(values, station, data_group, settings, title_prefix, file_prefix, output_path, stats=None,
+                force=False, profile=None, output=DEFAULT_OUTPUT):
+    profiler = StageProfiler(memory=profile) if profile is not None else None
+    try:
+        filename, skipped = render_plot_cached(values, station, data_group, settings, title_prefix, file_prefix,
+                                               output_path, output, stats=stats, force=force, profiler=profiler)
+        return station, data_group, filename, None, profiler and profiler.stages, skipped
+    except Exception as e:
+        return (station, data_group, None, f"Error generating plot for Station {station} - {data_group}: {e}",
+                profiler and profiler.stages, False)
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+
+def _render_parallel(columns, stats, settings, title_prefix, file_prefix, output_path, workers, force=False,
+                     profile=None, output=DEFAULT_OUTPUT):
+    # float32 data columns stay float32 in the block
+    shared = SharedColumns(columns, np.result_type(*columns.values()))
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(shared.spec(), stats, settings, title_prefix, file_prefix,
+                                                 output_path, output, force, profile))
+        try:
+            futures = [executor.submit(_render_shared, station, data_group) for station, data_group in columns]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        shared.close()
+
+
+def generate(partitions, stations, data_groups, settings, title_prefix, file_prefix, output_path, progress=None,
+             workers=1, cancel_event=None, force=False, profiler=None, export='png', sheet_columns=SHEET_COLUMNS,
+             summary=(), trend_window=TREND_WINDOW, output=DEFAULT_OUTPUT, index=None, skipped=None):
+    errors = []
+    columns = {}
+    profile = profiler.memory if profiler is not None else None
+    with profile_stage(profiler, 'stats'):
+        ensure_stats(partitions, data_groups)
+    for station in stations:
+        if station not in partitions:
+            errors.append(f"No data found for Station {station}")
+            continue
+        for data_group in data_groups:
+            columns[(station, data_group)] = partitions.values(station, data_group)
+
+    total_plots = len(stations) * len(data_groups)
+    count = total_plots - len(columns)
+    if progress and count:
+        progress(count, total_plots)
+
+    if export != 'png':
+        stats = {key: partitions.stats[key] for key in columns if key in partitions.stats}
+        results = export_plots(columns, stats, settings, title_prefix, file_prefix, output_path, export,
+                               sheet_columns, profiler, output)
+    elif workers > 1 and len(columns) > 1:
+        stats = {key: partitions.stats[key] for key in columns if key in partitions.stats}
+        results = _render_parallel(columns, stats, settings, title_prefix, file_prefix, output_path,
+                                   min(workers, len(columns)), force, profile, output)
+    else:
+        results = (_render_job(values, station, data_group, settings, title_prefix, file_prefix, output_path,
+                               partitions.stats.get((station, data_group)), force, profile, output)
+                   for (station, data_group), values in columns.items())
+
+    generated = {}
+    unchanged = set()
+    pending = []
+    for station, data_group, filename, error, stages, cached in results:
+        if station is None and data_group is None:
+            # the PDF is complete, or failed to close: its pages only now have a file or none at all
+            if error:
+                errors.append(error)
+            else:
+                generated.update((key, filename) for key in pending)
+            pending = []
+            continue
+        if error:
+            errors.append(error)
+        elif filename:
+            generated[(station, data_group)] = filename
+            if cached:
+                unchanged.add((station, data_group))
+        else:
+            pending.append((station, data_group))
+        if profiler is not None:
+            profiler.merge(stages)
+        count += 1
+        if progress:
+            progress(count, total_plots)
+        if cancel_event is not None and cancel_event.is_set():
+            results.close()
+            break
+
+    generated_files = list(dict.fromkeys(generated[key] for key in columns if key in generated))
+    if skipped is not None:
+        # plots whose PlotKey still matched are listed among the files but were left as they were
+        skipped.extend(generated[key] for key in columns if key in unchanged)
+    if index is not None:
+        index.extend(plot_record(station, data_group, generated[(station, data_group)],
+                                 partitions.stats.get((station, data_group)))
+                     for station, data_group in columns if (station, data_group) in generated)
+    if summary and columns and not (cancel_event is not None and cancel_event.is_set()):
+        table = summary_table(partitions, stations, data_groups, trend_window, profiler)
+        for _, _, filename, error, _, _ in export_summaries(table, summary, settings, data_groups, title_prefix,
+                                                            file_prefix, output_path, trend_window, profiler, output):
+            if error:
+                errors.append(error)
+            else:
+                generated_files.append(filename)
+    return generated_files, errors
+
+
+def sheet_prefixes(title_prefix, file_prefix, sheet=None, config=None):
+    if sheet is None:
+        return title_prefix, file_prefix
+    overrides = (config or {}).get('sheets', {}).get(sheet, {})
+    return (overrides.get('title_prefix', f"{title_prefix} {sheet}"),
+            overrides.get('file_prefix', f"{file_prefix}_{sheet.replace(' ', '_')}"))
+
+
+def batch_prefixes(data_file, config=None, sheet=None):
+    overrides = (config or {}).get('files', {}).get(os.path.basename(data_file), {})
+    stem = data_file_stem(data_file)
+    return sheet_prefixes(overrides.get('title_prefix', stem), overrides.get('file_prefix', stem), sheet, config)
+
+
+def select_sheets(data_file, sheets):
+    available = list_sheets(data_file)
+    if not available:
+        return [None]
+    if not sheets:
+        return available
+    unknown = [sheet for sheet in sheets if sheet not in available]
+    if unknown:
+        raise ValueError(f"{os.path.basename(data_file)} has no sheet named {', '.join(unknown)}")
+    return list(sheets)
+
+
+def _load_sheet(pool, data_file, sheet, profiler=None):
+    if pool is not None and not dataset_cache.cached(data_file, sheet):
+        stamp = file_stamp(data_file)
+        with profile_stage(profiler, 'load'):
+            df = pool.submit(read_columns, data_file, sheet).result()
+        dataset_cache.add_frame(data_file, sheet, df, stamp)
+    return load_partitions(data_file, profiler=profiler, sheet=sheet)
+
+
+def generate_batch(data_files, stations, data_groups, settings, output_path, config=None, workers=1, stream=None,
+                   progress=None, force=False, profiler=None, export='png', sheet_columns=SHEET_COLUMNS,
+                   sheets=None, summary=(), trend_window=TREND_WINDOW, output=DEFAULT_OUTPUT, spec_summary=False,
+                   spec_rows=False):
+    entries = []
+    for data_file in data_files:
+        for sheet in select_sheets(data_file, sheets) if sheets is not None else [None]:
+            title_prefix, file_prefix = batch_prefixes(data_file, config, sheet)
+            entries.append({'data_file': os.path.abspath(data_file), 'sheet': sheet, 'title_prefix': title_prefix,
+                            'file_prefix': file_prefix, 'plots': [], 'skipped': 0, 'summaries': [],
+                            'spec': None, 'errors': []})
+    remaining = list(range(len(entries)))[::-1]
+    loading = {}
+    rendering = {}
+    exporting = {}
+    outstanding = [0] * len(entries)
+    entry_stats = {}
+    finished = 0
+    profile = profiler.memory if profiler is not None else None
+    load_ahead = BATCH_LOAD_AHEAD
+    sheet_loader = None
+    if any(entry['sheet'] is not None for entry in entries):
+        # openpyxl parsing holds the GIL, so whole sheets are parsed in worker processes
+        load_ahead = max(BATCH_LOAD_AHEAD, workers)
+        sheet_loader = ProcessPoolExecutor(max_workers=load_ahead) if workers > 1 else None
+
+    loader = ThreadPoolExecutor(max_workers=load_ahead)
+    renderer = ProcessPoolExecutor(max_workers=workers) if workers > 1 else ThreadPoolExecutor(max_workers=1)
+    try:
+        while remaining or loading or rendering or exporting:
+            while remaining and len(loading) < load_ahead and len(rendering) < BATCH_RENDER_BACKLOG:
+                index = remaining.pop()
+                entry = entries[index]
+                if entry['sheet'] is None:
+                    future = loader.submit(load_partitions, entry['data_file'], stream, None, profiler)
+                else:
+                    future = loader.submit(_load_sheet, sheet_loader, entry['data_file'], entry['sheet'], profiler)
+                loading[future] = index
+
+            done, _ = wait(list(loading) + list(rendering) + list(exporting), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in loading:
+                    index = loading.pop(future)
+                    entry = entries[index]
+                    try:
+                        partitions = future.result()
+                    except Exception as e:
+                        source = entry['data_file']
+                        if entry['sheet'] is not None:
+                            source += f" [{entry['sheet']}]"
+                        entry['errors'].append(f"Error loading {source}: {e}")
+                        partitions = None
+                    if partitions is not None:
+                        with profile_stage(profiler, 'stats'):
+                            ensure_stats(partitions, data_groups)
+                        columns = {}
+                        for station in stations or partitions.stations:
+                            if station not in partitions:
+                                entry['errors'].append(f"No data found for Station {station}")
+                                continue
+                            for data_group in data_groups:
+                                columns[(station, data_group)] = partitions.values(station, data_group)
+                        stats = entry_stats[index] = {key: partitions.stats[key] for key in columns
+                                                      if key in partitions.stats}
+                        if export != 'png' and columns:
+                            job = renderer.submit(_export_job, columns, stats, settings, entry['title_prefix'],
+                                                  entry['file_prefix'], output_path, export, sheet_columns, profile,
+                                                  output)
+                            exporting[job] = index
+                            outstanding[index] += 1
+                        elif columns:
+                            for (station, data_group), values in columns.items():
+                                job = renderer.submit(_render_job, values, station, data_group, settings,
+                                                      entry['title_prefix'], entry['file_prefix'], output_path,
+                                                      stats.get((station, data_group)), force, profile, output)
+                                rendering[job] = index
+                                outstanding[index] += 1
+                        if summary and columns:
+                            table = summary_table(partitions, list(dict.fromkeys(key[0] for key in columns)),
+                                                  data_groups, trend_window, profiler)
+                            job = renderer.submit(_summary_job, table, summary, settings, data_groups,
+                                                  entry['title_prefix'], entry['file_prefix'], output_path,
+                                                  trend_window, profile, output)
+                            exporting[job] = index
+                            outstanding[index] += 1
+                        if (spec_summary or spec_rows) and columns:
+                            # written here while the submitted plots render
+                            try:
+                                entry['spec'] = write_spec_outputs(partitions, settings, data_groups, output_path,
+                                                                   entry['file_prefix'], spec_rows, profiler)
+                            except OSError as e:
+                                entry['errors'].append(f"Could not write out-of-spec report: {e}")
+                else:
+                    if future in rendering:
+                        index = rendering.pop(future)
+                        results = [future.result()]
+                    else:
+                        index = exporting.pop(future)
+                        results, stages = future.result()
+                        if profiler is not None:
+                            profiler.merge(stages)
+                    for station, data_group, filename, error, stages, skipped in results:
+                        if profiler is not None:
+                            profiler.merge(stages)
+                        entries[index]['skipped'] += skipped
+                        if error:
+                            entries[index]['errors'].append(error)
+                        elif filename and station is None:
+                            entries[index]['summaries'].append({'kind': data_group, 'file': filename})
+                        elif filename:
+                            entries[index]['plots'].append(plot_record(station, data_group, filename,
+                                                                       entry_stats[index].get((station, data_group))))
+                    outstanding[index] -= 1
+                if index not in loading.values() and not outstanding[index]:
+                    finished += 1
+                    if progress:
+                        progress(finished, len(entries), entries[index])
+    finally:
+        loader.shutdown(wait=True, cancel_futures=True)
+        renderer.shutdown(wait=True, cancel_futures=True)
+        if sheet_loader is not None:
+            sheet_loader.shutdown(wait=True, cancel_futures=True)
+
+    for entry in entries:
+        entry['plots'].sort(key=lambda plot: (plot['station'], data_groups.index(plot['data_group'])))
+    return entries
+
+
+def write_manifest(entries, output_path, name=BATCH_MANIFEST):
+    return write_json(os.path.join(output_path, name), {'output': os.path.abspath(output_path), 'files': entries})
+
+
+def batch_index(entries):
+    return [{'data_file': entry['data_file'], 'sheet': entry['sheet'], **plot}
+            for entry in entries for plot in entry['plots']]
+
+
+def write_spec_report(report, output_path, file_prefix):
+    path = os.path.join(output_path, f"{file_prefix}{SPEC_SUMMARY_SUFFIX}")
+    return atomic_write(path, report.to_csv(float_format='%.6g').encode('utf-8'))
+
+
+def write_spec_rows(violations, output_path, file_prefix):
+    path = os.path.join(output_path, f"{file_prefix}{SPEC_ROWS_SUFFIX}")
+    return atomic_write(path, violations.to_frame().to_csv(index=False, float_format='%.6g').encode('utf-8'))
+
+
+def write_spec_outputs(partitions, settings, data_groups, output_path, file_prefix, rows=False, profiler=None):
+    with profile_stage(profiler, 'spec'):
+        violations = find_violations(partitions, settings, data_groups)
+        written = {'out_of_spec': len(violations), 'report': os.path.basename(write_spec_report(
+            spec_report(partitions, settings, data_groups, violations), output_path, file_prefix))}
+        if rows:
+            written['rows'] = os.path.basename(write_spec_rows(violations, output_path, file_prefix))
+        return written
+
+
+def log_batch_progress(finished, total, entry):
+    name = os.path.basename(entry['data_file'])
+    if entry.get('sheet') is not None:
+        name += f" [{entry['sheet']}]"
+    logger.info("[%d/%d] %s: %d plots, %d errors", finished, total, name, len(entry['plots']), len(entry['errors']))
+
+
+def log_load_progress(bytes_read, total_bytes):
+    logger.info("Loading %.0f%%", 100.0 * bytes_read / max(total_bytes, 1))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Render station scatter plots without the GUI.")
+    parser.add_argument('data_file', help="Excel (.xlsx), CSV or station column (.stcol) data file, or a "
+                                          "directory or quoted glob pattern to process many files in one batch")
+    parser.add_argument('-c', '--config', help="JSON file with prefixes and per-group plot settings")
+    parser.add_argument('-o', '--output', help="Directory for the generated plots (default: current directory)")
+    parser.add_argument('--title-prefix', help="Plot title prefix (overrides the config file)")
+    parser.add_argument('--file-prefix', help="Filename prefix (overrides the config file)")
+    parser.add_argument('--stations', type=int, nargs='+', help="Stations to plot (default: every station in the file)")
+    parser.add_argument('--groups', nargs='+', choices=DATA_GROUPS, help="Data groups to plot (default: all)")
+    parser.add_argument('--convert', action='store_true',
+                        help="Convert the data file to a .stcol sidecar for fast loading and exit")
+    parser.add_argument('--sidecar-dir', help="Directory for the .stcol sidecar (default: next to the data file)")
+    parser.add_argument('--sheets', nargs='*', metavar='SHEET',
+                        help="Plot each named workbook sheet as its own dataset (no names: every sheet). "
+                             "Prefixes get the sheet name appended unless set under 'sheets' in the config")
+    parser.add_argument('--list-sheets', action='store_true', help="List the sheets of each workbook and exit")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read a CSV file in chunks with bounded memory (automatic for very large files)")
+    parser.add_argument('--render-mode', choices=RENDER_MODES,
+                        help=f"Point rendering: 'decimate' keeps the min/max point per sample bucket "
+                             f"(default 'auto' decimates above {LARGE_N_THRESHOLD} points)")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="Number of worker processes rendering plots in parallel (default: 1)")
+    parser.add_argument('--export', choices=EXPORT_FORMATS, default='png',
+                        help="'png' writes one image per plot, 'pdf' one multi-page PDF per data file, 'sheet' "
+                             "contact-sheet images with stations across and one row per data group")
+    parser.add_argument('--summary', nargs='+', choices=SUMMARY_KINDS, default=[],
+                        help="Also write one cross-station chart per kind: 'box' or 'violin' distributions per "
+                             "station, 'trend' rolling mean +/- std over the sample index")
+    parser.add_argument('--trend-window', type=int, default=TREND_WINDOW,
+                        help=f"Samples in the rolling window of the trend chart (default: {TREND_WINDOW})")
+    parser.add_argument('--sheet-columns', type=int, default=SHEET_COLUMNS,
+                        help=f"Stations per contact sheet (default: {SHEET_COLUMNS})")
+    parser.add_argument('--image-format', choices=IMAGE_FORMATS, default='png',
+                        help="Image format of single plots; only PNG plots are skipped when already up to date")
+    parser.add_argument('--dpi', default=PLOT_DPI,
+                        help=f"Plot resolution as a number or preset ({', '.join(DPI_PRESETS)}; default: {PLOT_DPI})")
+    parser.add_argument('--png-compression', type=int, default=PNG_COMPRESS_LEVEL, choices=range(10),
+                        metavar='0-9', help=f"zlib level for PNG plots; 1 encodes faster, 9 writes smaller files "
+                                            f"(default: {PNG_COMPRESS_LEVEL})")
+    parser.add_argument('--quality', type=int, default=IMAGE_QUALITY,
+                        help=f"JPEG/WebP quality 1-100 (default: {IMAGE_QUALITY})")
+    parser.add_argument('--index', choices=INDEX_FORMATS,
+                        help="Also write an index of every plot with its point count, min, max and mean")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-render every plot even if an up-to-date image already exists")
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help=f"Record time spent per stage (load, partition, stats, cache, render, save) and "
+                             f"write it as JSON (default: {PROFILE_FILENAME} in the output directory)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Also record peak allocation per stage with tracemalloc (slows rendering)")
+    parser.add_argument('--spec-summary', action='store_true',
+                        help="Write per-station counts of points outside the reference lines as CSV, with the "
+                             "first, last and worst offending data rows")
+    parser.add_argument('--spec-rows', action='store_true',
+                        help="Also write every point outside the reference lines with its data row, limit and "
+                             "deviation, sorted by station, data group and row")
+    parser.add_argument('--highlight-violations', action='store_true',
+                        help="Mark points outside the reference lines in the plots")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.config:
+        try:
+            settings, config = load_config(args.config)
+        except (OSError, ValueError) as e:
+            logger.error("Could not load config file %s: %s", args.config, e)
+            return 2
+    else:
+        settings, config = DataGroupSettings(), {}
+    if args.render_mode:
+        settings.render_mode = args.render_mode
+    if args.highlight_violations:
+        settings.highlight_violations = True
+    try:
+        output = OutputOptions(args.image_format, args.dpi, args.png_compression, args.quality)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    title_prefix = args.title_prefix or config.get('title_prefix', 'NoName')
+    file_prefix = args.file_prefix or config.get('file_prefix', 'NoName')
+    stations = args.stations or config.get('stations')
+    data_groups = args.groups or config.get('data_groups', DATA_GROUPS)
+    output_path = args.output or config.get('output', os.getcwd())
+
+    batch = os.path.isdir(args.data_file) or any(char in args.data_file for char in '*?[')
+    data_files = find_data_files(args.data_file) if batch else [args.data_file]
+    if not data_files or not os.path.isfile(data_files[0]):
+        logger.error("Data file does not exist: %s", args.data_file)
+        return 2
+    if args.list_sheets:
+        for data_file in data_files:
+            try:
+                logger.info("%s: %s", os.path.basename(data_file), ', '.join(list_sheets(data_file)) or '-')
+            except ValueError as e:
+                logger.error(str(e))
+        return 0
+    if args.convert:
+        for data_file in data_files:
+            logger.info("Wrote %s", convert_to_sidecar(data_file, args.sidecar_dir))
+        return 0
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+    profiler = None
+    if args.profile is not None or args.profile_memory:
+        profiler = StageProfiler(memory=args.profile_memory)
+
+    if batch or args.sheets is not None:
+        if not batch:
+            # a single named workbook keeps the command line prefixes instead of its file name
+            name = os.path.basename(args.data_file)
+            file_config = {'title_prefix': title_prefix, 'file_prefix': file_prefix,
+                           **config.get('files', {}).get(name, {})}
+            config = {**config, 'files': {**config.get('files', {}), name: file_config}}
+        try:
+            entries = generate_batch(data_files, stations, data_groups, settings, output_path, config,
+                                     workers=max(1, args.workers), stream=args.stream or None,
+                                     progress=log_batch_progress, force=args.force, profiler=profiler,
+                                     export=args.export, sheet_columns=max(1, args.sheet_columns),
+                                     sheets=args.sheets, summary=args.summary,
+                                     trend_window=max(1, args.trend_window), output=output,
+                                     spec_summary=args.spec_summary, spec_rows=args.spec_rows)
+        except ValueError as e:
+            logger.error(str(e))
+            return 2
+        for entry in entries:
+            for error in entry['errors']:
+                logger.warning("%s: %s", os.path.basename(entry['data_file']), error)
+            if entry['spec']:
+                logger.info("Wrote %s (%d points out of spec)", os.path.join(output_path, entry['spec']['report']),
+                            entry['spec']['out_of_spec'])
+        logger.info("Wrote %s", write_manifest(entries, output_path))
+        if args.index:
+            logger.info("Wrote %s", write_index(batch_index(entries), output_path, args.index))
+        # PDF and contact-sheet plots share files, so those are counted once
+        plot_files = sum(len(dict.fromkeys(plot['file'] for plot in entry['plots'])) for entry in entries)
+        summaries = sum(len(entry['summaries']) for entry in entries)
+        skipped = sum(entry['skipped'] for entry in entries)
+        logger.info("Generated %d %s%s%s from %d %s", plot_files - skipped,
+                    'plots' if args.export == 'png' else 'files',
+                    f", skipped {skipped} unchanged" if skipped else "",
+                    f" and {summaries} summary charts" if summaries else "", len(entries),
+                    'data files' if args.sheets is None else 'datasets')
+        log_profile(profiler, args.profile, output_path, data_files=len(data_files), workers=args.workers)
+        return 1 if any(entry['errors'] for entry in entries) else 0
+
+    try:
+        partitions = load_partitions(args.data_file, stream=args.stream or None, progress=log_load_progress,
+                                     profiler=profiler)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+
+    index = []
+    skipped = []
+    generated_files, errors = generate(partitions, stations or partitions.stations, data_groups, settings, title_prefix,
+                                       file_prefix, output_path, workers=max(1, args.workers), force=args.force,
+                                       profiler=profiler, export=args.export,
+                                       sheet_columns=max(1, args.sheet_columns), summary=args.summary,
+                                       trend_window=max(1, args.trend_window), output=output, index=index,
+                                       skipped=skipped)
+    for filename in generated_files:
+        logger.info(os.path.join(output_path, filename))
+    for error in errors:
+        logger.warning(error)
+    plot_files = len(dict.fromkeys(record['file'] for record in index))
+    summaries = len(generated_files) - plot_files
+    logger.info("Generated %d %s%s%s", plot_files - len(skipped), 'plots' if args.export == 'png' else 'files',
+                f", skipped {len(skipped)} unchanged" if skipped else "",
+                f" and {summaries} summary charts" if summaries else "")
+    if args.index:
+        data_file = os.path.abspath(args.data_file)
+        logger.info("Wrote %s", write_index([{'data_file': data_file, 'sheet': None, **record} for record in index],
+                                            output_path, args.index))
+    if args.spec_summary or args.spec_rows:
+        spec = write_spec_outputs(partitions, settings, data_groups, output_path, file_prefix, args.spec_rows,
+                                  profiler)
+        logger.info("Wrote %s (%d points out of spec)", os.path.join(output_path, spec['report']),
+                    spec['out_of_spec'])
+        if args.spec_rows:
+            logger.info("Wrote %s", os.path.join(output_path, spec['rows']))
+    log_profile(profiler, args.profile, output_path, data_file=os.path.abspath(args.data_file),
+                workers=args.workers, plots=plot_files, summaries=summaries)
+    return 1 if errors else 0
+
+
+def log_profile(profiler, profile_path, output_path, **info):
+    if profiler is None:
+        return
+    profiler.close()
+    for line in profiler.summary_lines():
+        logger.info(line)
+    logger.info("Wrote %s", profiler.write_json(profile_path or os.path.join(output_path, PROFILE_FILENAME),
+                                                **info))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
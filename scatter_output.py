@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+IMAGE_FORMATS = ('png', 'jpeg', 'webp')
+IMAGE_EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+DPI_PRESETS = {'draft': 72, 'screen': 100, 'standard': 150, 'print': 300}
+DEFAULT_DPI = DPI_PRESETS['standard']
+PNG_COMPRESS_LEVEL = 6
+IMAGE_QUALITY = 90
+INDEX_FORMATS = ('csv', 'json')
+INDEX_NAME = 'plot_index'
+INDEX_FIELDS = ['data_file', 'sheet', 'station', 'data_group', 'file', 'count', 'min', 'max', 'mean']
+
+
+def parse_dpi(value):
+    if isinstance(value, str) and value in DPI_PRESETS:
+        return DPI_PRESETS[value]
+    try:
+        dpi = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"DPI must be a number or one of {', '.join(DPI_PRESETS)}: {value}")
+    if dpi <= 0:
+        raise ValueError(f"DPI must be positive: {value}")
+    return dpi
+
+
+@contextmanager
+def atomic_file(path):
+    # readers never see a half-written file: the data goes to a temp file that replaces the target when complete
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    os.close(fd)
+    try:
+        yield temp_path
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_write(path, data):
+    with atomic_file(path) as temp_path:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+    return path
+
+
+class OutputOptions:
+    __slots__ = ('format', 'dpi', 'compress_level', 'quality')
+
+    def __init__(self, format='png', dpi=DEFAULT_DPI, compress_level=PNG_COMPRESS_LEVEL, quality=IMAGE_QUALITY):
+        if format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {format}")
+        if not 0 <= compress_level <= 9:
+            raise ValueError(f"PNG compression level must be 0-9: {compress_level}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"Image quality must be 1-100: {quality}")
+        self.format = format
+        self.dpi = parse_dpi(dpi)
+        self.compress_level = compress_level
+        self.quality = quality
+
+    @property
+    def extension(self):
+        return IMAGE_EXTENSIONS[self.format]
+
+    def signature(self):
+        if self.format == 'png':
+            return self.format, self.dpi
+        return self.format, self.dpi, self.quality
+
+    def scaled_dpi(self, base_dpi):
+        # sheets and summaries keep their own default resolution and follow --dpi relative to the standard preset
+        return max(1, round(base_dpi * self.dpi / DEFAULT_DPI))
+
+    def encode(self, fig, metadata=None, dpi=None, bbox_inches='tight'):
+        buffer = io.BytesIO()
+        if self.format == 'png':
+            fig.savefig(buffer, format='png', dpi=dpi or self.dpi, bbox_inches=bbox_inches, metadata=metadata,
+                        pil_kwargs={'compress_level': self.compress_level})
+        else:
+            fig.savefig(buffer, format=self.format, dpi=dpi or self.dpi, bbox_inches=bbox_inches,
+                        pil_kwargs={'quality': self.quality})
+        return buffer.getvalue()
+
+    def save(self, fig, path, metadata=None, dpi=None, bbox_inches='tight'):
+        return atomic_write(path, self.encode(fig, metadata, dpi, bbox_inches))
+
+
+def plot_record(station, data_group, filename, stats=None, **info):
+    stats = stats or {}
+    record = {**info, 'station': station, 'data_group': data_group, 'file': filename}
+    for name in ('count', 'min', 'max', 'mean'):
+        value = stats.get(name)
+        if value is None or value != value:
+            record[name] = None
+        else:
+            record[name] = int(value) if name == 'count' else float(value)
+    return record
+
+
+def write_index(records, output_path, index_format='csv', name=INDEX_NAME):
+    if index_format not in INDEX_FORMATS:
+        raise ValueError(f"Unknown index format: {index_format}")
+    path = os.path.join(output_path, f"{name}.{index_format}")
+    if index_format == 'json':
+        data = json.dumps({'output': os.path.abspath(output_path), 'plots': records}, indent=2).encode('utf-8')
+    else:
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=INDEX_FIELDS, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+        data = text.getvalue().encode('utf-8')
+    return atomic_write(path, data)
+
+
+def write_json(path, payload):
+    return atomic_write(path, json.dumps(payload, indent=2).encode('utf-8'))
@@ -0,0 +1,117 @@
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+
+from scatter_output import write_json
+
+PROFILE_STAGES = ('load', 'partition', 'stats', 'summary', 'spec', 'cache', 'render', 'save')
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def profile_stage(profiler, name):
+    if profiler is None:
+        return _NULL_STAGE
+    return profiler.stage(name)
+
+
+class StageProfiler:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+        self.shared_peaks = False
+        self._lock = threading.Lock()
+        self._active = {}
+        self._owns_tracing = memory and not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def track(self, delta):
+        # tracemalloc keeps one peak for the whole process, so stages open on several threads share it
+        thread = threading.get_ident()
+        with self._lock:
+            count = self._active.get(thread, 0) + delta
+            if count:
+                self._active[thread] = count
+            else:
+                self._active.pop(thread, None)
+            if len(self._active) > 1:
+                self.shared_peaks = True
+
+    def record(self, name, seconds, peak_bytes=0):
+        self.merge({name: {'seconds': seconds, 'calls': 1, 'max_seconds': seconds, 'peak_bytes': peak_bytes}})
+
+    def merge(self, stages):
+        if not stages:
+            return
+        with self._lock:
+            for name, other in stages.items():
+                stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'max_seconds': 0.0,
+                                                      'peak_bytes': 0})
+                stage['seconds'] += other['seconds']
+                stage['calls'] += other['calls']
+                stage['max_seconds'] = max(stage['max_seconds'], other['max_seconds'])
+                stage['peak_bytes'] = max(stage['peak_bytes'], other['peak_bytes'])
+
+    def close(self):
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    def ordered_stages(self):
+        names = [name for name in PROFILE_STAGES if name in self.stages]
+        return names + sorted(name for name in self.stages if name not in PROFILE_STAGES)
+
+    def summary_lines(self):
+        lines = []
+        for name in self.ordered_stages():
+            stage = self.stages[name]
+            line = (f"{name}: {stage['seconds']:.2f} s total, {stage['calls']} x "
+                    f"{stage['seconds'] * 1000 / stage['calls']:.1f} ms")
+            if self.memory:
+                line += f", peak {stage['peak_bytes'] / 2 ** 20:.1f} MiB"
+            lines.append(line)
+        if self.memory and self.shared_peaks:
+            lines.append("Memory peaks are process-wide: stages ran on several threads at once")
+        return lines
+
+    def to_dict(self, **info):
+        result = {'memory': self.memory, **info}
+        if self.memory:
+            result['peak_scope'] = 'process' if self.shared_peaks else 'stage'
+        result['stages'] = {name: self.stages[name] for name in self.ordered_stages()}
+        return result
+
+    def write_json(self, path, **info):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return write_json(path, self.to_dict(**info))
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.memory:
+            self.profiler.track(1)
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        peak = 0
+        if self.profiler.memory:
+            peak = max(tracemalloc.get_traced_memory()[1] - self.base, 0)
+            self.profiler.track(-1)
+        self.profiler.record(self.name, seconds, peak)
+        return False
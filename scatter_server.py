@@ -0,0 +1,525 @@
+import argparse
+import base64
+import json
+import logging
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker
+from urllib.parse import parse_qs, urlparse
+
+from scatter_data import DATA_GROUPS, DELTA_DTYPE, dataset_cache, file_stamp, load_partitions
+from scatter_engine import (PLOT_DPI, SharedColumns, attach_columns, get_template, render_image, render_plot,
+                            settings_signature)
+from scatter_output import IMAGE_QUALITY, PNG_COMPRESS_LEVEL, OutputOptions
+from scatter_settings import DataGroupSettings, RENDER_MODES, load_config
+from scatter_stats import ensure_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+QUEUE_SIZE = 64
+BATCH_SIZE = 16
+RESULT_CACHE_SIZE = 256
+DATASET_CACHE_SIZE = 16
+LOADER_THREADS = 2
+REQUEST_TIMEOUT = 60.0
+MAX_BODY_BYTES = 1 << 20
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+_attached = OrderedDict()
+_worker_limits = {'datasets': DATASET_CACHE_SIZE}
+
+
+def _warm_worker(settings, datasets=DATASET_CACHE_SIZE):
+    # build every template once so the first real request skips figure construction
+    _attached.clear()
+    _worker_limits['datasets'] = datasets
+    for data_group in DATA_GROUPS:
+        get_template(data_group, settings).fig.canvas.draw()
+
+
+def _attached_columns(spec):
+    name = spec[0]
+    if name in _attached:
+        _attached.move_to_end(name)
+    else:
+        _attached[name] = attach_columns(spec)
+        while len(_attached) > _worker_limits['datasets']:
+            shm, columns = _attached.popitem(last=False)[1]
+            del columns
+            shm.close()
+    return _attached[name][1]
+
+
+def _render_shared(render, source, *args):
+    # a worker process slices the station out of the dataset's shared block instead of receiving a copy
+    spec, data_group, start, stop = source
+    return render(_attached_columns(spec)[data_group][start:stop], *args)
+
+
+class RenderService:
+    def __init__(self, settings=None, output_path=None, data_dir=None, workers=1, queue_size=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE, cache_size=RESULT_CACHE_SIZE):
+        self.settings = settings or DataGroupSettings()
+        self.output_path = os.path.abspath(output_path or os.getcwd())
+        self.data_dir = os.path.realpath(data_dir or os.getcwd())
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.pending = queue.Queue()
+        self.in_flight = 0
+        self.results = OrderedDict()
+        self.counters = {'requests': 0, 'rendered': 0, 'cache_hits': 0, 'coalesced': 0, 'rejected': 0,
+                         'batches': 0, 'loads': 0}
+        self._lock = threading.Lock()
+        self.loaded = {}
+        self.loading = {}
+        self.shared = OrderedDict()
+        # data files are parsed here, so a cold file never holds up requests for data that is already loaded
+        self.loader = ThreadPoolExecutor(max_workers=LOADER_THREADS)
+        if workers > 1:
+            # workers started before the tracker would run their own, which unlinks shared datasets when they exit
+            resource_tracker.ensure_running()
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker,
+                                            initargs=(self.settings, dataset_cache.max_entries))
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=1, initializer=_warm_worker, initargs=(self.settings,))
+        for _ in range(workers):
+            self.pool.submit(time.sleep, 0)
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def resolve_path(self, path):
+        if not path or not isinstance(path, str):
+            raise ValueError("Request needs a 'file'")
+        resolved = os.path.realpath(os.path.join(self.data_dir, path))
+        # requests may only read files below --data-dir, whatever '..' or absolute paths they contain
+        if os.path.commonpath([resolved, self.data_dir]) != self.data_dir:
+            raise ValueError(f"Data file is outside the data directory: {path}")
+        if not os.path.isfile(resolved):
+            raise FileNotFoundError(f"Data file does not exist: {path}")
+        return resolved
+
+    def request_settings(self, request):
+        if not request.get('groups') and not request.get('render_mode') and 'highlight_violations' not in request:
+            return self.settings
+        groups = request.get('groups') or {}
+        if not isinstance(groups, dict) or not all(isinstance(values, dict) for values in groups.values()):
+            raise ValueError("'groups' must map data groups to settings objects")
+        settings = self.settings.copy()
+        settings.apply_config(groups)
+        render_mode = request.get('render_mode', settings.render_mode)
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode: {render_mode}")
+        settings.render_mode = render_mode
+        if 'highlight_violations' in request:
+            settings.highlight_violations = str(request['highlight_violations']).lower() in ('1', 'true', 'yes')
+        return settings
+
+    def preload(self, path, sheet=None):
+        return self._load(self.resolve_path(path), sheet)
+
+    def _load(self, path, sheet):
+        stamp = file_stamp(path)
+        partitions = load_partitions(path, sheet=sheet)
+        ensure_stats(partitions)
+        if self.workers > 1:
+            self._share(partitions, (path, sheet, stamp))
+        with self._lock:
+            self.loaded[(path, sheet)] = stamp
+        return partitions
+
+    def _share(self, partitions, key):
+        # worker processes map each loaded dataset once, so requests only carry a station's offsets
+        with self._lock:
+            if key in self.shared:
+                return
+        shared = SharedColumns({group: partitions.columns[group] for group in DATA_GROUPS}, DELTA_DTYPE)
+        retired = []
+        with self._lock:
+            if key in self.shared:
+                retired.append(shared)
+            else:
+                self.shared[key] = shared
+                while len(self.shared) > dataset_cache.max_entries:
+                    retired.append(self.shared.popitem(last=False)[1])
+        for block in retired:
+            block.close()
+
+    def _ready_partitions(self, path, sheet):
+        stamp = file_stamp(path)
+        with self._lock:
+            loaded = self.loaded.get((path, sheet)) == stamp
+            shared = self.shared.get((path, sheet, stamp))
+            if shared is not None:
+                self.shared.move_to_end((path, sheet, stamp))
+        if self.workers > 1 and shared is None:
+            return None, stamp, None
+        return (dataset_cache.cached_partitions(path, sheet, stamp) if loaded else None), stamp, shared
+
+    def _load_later(self, path, sheet, request, future):
+        with self._lock:
+            waiting = self.loading.setdefault((path, sheet), [])
+            waiting.append((request, future))
+            if len(waiting) > 1:
+                return
+            self.counters['loads'] += 1
+        work = self.loader.submit(self._load, path, sheet)
+        work.add_done_callback(lambda work, key=(path, sheet): self._loaded(work, key))
+
+    def _loaded(self, work, key):
+        with self._lock:
+            waiting = self.loading.pop(key)
+        error = work.exception()
+        for request, future in waiting:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                self.pending.put((request, future))
+
+    def submit(self, request):
+        with self._lock:
+            self.counters['requests'] += 1
+            if self.in_flight >= self.queue_size:
+                self.counters['rejected'] += 1
+                raise ServiceBusy(f"Render queue is full ({self.queue_size} requests)")
+            self.in_flight += 1
+        future = Future()
+        future.add_done_callback(self._finished)
+        self.pending.put((request, future))
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _dispatch(self):
+        while True:
+            batch = [self.pending.get()]
+            if batch[0] is None:
+                return
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.pending.put(None)
+                    break
+                batch.append(item)
+            with self._lock:
+                self.counters['batches'] += 1
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        rendering = {}
+        for request, future in batch:
+            try:
+                path, sheet = self._source(request)
+                job = self._prepare(request, path, sheet)
+                if job is None:
+                    self._load_later(path, sheet, request, future)
+                    continue
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            with self._lock:
+                cached = self.results.get(job['key'])
+                if cached is not None:
+                    self.results.move_to_end(job['key'])
+                    self.counters['cache_hits'] += 1
+            if cached is not None:
+                future.set_result(cached)
+            elif job['key'] in rendering:
+                rendering[job['key']][1].append(future)
+                with self._lock:
+                    self.counters['coalesced'] += 1
+            else:
+                rendering[job['key']] = (job, [future])
+
+        for key, (job, futures) in rendering.items():
+            if job['output'] == 'path':
+                render, args = render_plot, (job['station'], job['data_group'], job['settings'], job['title_prefix'],
+                                             job['file_prefix'], self.output_path, job['image'], job['stats'],
+                                             job['force'])
+            else:
+                render, args = render_image, (job['station'], job['data_group'], job['settings'],
+                                              job['title_prefix'], job['image'], job['stats'])
+            if job['shared'] is not None:
+                work = self.pool.submit(_render_shared, render, job['shared'], *args)
+            else:
+                work = self.pool.submit(render, job['values'], *args)
+            work.add_done_callback(lambda work, key=key, job=job, futures=futures:
+                                   self._rendered(work, key, job, futures))
+
+    def _source(self, request):
+        sheet = request.get('sheet')
+        if sheet is not None and not isinstance(sheet, str):
+            raise ValueError("'sheet' must be a sheet name")
+        return self.resolve_path(request.get('file')), sheet
+
+    def _prepare(self, request, path, sheet):
+        data_group = request.get('data_group')
+        if data_group not in DATA_GROUPS:
+            raise ValueError(f"Unknown data group: {data_group}")
+        try:
+            station = int(request.get('station'))
+        except (TypeError, ValueError):
+            raise ValueError("Request needs an integer 'station'")
+        output = request.get('output', 'image')
+        if output not in ('image', 'png', 'path'):
+            raise ValueError(f"Unknown output: {output}")
+        output = 'image' if output == 'png' else output
+        partitions, stamp, shared = self._ready_partitions(path, sheet)
+        if partitions is None:
+            return None
+        if station not in partitions:
+            raise ValueError(f"No data found for Station {station}")
+        settings = self.request_settings(request)
+        stats = ensure_stats(partitions, [data_group])[(station, data_group)]
+        if shared is not None:
+            values, shared = None, (shared.spec(), data_group, *partitions.bounds(station))
+        else:
+            values = partitions.values(station, data_group)
+        title_prefix = str(request.get('title_prefix', 'NoName'))
+        file_prefix = str(request.get('file_prefix', title_prefix))
+        if '/' in file_prefix or '\\' in file_prefix or '\0' in file_prefix:
+            raise ValueError(f"'file_prefix' must not contain path separators: {file_prefix}")
+        try:
+            compression = int(request.get('compression', PNG_COMPRESS_LEVEL))
+            quality = int(request.get('quality', IMAGE_QUALITY))
+        except (TypeError, ValueError):
+            raise ValueError("'compression' and 'quality' must be integers")
+        image = OutputOptions(request.get('format', 'png'), request.get('dpi', PLOT_DPI), compression, quality)
+        # the file stamp stands in for the data, so no request hashes its values on the dispatcher
+        key = (output, path, sheet, stamp, station, data_group, settings_signature(settings, data_group),
+               title_prefix, file_prefix, image.signature())
+        return {'values': values, 'shared': shared, 'station': station, 'data_group': data_group, 'settings': settings,
+                'title_prefix': title_prefix, 'file_prefix': file_prefix, 'image': image, 'stats': stats,
+                'output': output, 'force': str(request.get('force', '')).lower() in ('1', 'true', 'yes'),
+                'key': key}
+
+    def _rendered(self, work, key, job, futures):
+        try:
+            result = work.result()
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        if job['output'] == 'path':
+            result = os.path.join(self.output_path, result)
+        with self._lock:
+            self.counters['rendered'] += 1
+            # files can be removed behind our back, so only image bytes are reused
+            if job['output'] == 'image':
+                self.results[key] = result
+                while len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+        for future in futures:
+            future.set_result(result)
+
+    def status(self):
+        with self._lock:
+            return {'workers': self.workers, 'in_flight': self.in_flight, 'queue_size': self.queue_size,
+                    'cached_results': len(self.results), **self.counters}
+
+    def close(self):
+        self.pending.put(None)
+        self.dispatcher.join()
+        self.loader.shutdown(wait=False, cancel_futures=True)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            shared, self.shared = list(self.shared.values()), OrderedDict()
+        for block in shared:
+            block.close()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = 'ScatterRender/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self.send_json(200, self.server.service.status())
+        elif url.path == '/render':
+            request = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            self.render([request], single=True)
+        else:
+            self.send_json(404, {'error': f"Unknown path: {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/render':
+            self.send_json(404, {'error': f"Unknown path: {url.path}"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self.send_json(413, {'error': "Request body is too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self.send_json(400, {'error': f"Invalid JSON: {e}"})
+            return
+        if not isinstance(body, dict):
+            self.send_json(400, {'error': "Request body must be a JSON object"})
+            return
+        if 'requests' not in body:
+            self.render([body], single=True)
+            return
+        requests = body['requests']
+        if not isinstance(requests, list) or not all(isinstance(request, dict) for request in requests):
+            self.send_json(400, {'error': "'requests' must be a list of request objects"})
+            return
+        self.render(requests, single=False)
+
+    def render(self, requests, single):
+        service = self.server.service
+        futures = []
+        for request in requests:
+            try:
+                futures.append(service.submit(request))
+            except ServiceBusy as e:
+                if single:
+                    self.send_json(503, {'error': str(e)})
+                    return
+                futures.append(e)
+
+        results = []
+        for request, future in zip(requests, futures):
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                output = 'path' if request.get('output') == 'path' else request.get('format', 'png')
+                results.append((200, future.result(timeout=REQUEST_TIMEOUT), output))
+            except ServiceBusy as e:
+                results.append((503, str(e), None))
+            except FileNotFoundError as e:
+                results.append((404, str(e), None))
+            except ValueError as e:
+                results.append((400, str(e), None))
+            except Exception as e:
+                results.append((500, str(e), None))
+
+        if single:
+            status, result, output = results[0]
+            if status != 200:
+                self.send_json(status, {'error': result})
+            elif output == 'path':
+                self.send_json(200, {'path': result})
+            else:
+                self.send_bytes(200, result, f"image/{output}")
+            return
+        items = []
+        for status, result, output in results:
+            if status != 200:
+                items.append({'status': status, 'error': result})
+            elif output == 'path':
+                items.append({'status': status, 'path': result})
+            else:
+                items.append({'status': status, output: base64.b64encode(result).decode('ascii')})
+        self.send_json(200, {'results': items})
+
+    def send_json(self, status, payload):
+        self.send_bytes(status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def send_bytes(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, RenderHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RenderHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve station scatter plots on demand from warm datasets and "
+                                                 "render workers.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"HTTP port (default: {DEFAULT_PORT})")
+    parser.add_argument('--socket', help="Listen on this Unix socket path instead of a TCP port")
+    parser.add_argument('-c', '--config', help="JSON file with the default per-group plot settings")
+    parser.add_argument('-o', '--output', help="Directory for plots requested with output=path "
+                                               "(default: current directory)")
+    parser.add_argument('--data-dir', help="Directory that relative data file paths are resolved against")
+    parser.add_argument('-j', '--workers', type=int, default=1, help="Render worker processes (default: 1)")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help=f"Requests accepted before answering 503 (default: {QUEUE_SIZE})")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"Queued requests dispatched together (default: {BATCH_SIZE})")
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help=f"Rendered images kept in memory (default: {RESULT_CACHE_SIZE})")
+    parser.add_argument('--datasets', type=int, default=DATASET_CACHE_SIZE,
+                        help=f"Parsed data files kept in memory (default: {DATASET_CACHE_SIZE})")
+    parser.add_argument('--preload', nargs='+', default=[], metavar='FILE', help="Data files to parse at startup")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    settings = load_config(args.config)[0] if args.config else DataGroupSettings()
+    output_path = args.output or os.getcwd()
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+    dataset_cache.max_entries = max(1, args.datasets)
+
+    service = RenderService(settings, output_path, args.data_dir, max(1, args.workers), max(1, args.queue_size),
+                            max(1, args.batch_size), max(0, args.cache_size))
+    for path in args.preload:
+        try:
+            partitions = service.preload(path)
+            logger.info("Loaded %s (%d rows, %d stations)", path, len(partitions), len(partitions.stations))
+        except (OSError, ValueError) as e:
+            logger.error(str(e))
+    server = create_server(service, args.host, args.port, args.socket)
+    logger.info("Serving on %s", args.socket or f"http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import json
+
+import numpy as np
+
+RENDER_MODES = ('auto', 'full', 'decimate')
+EXPORT_FORMATS = ('png', 'pdf', 'sheet')
+SUMMARY_KINDS = ('box', 'violin', 'trend')
+REF_LINE_FIELDS = {'ref_lines': 'values', 'ref_styles': 'styles', 'ref_colors': 'colors', 'ref_labels': 'labels'}
+
+DEFAULT_SETTINGS = {
+    'DeltaX': {
+        'y_min': 2,
+        'y_max': 5,
+        'ref_lines': [3.0, 4.0, 3.5],
+        'ref_colors': ['red', 'red', 'orange'],
+        'ref_styles': ['-', '-', '--'],
+        'ref_labels': ['Ref Line 1', 'Ref Line 2', 'Ref Line 3'],
+        'point_size': 15,
+        'point_color': 'royalblue',
+        'title_prefix': 'NoName',
+        'file_prefix': 'NoName'
+    },
+    'DeltaY': {
+        'y_min': -1,
+        'y_max': 2,
+        'ref_lines': [0.0, 1.0, 0.5],
+        'ref_colors': ['red', 'red', 'orange'],
+        'ref_styles': ['-', '-', '--'],
+        'ref_labels': ['Ref Line 1', 'Ref Line 2', 'Ref Line 3'],
+        'point_size': 15,
+        'point_color': 'forestgreen',
+        'title_prefix': 'NoName',
+        'file_prefix': 'NoName'
+    },
+    'DeltaAngle': {
+        'y_min': -1,
+        'y_max': 5,
+        'ref_lines': [0.0, 4.0],
+        'ref_colors': ['green', 'green'],
+        'ref_styles': ['-', '-'],
+        'ref_labels': ['Min Value', 'Max Value'],
+        'point_size': 15,
+        'point_color': 'red',
+        'title_prefix': 'NoName',
+        'file_prefix': 'NoName'
+    }
+}
+
+
+def format_limit(value):
+    return '' if value is None else f"{value:g}"
+
+
+def to_float(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReferenceLines:
+    __slots__ = ('values', 'styles', 'colors', 'labels')
+
+    def __init__(self, values=(), styles=(), colors=(), labels=()):
+        self.values = np.asarray(values, dtype=np.float64).reshape(-1)
+        count = len(self.values)
+        self.styles = [styles[i] if i < len(styles) else '-' for i in range(count)]
+        self.colors = [colors[i] if i < len(colors) else 'red' for i in range(count)]
+        self.labels = [labels[i] if i < len(labels) else 'Reference' for i in range(count)]
+
+    @classmethod
+    def parse(cls, values, styles=(), colors=(), labels=()):
+        styles, colors, labels = styles or [], colors or [], labels or []
+        keep = [i for i, value in enumerate(values or []) if to_float(value) is not None]
+        return cls([float(values[i]) for i in keep],
+                   [styles[i] if i < len(styles) else '-' for i in keep],
+                   [colors[i] if i < len(colors) else 'red' for i in keep],
+                   [labels[i] if i < len(labels) else 'Reference' for i in keep])
+
+    def __len__(self):
+        return len(self.values)
+
+    def copy(self):
+        return ReferenceLines(self.values.copy(), self.styles, self.colors, self.labels)
+
+    def append(self, value, style='-', color='red', label='Reference'):
+        self.values = np.append(self.values, float(value))
+        self.styles.append(style)
+        self.colors.append(color)
+        self.labels.append(label)
+
+    def update(self, index, value, style, color, label):
+        self.values[index] = float(value)
+        self.styles[index] = style
+        self.colors[index] = color
+        self.labels[index] = label
+
+    def remove(self, index):
+        keep = np.ones(len(self.values), dtype=bool)
+        keep[index] = False
+        self.values = self.values[keep]
+        self.styles = [style for style, kept in zip(self.styles, keep) if kept]
+        self.colors = [color for color, kept in zip(self.colors, keep) if kept]
+        self.labels = [label for label, kept in zip(self.labels, keep) if kept]
+
+    def band(self):
+        if not len(self.values):
+            return None
+        return float(self.values.min()), float(self.values.max())
+
+    def as_dicts(self):
+        return [{'value': value, 'style': style, 'color': color, 'label': label}
+                for value, style, color, label in zip(self.values.tolist(), self.styles, self.colors, self.labels)]
+
+    def signature(self):
+        return tuple(zip(self.values.tolist(), self.styles, self.colors, self.labels))
+
+
+class GroupSettings:
+    __slots__ = ('y_min', 'y_max', 'ref_lines', 'point_size', 'point_color', 'title_prefix', 'file_prefix')
+
+    def __init__(self, y_min=None, y_max=None, ref_lines=None, point_size=15, point_color='royalblue',
+                 title_prefix='NoName', file_prefix='NoName'):
+        self.y_min = to_float(y_min)
+        self.y_max = to_float(y_max)
+        self.ref_lines = ref_lines if ref_lines is not None else ReferenceLines()
+        self.point_size = point_size
+        self.point_color = point_color
+        self.title_prefix = title_prefix
+        self.file_prefix = file_prefix
+
+    @classmethod
+    def from_dict(cls, values):
+        ref_lines = ReferenceLines.parse(*(values.get(name) for name in REF_LINE_FIELDS))
+        return cls(values.get('y_min'), values.get('y_max'), ref_lines, values.get('point_size', 15),
+                   values.get('point_color', 'royalblue'), values.get('title_prefix', 'NoName'),
+                   values.get('file_prefix', 'NoName'))
+
+    def copy(self):
+        return GroupSettings(self.y_min, self.y_max, self.ref_lines.copy(), self.point_size, self.point_color,
+                             self.title_prefix, self.file_prefix)
+
+    @property
+    def ylim(self):
+        if self.y_min is None or self.y_max is None:
+            return None
+        return self.y_min, self.y_max
+
+
+class DataGroupSettings:
+    __slots__ = ('groups', 'render_mode', 'highlight_violations')
+    default_settings = DEFAULT_SETTINGS
+
+    def __init__(self):
+        self.groups = {group: GroupSettings.from_dict(values) for group, values in DEFAULT_SETTINGS.items()}
+        self.render_mode = 'auto'
+        self.highlight_violations = False
+
+    def __getitem__(self, data_group):
+        return self.groups[data_group]
+
+    def copy(self):
+        settings = DataGroupSettings()
+        settings.groups = {group: values.copy() for group, values in self.groups.items()}
+        settings.render_mode = self.render_mode
+        settings.highlight_violations = self.highlight_violations
+        return settings
+
+    def get_setting(self, data_group, setting_name):
+        group = self.groups[data_group]
+        if setting_name in REF_LINE_FIELDS:
+            value = getattr(group.ref_lines, REF_LINE_FIELDS[setting_name])
+            return value.tolist() if isinstance(value, np.ndarray) else list(value)
+        return getattr(group, setting_name, None)
+
+    def update_setting(self, data_group, setting_name, value):
+        group = self.groups.get(data_group)
+        if group is None:
+            return
+        if setting_name in REF_LINE_FIELDS:
+            self.update_ref_lines(data_group, **{setting_name: value})
+        elif setting_name in ('y_min', 'y_max'):
+            setattr(group, setting_name, to_float(value))
+        elif setting_name in GroupSettings.__slots__:
+            setattr(group, setting_name, value)
+        else:
+            raise ValueError(f"Unknown setting for {data_group}: {setting_name}")
+
+    def update_ref_lines(self, data_group, **fields):
+        values = {name: fields.get(name, self.get_setting(data_group, name)) for name in REF_LINE_FIELDS}
+        self.groups[data_group].ref_lines = ReferenceLines.parse(*values.values())
+
+    def get_ref_lines(self, data_group):
+        return self.groups[data_group].ref_lines.as_dicts()
+
+    def apply_config(self, group_config):
+        for group, values in group_config.items():
+            if group not in self.groups:
+                raise ValueError(f"Unknown data group in config: {group}")
+            ref_fields = {name: value for name, value in values.items() if name in REF_LINE_FIELDS}
+            if ref_fields:
+                self.update_ref_lines(group, **ref_fields)
+            for setting_name, value in values.items():
+                if setting_name not in REF_LINE_FIELDS:
+                    self.update_setting(group, setting_name, value)
+
+
+def load_config(path):
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    settings = DataGroupSettings()
+    settings.apply_config(config.get('groups', {}))
+    render_mode = config.get('render_mode', settings.render_mode)
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode in config: {render_mode}")
+    settings.render_mode = render_mode
+    settings.highlight_violations = bool(config.get('highlight_violations', settings.highlight_violations))
+    return settings, config
@@ -0,0 +1,296 @@
+import numpy as np
+import pandas as pd
+
+from scatter_data import DATA_GROUPS, DELTA_DTYPE
+
+SUMMARY_BINS = 64
+TREND_WINDOW = 200
+TREND_POINTS = 400
+WHISKER_IQR = 1.5
+
+
+def outside_band(values, band):
+    # data columns are float32, so the limits are rounded the same way whatever dtype the values arrive in
+    low, high = (float(DELTA_DTYPE(limit)) for limit in band)
+    return values < low, values > high
+
+
+def out_of_spec_summary(partitions, settings, data_groups=DATA_GROUPS):
+    frames = []
+    station_count = len(partitions.stations)
+    station_index = np.repeat(np.arange(station_count), partitions.counts)
+    for group in data_groups:
+        band = settings[group].ref_lines.band()
+        if band is None or not station_count:
+            continue
+        values = partitions.columns[group]
+        below, above = outside_band(values, band)
+        total = np.bincount(station_index[~np.isnan(values)], minlength=station_count)
+        below = np.bincount(station_index[below], minlength=station_count)
+        above = np.bincount(station_index[above], minlength=station_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percent = 100.0 * (below + above) / total
+        frames.append(pd.DataFrame({
+            'station': partitions.stations,
+            'data_group': group,
+            'count': total,
+            'below': below,
+            'above': above,
+            'out_of_spec': below + above,
+            'out_of_spec_pct': percent,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['count', 'below', 'above', 'out_of_spec', 'out_of_spec_pct'],
+                            index=pd.MultiIndex.from_tuples([], names=['station', 'data_group']))
+    return pd.concat(frames, ignore_index=True).set_index(['station', 'data_group'])
+
+
+VIOLATION_REPORT_COLUMNS = ['out_of_spec', 'below', 'above', 'first_row', 'last_row', 'worst_row', 'worst_value',
+                            'worst_deviation']
+
+
+class ViolationIndex:
+    def __init__(self, stations, data_groups, station_codes, group_codes, rows, values, limits):
+        self.stations = np.asarray(stations, dtype=np.int64)
+        self.data_groups = list(data_groups)
+        keys = station_codes.astype(np.int64) * len(self.data_groups) + group_codes
+        # one argsort of a combined (station, data_group, row) key is several times faster than np.lexsort
+        order = np.argsort(keys * (int(rows.max()) + 1 if len(rows) else 1) + rows)
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.values = values[order]
+        self.limits = limits[order]
+        self.deviations = self.values - self.limits
+        self._station_codes = {int(station): code for code, station in enumerate(self.stations)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _slice(self, station, data_group):
+        if station not in self._station_codes or data_group not in self.data_groups:
+            return slice(0, 0)
+        key = self._station_codes[station] * len(self.data_groups) + self.data_groups.index(data_group)
+        start, stop = np.searchsorted(self.keys, [key, key + 1])
+        return slice(int(start), int(stop))
+
+    def rows_for(self, station, data_group):
+        return self.rows[self._slice(station, data_group)]
+
+    def lookup(self, station, data_group):
+        selected = self._slice(station, data_group)
+        return pd.DataFrame({'row': self.rows[selected], 'value': self.values[selected],
+                             'limit': self.limits[selected], 'deviation': self.deviations[selected]})
+
+    def to_frame(self):
+        group_count = len(self.data_groups)
+        return pd.DataFrame({
+            'station': self.stations[self.keys // group_count],
+            'data_group': np.asarray(self.data_groups, dtype=object)[self.keys % group_count],
+            'row': self.rows,
+            'value': self.values,
+            'limit': self.limits,
+            'deviation': self.deviations,
+        })
+
+    def report(self):
+        if not len(self):
+            return pd.DataFrame(columns=VIOLATION_REPORT_COLUMNS,
+                                index=pd.MultiIndex.from_tuples([], names=['station', 'data_group']))
+        group_count = len(self.data_groups)
+        starts = np.flatnonzero(np.diff(self.keys, prepend=-1))
+        counts = np.diff(np.append(starts, len(self.keys)))
+        below = np.add.reduceat(self.deviations < 0, starts)
+        magnitude = np.abs(self.deviations)
+        worst = np.maximum.reduceat(magnitude, starts)
+        # first sample of each segment that reaches the segment's largest deviation
+        positions = np.where(magnitude == np.repeat(worst, counts), np.arange(len(magnitude)), len(magnitude))
+        worst_at = np.minimum.reduceat(positions, starts)
+        keys = self.keys[starts]
+        return pd.DataFrame({
+            'station': self.stations[keys // group_count],
+            'data_group': np.asarray(self.data_groups, dtype=object)[keys % group_count],
+            'out_of_spec': counts,
+            'below': below,
+            'above': counts - below,
+            'first_row': self.rows[starts],
+            'last_row': self.rows[starts + counts - 1],
+            'worst_row': self.rows[worst_at],
+            'worst_value': self.values[worst_at],
+            'worst_deviation': self.deviations[worst_at],
+        }).set_index(['station', 'data_group'])
+
+
+def find_violations(partitions, settings, data_groups=DATA_GROUPS):
+    station_codes = np.repeat(np.arange(len(partitions.stations), dtype=np.int64), partitions.counts)
+    found = []
+    for group_code, group in enumerate(data_groups):
+        band = settings[group].ref_lines.band()
+        if band is None:
+            continue
+        low, high = band
+        values = partitions.columns[group]
+        below, above = outside_band(values, band)
+        hits = np.flatnonzero(below | above)
+        found.append((station_codes[hits], np.full(len(hits), group_code, dtype=np.int64), partitions.order[hits],
+                      values[hits].astype(np.float64), np.where(below[hits], low, high)))
+    if not found:
+        empty = np.empty(0, dtype=np.int64)
+        return ViolationIndex(partitions.stations, data_groups, empty, empty, empty, np.empty(0), np.empty(0))
+    return ViolationIndex(partitions.stations, data_groups, *(np.concatenate(parts) for parts in zip(*found)))
+
+
+def spec_report(partitions, settings, data_groups=DATA_GROUPS, violations=None):
+    if violations is None:
+        violations = find_violations(partitions, settings, data_groups)
+    report = out_of_spec_summary(partitions, settings, data_groups).join(
+        violations.report().drop(columns=['out_of_spec', 'below', 'above']))
+    for column in ('first_row', 'last_row', 'worst_row'):
+        report[column] = report[column].astype('Int64')
+    return report
+
+
+def compute_group_stats(partitions, data_groups=DATA_GROUPS, std=False, percentiles=(), bands=None):
+    index = pd.MultiIndex.from_product([partitions.stations, data_groups], names=['station', 'data_group'])
+    if not partitions.stations:
+        return pd.DataFrame(index=index)
+
+    starts = partitions.starts
+    counts = partitions.counts
+    frames = []
+    for group in data_groups:
+        values = partitions.columns[group].astype(np.float64)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        valid_counts = np.add.reduceat(valid, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.add.reduceat(filled, starts) / valid_counts
+            group_stats = {
+                'count': valid_counts,
+                'min': np.fmin.reduceat(values, starts),
+                'max': np.fmax.reduceat(values, starts),
+                'mean': means,
+            }
+            if std:
+                deviations = np.where(valid, values - np.repeat(means, counts), 0.0)
+                group_stats['std'] = np.sqrt(np.add.reduceat(deviations * deviations, starts)
+                                             / (valid_counts - 1))
+        for q in percentiles:
+            group_stats[f'p{q:g}'] = np.empty(len(starts))
+        if percentiles:
+            for i, (start, count) in enumerate(zip(starts, counts)):
+                station_values = values[start:start + count]
+                station_values = station_values[valid[start:start + count]]
+                results = np.percentile(station_values, percentiles) if len(station_values) else \
+                    [np.nan] * len(percentiles)
+                for q, result in zip(percentiles, results):
+                    group_stats[f'p{q:g}'][i] = result
+        if bands and group in bands:
+            group_stats['out_of_band'] = np.add.reduceat(np.logical_or(*outside_band(values, bands[group])), starts)
+        frame = pd.DataFrame(group_stats)
+        frame['station'] = partitions.stations
+        frame['data_group'] = group
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True).set_index(['station', 'data_group']).reindex(index)
+
+
+def ensure_stats(partitions, data_groups=DATA_GROUPS):
+    missing_groups = [group for group in data_groups
+                      if any((station, group) not in partitions.stats for station in partitions.stations)]
+    if missing_groups:
+        table = compute_group_stats(partitions, missing_groups)
+        partitions.stats.update(table.to_dict('index'))
+    return partitions.stats
+
+
+def segment_quantiles(ordered, starts, valid_counts, quantiles):
+    results = []
+    for q in quantiles:
+        position = np.maximum(valid_counts - 1, 0) * q
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        fraction = position - low
+        value = ordered[starts + low] * (1 - fraction) + ordered[starts + high] * fraction
+        results.append(np.where(valid_counts > 0, value, np.nan))
+    return results
+
+
+def rolling_trend(values, valid, starts, counts, window=TREND_WINDOW, points=TREND_POINTS):
+    filled = np.where(valid, values, 0.0)
+    sums = np.concatenate(([0.0], np.cumsum(filled)))
+    squares = np.concatenate(([0.0], np.cumsum(filled * filled)))
+    totals = np.concatenate(([0], np.cumsum(valid)))
+
+    samples = np.minimum(counts, points)
+    segment = np.repeat(np.arange(len(counts)), samples)
+    step = np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)
+    count = counts[segment]
+    spread = np.maximum(samples[segment] - 1, 1)
+    local = step * (count - 1) // spread
+    end = starts[segment] + local + 1
+    begin = np.maximum(starts[segment], end - window)
+    n = totals[end] - totals[begin]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[end] - sums[begin]) / n
+        std = np.sqrt(np.maximum((squares[end] - squares[begin]) / n - mean * mean, 0.0))
+    split = np.cumsum(samples)[:-1]
+    return np.split(local + 1, split), np.split(mean, split), np.split(std, split)
+
+
+def aggregate_table(partitions, data_groups=DATA_GROUPS, bins=SUMMARY_BINS, window=TREND_WINDOW,
+                    points=TREND_POINTS):
+    columns = ['count', 'mean', 'min', 'q1', 'median', 'q3', 'max', 'whislo', 'whishi',
+               'coords', 'density', 'trend_x', 'trend_mean', 'trend_std']
+    if not partitions.stations:
+        return pd.DataFrame(columns=columns,
+                            index=pd.MultiIndex.from_tuples([], names=['station', 'data_group']))
+
+    starts = partitions.starts
+    counts = partitions.counts
+    station_count = len(partitions.stations)
+    station_index = np.repeat(np.arange(station_count), counts)
+    frames = []
+    for group in data_groups:
+        values = partitions.columns[group].astype(np.float64)
+        valid = ~np.isnan(values)
+        valid_counts = np.add.reduceat(valid, starts)
+        # stations are contiguous, so one lexsort orders every station's values at once (NaN last)
+        ordered = values[np.lexsort((values, station_index))]
+        minimum, q1, median, q3, maximum = segment_quantiles(ordered, starts, valid_counts,
+                                                             (0.0, 0.25, 0.5, 0.75, 1.0))
+        iqr = q3 - q1
+        whislo = np.fmax(minimum, q1 - WHISKER_IQR * iqr)
+        whishi = np.fmin(maximum, q3 + WHISKER_IQR * iqr)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.add.reduceat(np.where(valid, values, 0.0), starts) / valid_counts
+
+        low, high = np.nanmin(whislo), np.nanmax(whishi)
+        if not np.isfinite(low) or low == high:
+            low, high = (low - 0.5, high + 0.5) if np.isfinite(low) else (0.0, 1.0)
+        edges = np.linspace(low, high, bins + 1)
+        inside = valid & (values >= low) & (values <= high)
+        bin_index = np.clip(np.searchsorted(edges, values[inside], side='right') - 1, 0, bins - 1)
+        density = np.bincount(station_index[inside] * bins + bin_index,
+                              minlength=station_count * bins).reshape(station_count, bins)
+        coords = (edges[:-1] + edges[1:]) / 2
+
+        trend_x, trend_mean, trend_std = rolling_trend(values, valid, starts, counts, window, points)
+        frames.append(pd.DataFrame({
+            'station': partitions.stations,
+            'data_group': group,
+            'count': valid_counts,
+            'mean': means,
+            'min': minimum,
+            'q1': q1,
+            'median': median,
+            'q3': q3,
+            'max': maximum,
+            'whislo': whislo,
+            'whishi': whishi,
+            'coords': [coords] * station_count,
+            'density': list(density),
+            'trend_x': trend_x,
+            'trend_mean': trend_mean,
+            'trend_std': trend_std,
+        }))
+    return pd.concat(frames, ignore_index=True).set_index(['station', 'data_group'])
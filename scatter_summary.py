@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from scatter_data import DATA_GROUPS
+from scatter_output import OutputOptions
+from scatter_settings import SUMMARY_KINDS
+
+SUMMARY_DPI = 120
+SUMMARY_ROW_HEIGHT = 3.2
+SUMMARY_STATION_WIDTH = 0.45
+SUMMARY_MIN_WIDTH = 8
+TREND_WIDTH = 12
+TREND_DETAIL_STATIONS = 12
+VIOLIN_SMOOTHING = np.array([1.0, 2.0, 3.0, 2.0, 1.0])
+SUMMARY_TITLES = {'box': "Box Summary", 'violin': "Distribution Summary", 'trend': "Rolling Mean Trend"}
+
+
+def summary_filename(file_prefix, kind, extension='png'):
+    return f"{file_prefix}_Summary_{kind.capitalize()}.{extension}"
+
+
+def _box_stats(row):
+    return {'med': row['median'], 'q1': row['q1'], 'q3': row['q3'], 'whislo': row['whislo'],
+            'whishi': row['whishi'], 'mean': row['mean'], 'fliers': []}
+
+
+def _violin_stats(row):
+    return {'coords': row['coords'], 'vals': np.convolve(row['density'], VIOLIN_SMOOTHING, 'same'), 'mean': row['mean'],
+            'median': row['median'], 'min': row['whislo'], 'max': row['whishi']}
+
+
+def _draw_stations(ax, rows, kind, color):
+    rows = rows[rows['count'] > 0]
+    stations = list(rows.index)
+    positions = np.arange(1, len(stations) + 1)
+    if kind == 'box' and stations:
+        artists = ax.bxp([_box_stats(row) for _, row in rows.iterrows()], positions=positions, showmeans=True,
+                         showfliers=False, patch_artist=True, widths=0.6)
+        for box in artists['boxes']:
+            box.set(facecolor=color, alpha=0.5)
+    elif kind == 'violin':
+        drawn = [(position, _violin_stats(row)) for position, (_, row) in zip(positions, rows.iterrows())
+                 if row['density'].any()]
+        if drawn:
+            artists = ax.violin([stats for _, stats in drawn], positions=[position for position, _ in drawn],
+                                widths=0.8, showmeans=True, showextrema=False, showmedians=True)
+            for body in artists['bodies']:
+                body.set(facecolor=color, alpha=0.5)
+    ax.set_xticks(positions)
+    ax.set_xticklabels([str(station) for station in stations], fontsize=9)
+    ax.set_xlim(0.4, len(stations) + 0.6)
+
+
+def _draw_trends(ax, rows):
+    # with many stations the +/- std bands hide each other, so only the means are drawn
+    detailed = len(rows) <= TREND_DETAIL_STATIONS
+    for station, row in rows.iterrows():
+        if not len(row['trend_x']):
+            continue
+        line, = ax.plot(row['trend_x'], row['trend_mean'], linewidth=1.0, label=f"Station {station}")
+        if detailed:
+            ax.fill_between(row['trend_x'], row['trend_mean'] - row['trend_std'],
+                            row['trend_mean'] + row['trend_std'], color=line.get_color(), alpha=0.1, linewidth=0)
+    if detailed and len(rows):
+        ax.legend(loc='upper right', fontsize=8, ncol=2)
+
+
+def summary_figure(table, kind, settings, data_groups=DATA_GROUPS, title_prefix='NoName', window=None):
+    if kind not in SUMMARY_KINDS:
+        raise ValueError(f"Unknown summary chart: {kind}")
+    stations = table.index.get_level_values('station').unique()
+    if kind == 'trend':
+        width = TREND_WIDTH
+    else:
+        width = max(SUMMARY_MIN_WIDTH, SUMMARY_STATION_WIDTH * len(stations) + 2)
+    fig = Figure(figsize=(width, SUMMARY_ROW_HEIGHT * len(data_groups)))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(len(data_groups), 1, squeeze=False)[:, 0]
+
+    for ax, group in zip(axes, data_groups):
+        rows = table.xs(group, level='data_group')
+        group_settings = settings[group]
+        if kind == 'trend':
+            _draw_trends(ax, rows)
+        else:
+            _draw_stations(ax, rows, kind, group_settings.point_color)
+        for ref in group_settings.ref_lines.as_dicts():
+            ax.axhline(y=ref['value'], linestyle=ref['style'], color=ref['color'], linewidth=1.0, alpha=0.7)
+        if group_settings.ylim is not None:
+            ax.set_ylim(*group_settings.ylim)
+        ax.set_ylabel(group, fontsize=11)
+        ax.grid(axis='y', alpha=0.3)
+    axes[-1].set_xlabel("Sample" if kind == 'trend' else "Station", fontsize=11)
+
+    title = f"{title_prefix}-{SUMMARY_TITLES[kind]} ({len(stations)} stations)"
+    if kind == 'trend' and window:
+        title += f", window {window}"
+    fig.suptitle(title, fontsize=14)
+    fig.tight_layout()
+    return fig
+
+
+def render_summary(table, kind, settings, data_groups, title_prefix, file_prefix, output_path, output=None,
+                   window=None):
+    output = output or OutputOptions()
+    filename = summary_filename(file_prefix, kind, output.extension)
+    fig = summary_figure(table, kind, settings, data_groups, title_prefix, window)
+    output.save(fig, os.path.join(output_path, filename), dpi=output.scaled_dpi(SUMMARY_DPI))
+    return filename
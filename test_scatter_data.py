@@ -0,0 +1,260 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import scatter_data
+from scatter_data import (DATA_GROUPS, ROW_COLUMN, CsvTail, DatasetCache, StationPartitions, read_columns,
+                          list_sheets, load_sheets, read_csv_partitions, read_sidecar, read_sidecar_header,
+                          sidecar_is_fresh, write_sidecar)
+
+
+CSV_HEADER = "Station,DeltaX,DeltaY,DeltaAngle\n"
+
+
+def write_csv(path, lines):
+    path.write_text(CSV_HEADER + "".join(line + "\n" for line in lines))
+    return str(path)
+
+
+def test_sidecar_round_trip(tmp_path):
+    source = write_csv(tmp_path / "data.csv", ["1,0.5,1,2", "300,1.5,2,3", "1,2.5,3,4"])
+    df = read_columns(source)
+    sidecar = write_sidecar(df, str(tmp_path / "data.csv.stcol"), source)
+    for mmap in (True, False):
+        loaded = read_sidecar(sidecar, mmap=mmap)
+        assert loaded['Station'].tolist() == [1, 300, 1]
+        for group in DATA_GROUPS:
+            assert loaded[group].dtype == np.float32
+            assert np.array_equal(loaded[group].to_numpy(), df[group].to_numpy())
+    assert [column['name'] for column in read_sidecar_header(sidecar)['columns']] == ['Station'] + DATA_GROUPS
+    assert sidecar_is_fresh(sidecar, source)
+
+
+def test_sidecar_goes_stale_when_source_changes(tmp_path):
+    source = write_csv(tmp_path / "data.csv", ["1,0.5,1,2"])
+    sidecar = write_sidecar(read_columns(source), str(tmp_path / "data.csv.stcol"), source)
+    write_csv(tmp_path / "data.csv", ["1,0.5,1,2", "2,1.5,2,3"])
+    assert not sidecar_is_fresh(sidecar, source)
+    assert sidecar_is_fresh(write_sidecar(read_columns(source), sidecar, source), source)
+    assert not sidecar_is_fresh(write_sidecar(read_columns(source), sidecar), source)
+
+
+def test_streamed_partitions_match_in_memory(tmp_path):
+    rng = np.random.default_rng(1)
+    stations = rng.integers(1, 6, 200).astype(object)
+    stations[[3, 50, 199]] = ""
+    values = rng.normal(size=200)
+    lines = [f"{station},{value:.4f},0,0" for station, value in zip(stations, values)]
+    path = write_csv(tmp_path / "data.csv", lines)
+    expected = StationPartitions.from_frame(read_columns(path))
+    progress = []
+    streamed = read_csv_partitions(path, chunk_rows=17, progress=lambda done, total: progress.append((done, total)))
+    assert streamed.stations == expected.stations
+    assert np.array_equal(streamed.starts, expected.starts)
+    assert np.array_equal(streamed.order, expected.order)
+    for group in DATA_GROUPS:
+        assert np.array_equal(streamed.columns[group], expected.columns[group])
+    assert progress[-1][0] == progress[-1][1]
+    assert streamed.stats[(1, 'DeltaX')]['count'] == expected.count(1)
+
+
+def test_csv_tail_appends_complete_lines(tmp_path):
+    path = write_csv(tmp_path / "live.csv", ["1,0.5,0,0", "2,1.5,0,0"])
+    tail = CsvTail(path)
+    assert tail.poll() == 2
+    assert tail.poll() == 0
+    with open(path, 'a') as f:
+        f.write("1,2.5,0,0\n,9,9,9\n2,3.5")
+    assert tail.poll() == 1
+    assert tail.values(1, 'DeltaX').tolist() == [0.5, 2.5]
+    with open(path, 'a') as f:
+        f.write(",0,0\n")
+    assert tail.poll() == 1
+    assert tail.values(2, 'DeltaX').tolist() == [1.5, 3.5]
+    assert len(tail) == 4
+    assert tail.stats[(1, 'DeltaX')] == {'min': 0.5, 'max': 2.5, 'mean': 1.5, 'count': 2}
+
+
+def test_csv_tail_grows_buffers_and_resets_on_truncation(tmp_path):
+    path = write_csv(tmp_path / "live.csv", [])
+    tail = CsvTail(path)
+    values = np.arange(5000, dtype=np.float32)
+    with open(path, 'a') as f:
+        f.write("".join(f"7,{value},0,0\n" for value in values))
+    assert tail.poll() == len(values)
+    assert np.array_equal(tail.values(7, 'DeltaX'), values)
+    write_csv(tmp_path / "live.csv", ["3,1.0,0,0"])
+    assert os.path.getsize(path) < tail.offset
+    assert tail.poll() == 1
+    assert tail.stations == [3]
+    assert (7, 'DeltaX') not in tail.stats
+
+
+def test_read_columns_keeps_source_rows(tmp_path):
+    path = write_csv(tmp_path / "data.csv", ["1,0.5,0,0", ",9,9,9", "2,1.5,0,0", "1,2.5,0,0"])
+    df = read_columns(path)
+    assert df.index.tolist() == [0, 2, 3]
+    partitions = StationPartitions.from_frame(df)
+    assert partitions.rows(1).tolist() == [0, 3]
+    assert partitions.rows(2).tolist() == [2]
+    assert np.array_equal(read_csv_partitions(path).order, partitions.order)
+
+
+def test_sidecar_keeps_source_rows_only_when_rows_were_dropped(tmp_path):
+    source = write_csv(tmp_path / "data.csv", ["1,0.5,1,2", "x,9,9,9", "300,1.5,2,3", ",9,9,9", "1,2.5,3,4"])
+    sidecar = write_sidecar(read_columns(source), str(tmp_path / "data.csv.stcol"), source)
+    assert ROW_COLUMN in [column['name'] for column in read_sidecar_header(sidecar)['columns']]
+    for mmap in (True, False):
+        loaded = read_sidecar(sidecar, mmap=mmap)
+        assert loaded.index.tolist() == [0, 2, 4]
+        assert ROW_COLUMN not in loaded.columns
+    source = write_csv(tmp_path / "clean.csv", ["1,0.5,1,2", "2,1.5,2,3"])
+    sidecar = write_sidecar(read_columns(source), str(tmp_path / "clean.csv.stcol"), source)
+    assert ROW_COLUMN not in [column['name'] for column in read_sidecar_header(sidecar)['columns']]
+    assert read_sidecar(sidecar).index.tolist() == [0, 1]
+
+
+def test_csv_tail_reads_backlog_in_bounded_steps(tmp_path, monkeypatch):
+    monkeypatch.setattr(scatter_data, 'TAIL_BLOCK_BYTES', 64)
+    lines = [f"{index % 3 + 1},{index}.5,0,0" for index in range(300)]
+    path = write_csv(tmp_path / "live.csv", lines)
+    tail = CsvTail(path)
+    polls = 0
+    while True:
+        polls += 1
+        tail.poll(1000)
+        if tail.caught_up:
+            break
+    assert polls > 3
+    assert len(tail) == 300
+    assert tail.values(2, 'DeltaX').tolist() == [index + 0.5 for index in range(1, 300, 3)]
+
+
+def test_csv_tail_reads_a_line_longer_than_the_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(scatter_data, 'TAIL_BLOCK_BYTES', 64)
+    path = write_csv(tmp_path / "live.csv", ["1," + "0" * 500 + "1.5,0,0"] + ["2,2.5,0,0"] * 50)
+    tail = CsvTail(path)
+    assert tail.poll(16) >= 1
+    assert not tail.caught_up
+    while not tail.caught_up:
+        tail.poll(16)
+    assert (tail.count(1), tail.count(2)) == (1, 50)
+
+
+def test_text_cells_become_nan_and_fractional_stations_are_dropped(tmp_path, caplog):
+    lines = ["1,0.5,abc,0", "2,N/A,1,-", "1.5,9,9,9", "2,1.5,2,3"]
+    path = write_csv(tmp_path / "data.csv", lines)
+    with caplog.at_level(logging.WARNING, logger='scatter_data'):
+        df = read_columns(path)
+    assert "Dropped 1 rows with a non-integer Station" in caplog.text
+    assert df.index.tolist() == [0, 1, 3]
+    assert df['Station'].tolist() == [1, 2, 2]
+    assert df['DeltaX'].dtype == np.float32
+    assert np.array_equal(df['DeltaX'].to_numpy(), [0.5, np.nan, 1.5], equal_nan=True)
+    assert np.isnan(df['DeltaY'].iloc[0]) and np.isnan(df['DeltaAngle'].iloc[1])
+    streamed = read_csv_partitions(path, chunk_rows=2)
+    assert streamed.stations == [1, 2]
+    assert np.array_equal(streamed.values(2, 'DeltaX'), [np.nan, 1.5], equal_nan=True)
+    tail = CsvTail(path)
+    assert tail.poll() == 3
+    assert tail.stations == [1, 2]
+    assert np.isnan(tail.values(1, 'DeltaY')[0])
+
+
+def count_parses(monkeypatch):
+    parsed = []
+    read_data = scatter_data.read_data
+
+    def counting(path, sheet=None):
+        parsed.append(os.path.basename(path))
+        return read_data(path, sheet)
+    monkeypatch.setattr(scatter_data, 'read_data', counting)
+    return parsed
+
+
+def test_dataset_cache_reparses_changed_files(tmp_path, monkeypatch):
+    parsed = count_parses(monkeypatch)
+    cache = DatasetCache()
+    path = write_csv(tmp_path / "data.csv", ["1,0.5,0,0", "2,1.5,0,0"])
+    partitions = cache.get_partitions(path)
+    assert cache.get_partitions(path) is partitions
+    assert cache.cached_partitions(path) is partitions
+    assert [set(entry) for entry in cache._entries.values()] == [{'stamp', 'partitions'}]
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not cache.cached(path)
+    assert cache.cached_partitions(path) is None
+    assert cache.get_partitions(path) is not partitions
+    write_csv(tmp_path / "data.csv", ["1,0.5,0,0", "2,1.5,0,0", "3,2.5,0,0"])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.get_partitions(path).stations == [1, 2, 3]
+    assert parsed == ["data.csv"] * 3
+
+
+def test_dataset_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    parsed = count_parses(monkeypatch)
+    cache = DatasetCache(max_entries=2)
+    paths = [write_csv(tmp_path / f"{name}.csv", ["1,0.5,0,0"]) for name in "abc"]
+    cache.get_partitions(paths[0])
+    cache.get_partitions(paths[1])
+    cache.get_partitions(paths[0])
+    cache.get_partitions(paths[2])
+    assert [cache.cached(path) for path in paths] == [True, False, True]
+    cache.get_partitions(paths[1])
+    assert [cache.cached(path) for path in paths] == [False, True, True]
+    assert parsed == ["a.csv", "b.csv", "c.csv", "b.csv"]
+
+
+def write_workbook(path, sheets):
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for name, frame in sheets.items():
+            frame.to_excel(writer, sheet_name=name, index=False)
+    return str(path)
+
+
+def station_frame(stations):
+    values = np.arange(len(stations), dtype=float)
+    return pd.DataFrame({'Station': stations, **{group: values for group in DATA_GROUPS}})
+
+
+def test_list_sheets_reads_the_workbook_part(tmp_path):
+    path = write_workbook(tmp_path / "shift.xlsx", {'Phase B': station_frame([1]), 'Phase A': station_frame([2])})
+    assert list_sheets(path) == ['Phase B', 'Phase A']
+    assert list_sheets(write_csv(tmp_path / "data.csv", ["1,0,0,0"])) == []
+    (tmp_path / "broken.xlsx").write_bytes(b"not a zip")
+    with pytest.raises(ValueError, match="broken.xlsx"):
+        list_sheets(str(tmp_path / "broken.xlsx"))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_load_sheets_reports_a_bad_sheet_and_loads_the_rest(tmp_path, workers):
+    path = write_workbook(tmp_path / "shift.xlsx", {
+        'Good': station_frame([1, 2, 1]),
+        'Bad': station_frame([1]).drop(columns=['DeltaY']),
+        'Also good': station_frame([3]),
+    })
+    partitions, errors = load_sheets(path, ['Good', 'Bad', 'Also good'], workers=workers)
+    assert list(partitions) == ['Good', 'Also good']
+    assert partitions['Good'].stations == [1, 2]
+    assert partitions['Also good'].stations == [3]
+    assert list(errors) == ['Bad']
+    assert "Sheet 'Bad': Missing data columns: DeltaY" in errors['Bad']
+
+
+def read_columns_failing_on_bad(path, sheet=None):
+    if sheet == 'Bad':
+        raise KeyError('xl/worksheets/sheet2.xml')
+    return read_columns(path, sheet)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_load_sheets_survives_other_exceptions(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(scatter_data, 'read_columns', read_columns_failing_on_bad)
+    path = write_workbook(tmp_path / "shift.xlsx", {'Good': station_frame([1]), 'Bad': station_frame([2]),
+                                                    'Also good': station_frame([3])})
+    partitions, errors = load_sheets(path, ['Good', 'Bad', 'Also good'], workers=workers)
+    assert list(partitions) == ['Good', 'Also good']
+    assert errors == {'Bad': "Sheet 'Bad': KeyError: 'xl/worksheets/sheet2.xml'"}
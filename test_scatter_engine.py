@@ -0,0 +1,265 @@
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+import scatter_engine
+from scatter_data import DATA_GROUPS, StationPartitions, find_data_files
+from scatter_engine import (SHEET_CELL_SIZE, SHEET_DPI, generate, generate_batch, main, minmax_decimate, plot_key,
+                            read_plot_key, render_plot)
+from scatter_output import OutputOptions
+from scatter_settings import DataGroupSettings
+
+
+def test_minmax_decimate_keeps_small_series():
+    values = np.array([3.0, 1.0, 2.0])
+    x, y = minmax_decimate(values)
+    assert x.tolist() == [1.0, 2.0, 3.0]
+    assert y is values
+
+
+def test_minmax_decimate_keeps_extremes():
+    values = np.sin(np.arange(10000) / 7.0)
+    values[1234] = 5.0
+    values[8765] = -5.0
+    values[100] = np.nan
+    x, y = minmax_decimate(values, buckets=50, sample=100)
+    assert len(x) < len(values)
+    assert np.all(np.diff(x) > 0)
+    assert np.array_equal(y, values[x.astype(int) - 1], equal_nan=True)
+    assert {1235.0, 8766.0} <= set(x.tolist())
+
+
+def make_frame(stations=(1, 2), rows=20):
+    rng = np.random.default_rng(len(stations) * rows)
+    return pd.DataFrame({'Station': np.resize(stations, rows), 'DeltaX': rng.normal(3.5, 0.5, rows),
+                         'DeltaY': rng.normal(0.5, 0.3, rows), 'DeltaAngle': rng.normal(2.0, 1.0, rows)})
+
+
+def write_data(path, stations=(1, 2), rows=20):
+    make_frame(stations, rows).to_csv(path, index=False)
+    return str(path)
+
+
+def write_workbook(path, sheets):
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for name, stations in sheets.items():
+            make_frame(stations).to_excel(writer, sheet_name=name, index=False)
+    return str(path)
+
+
+def test_find_data_files_in_directories_and_globs(tmp_path):
+    for name in ("a.csv", "a.csv.stcol", "c.stcol", "~$b.xlsx", "notes.txt"):
+        (tmp_path / name).write_text("")
+    write_workbook(tmp_path / "b.xlsx", {'Sheet1': (1,)})
+    names = [os.path.basename(path) for path in find_data_files(str(tmp_path))]
+    assert names == ["a.csv", "b.xlsx", "c.stcol"]
+    assert find_data_files(str(tmp_path / "*.csv")) == [str(tmp_path / "a.csv")]
+    assert find_data_files(str(tmp_path / "*.parquet")) == []
+
+
+def test_generate_batch_renders_every_file(tmp_path):
+    data_files = [write_data(tmp_path / "a.csv"), write_data(tmp_path / "b.csv", stations=(2, 3))]
+    output = tmp_path / "out"
+    output.mkdir()
+    progress = []
+    entries = generate_batch(data_files, [2, 3], ['DeltaX'], DataGroupSettings(), str(output),
+                             progress=lambda done, total, entry: progress.append(done))
+    assert [os.path.basename(entry['data_file']) for entry in entries] == ["a.csv", "b.csv"]
+    assert [plot['station'] for plot in entries[0]['plots']] == [2]
+    assert entries[0]['errors'] == ["No data found for Station 3"]
+    assert [plot['file'] for plot in entries[1]['plots']] == ["b_Station_2_DeltaX_Plot.png",
+                                                              "b_Station_3_DeltaX_Plot.png"]
+    assert entries[1]['errors'] == []
+    assert sorted(progress) == [1, 2]
+    assert sorted(os.listdir(output)) == ["a_Station_2_DeltaX_Plot.png", "b_Station_2_DeltaX_Plot.png",
+                                          "b_Station_3_DeltaX_Plot.png"]
+
+
+def test_generate_batch_plots_each_sheet(tmp_path):
+    workbook = write_workbook(tmp_path / "shift.xlsx", {'Phase A': (1,), 'Phase B': (1, 2)})
+    entries = generate_batch([workbook], None, ['DeltaY'], DataGroupSettings(), str(tmp_path), sheets=[])
+    assert [entry['sheet'] for entry in entries] == ['Phase A', 'Phase B']
+    assert [entry['file_prefix'] for entry in entries] == ['shift_Phase_A', 'shift_Phase_B']
+    assert [len(entry['plots']) for entry in entries] == [1, 2]
+    assert os.path.isfile(tmp_path / "shift_Phase_B_Station_2_DeltaY_Plot.png")
+    entries = generate_batch([workbook], None, ['DeltaY'], DataGroupSettings(), str(tmp_path), sheets=['Phase B'])
+    assert [entry['sheet'] for entry in entries] == ['Phase B']
+    with pytest.raises(ValueError):
+        generate_batch([workbook], None, ['DeltaY'], DataGroupSettings(), str(tmp_path), sheets=['Phase C'])
+
+
+def count_renders(monkeypatch):
+    renders = []
+    get_template = scatter_engine.get_template
+
+    def counting(data_group, settings, preview=False):
+        renders.append(data_group)
+        return get_template(data_group, settings, preview)
+    monkeypatch.setattr(scatter_engine, 'get_template', counting)
+    return renders
+
+
+def test_render_plot_skips_unchanged_png(tmp_path, monkeypatch):
+    renders = count_renders(monkeypatch)
+    values = np.linspace(0.0, 1.0, 50)
+    settings = DataGroupSettings()
+    filename = render_plot(values, 1, 'DeltaX', settings, "Run", "run", str(tmp_path))
+    path = tmp_path / filename
+    assert read_plot_key(str(path)) == plot_key(values, 1, 'DeltaX', settings, "Run", "run")
+    data = path.read_bytes()
+    assert render_plot(values, 1, 'DeltaX', settings, "Run", "run", str(tmp_path)) == filename
+    assert len(renders) == 1
+    assert path.read_bytes() == data
+    render_plot(values, 1, 'DeltaX', settings, "Run", "run", str(tmp_path), force=True)
+    assert len(renders) == 2
+    render_plot(values[::-1], 1, 'DeltaX', settings, "Run", "run", str(tmp_path))
+    render_plot(values[::-1], 1, 'DeltaX', settings, "Run 2", "run", str(tmp_path))
+    assert len(renders) == 4
+
+
+def test_render_plot_rerenders_when_the_key_is_missing(tmp_path, monkeypatch):
+    renders = count_renders(monkeypatch)
+    values = np.linspace(0.0, 1.0, 50)
+    settings = DataGroupSettings()
+    jpeg = OutputOptions('jpeg', dpi='draft')
+    render_plot(values, 1, 'DeltaX', settings, "Run", "run", str(tmp_path), jpeg)
+    render_plot(values, 1, 'DeltaX', settings, "Run", "run", str(tmp_path), jpeg)
+    assert len(renders) == 2
+    (tmp_path / "run_Station_1_DeltaX_Plot.png").write_bytes(b"not a png")
+    assert read_plot_key(str(tmp_path / "run_Station_1_DeltaX_Plot.png")) is None
+    assert read_plot_key(str(tmp_path / "missing.png")) is None
+    render_plot(values, 1, 'DeltaX', settings, "Run", "run", str(tmp_path))
+    assert len(renders) == 3
+    assert read_plot_key(str(tmp_path / "run_Station_1_DeltaX_Plot.png")) is not None
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_generate_reports_unchanged_plots_as_skipped(tmp_path, workers):
+    partitions = StationPartitions.from_frame(make_frame((1, 2), rows=30))
+    skipped = []
+    files, errors = generate(partitions, [1, 2], ['DeltaX'], DataGroupSettings(), "Run", "run", str(tmp_path),
+                             workers=workers, skipped=skipped)
+    assert len(files) == 2
+    assert skipped == []
+    (tmp_path / "run_Station_2_DeltaX_Plot.png").unlink()
+    again, errors = generate(partitions, [1, 2], ['DeltaX'], DataGroupSettings(), "Run", "run", str(tmp_path),
+                             workers=workers, skipped=skipped)
+    assert again == files
+    assert skipped == ["run_Station_1_DeltaX_Plot.png"]
+    assert errors == []
+
+
+def test_generate_batch_counts_skipped_plots(tmp_path):
+    data_files = [write_data(tmp_path / "a.csv")]
+    entries = generate_batch(data_files, None, ['DeltaX'], DataGroupSettings(), str(tmp_path))
+    assert entries[0]['skipped'] == 0
+    entries = generate_batch(data_files, None, ['DeltaX'], DataGroupSettings(), str(tmp_path))
+    assert len(entries[0]['plots']) == 2
+    assert entries[0]['skipped'] == 2
+
+
+def track_shared_columns(monkeypatch):
+    blocks = []
+    shared_columns = scatter_engine.SharedColumns
+
+    def tracking(columns, dtype):
+        shared = shared_columns(columns, dtype)
+        blocks.append(shared)
+        return shared
+    monkeypatch.setattr(scatter_engine, 'SharedColumns', tracking)
+    return blocks
+
+
+def assert_released(blocks):
+    assert blocks
+    for name in (block.shm.name for block in blocks):
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def test_parallel_generate_matches_serial(tmp_path, monkeypatch):
+    blocks = track_shared_columns(monkeypatch)
+    frame = make_frame((1, 2, 3), rows=60)
+    frame[DATA_GROUPS] = frame[DATA_GROUPS].astype(np.float32)
+    partitions = StationPartitions.from_frame(frame)
+    outputs = {}
+    for workers in (1, 2):
+        output = tmp_path / f"workers_{workers}"
+        output.mkdir()
+        files, errors = generate(partitions, [1, 2, 3], ['DeltaX', 'DeltaAngle'], DataGroupSettings(), "Run", "run",
+                                 str(output), workers=workers)
+        assert errors == []
+        outputs[workers] = (files, {name: (output / name).read_bytes() for name in os.listdir(output)})
+    assert outputs[2][0] == outputs[1][0]
+    assert len(outputs[1][0]) == 6
+    assert outputs[2][1] == outputs[1][1]
+    assert [block.dtype for block in blocks] == [np.float32]
+    assert_released(blocks)
+
+
+def test_cancelled_parallel_generate_releases_shared_memory(tmp_path, monkeypatch):
+    blocks = track_shared_columns(monkeypatch)
+    partitions = StationPartitions.from_frame(make_frame((1, 2, 3, 4), rows=40))
+    cancel = threading.Event()
+    files, errors = generate(partitions, [1, 2, 3, 4], ['DeltaX', 'DeltaY'], DataGroupSettings(), "Run", "run",
+                             str(tmp_path), progress=lambda done, total: cancel.set(), workers=2,
+                             cancel_event=cancel)
+    assert errors == []
+    assert len(files) == 1
+    assert all(os.path.isfile(tmp_path / filename) for filename in files)
+    assert_released(blocks)
+
+
+def test_generate_exports_one_pdf(tmp_path):
+    partitions = StationPartitions.from_frame(make_frame((1, 2, 3), rows=30))
+    files, errors = generate(partitions, [1, 2, 3, 4], ['DeltaX', 'DeltaY'], DataGroupSettings(), "Run", "run",
+                             str(tmp_path), export='pdf')
+    assert files == ["run_Plots.pdf"]
+    assert errors == ["No data found for Station 4"]
+    assert b"/Count 6" in (tmp_path / "run_Plots.pdf").read_bytes()
+    assert os.listdir(tmp_path) == ["run_Plots.pdf"]
+
+
+def test_cancelled_pdf_export_reports_no_missing_files(tmp_path):
+    partitions = StationPartitions.from_frame(make_frame((1, 2, 3), rows=30))
+    cancel = threading.Event()
+
+    def progress(done, total):
+        if done == 2:
+            cancel.set()
+    files, errors = generate(partitions, [1, 2, 3], ['DeltaX', 'DeltaY'], DataGroupSettings(), "Run", "run",
+                             str(tmp_path), progress=progress, cancel_event=cancel, export='pdf')
+    assert errors == []
+    assert all(os.path.isfile(tmp_path / filename) for filename in files)
+    assert files == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_generate_exports_contact_sheets(tmp_path):
+    partitions = StationPartitions.from_frame(make_frame((1, 2, 3, 4, 5), rows=30))
+    progress = []
+    files, errors = generate(partitions, [1, 2, 3, 4, 5], ['DeltaX', 'DeltaAngle'], DataGroupSettings(), "Run",
+                             "run", str(tmp_path), progress=lambda done, total: progress.append((done, total)),
+                             export='sheet', sheet_columns=3)
+    assert files == ["run_Sheet_001.png", "run_Sheet_002.png"]
+    assert errors == []
+    assert progress[-1] == (10, 10)
+    width, height = SHEET_CELL_SIZE
+    for filename in files:
+        with Image.open(tmp_path / filename) as image:
+            assert image.size == (round(width * 3 * SHEET_DPI), round(height * 2 * SHEET_DPI))
+
+
+def test_main_rejects_bad_config_files(tmp_path, caplog):
+    data_file = write_data(tmp_path / "data.csv")
+    (tmp_path / "broken.json").write_text("{not json")
+    (tmp_path / "group.json").write_text('{"groups": {"DeltaZ": {}}}')
+    for config in ("missing.json", "broken.json", "group.json"):
+        assert main([data_file, '-c', str(tmp_path / config), '-o', str(tmp_path / "out")]) == 2
+    assert "Unknown data group in config: DeltaZ" in caplog.text
+    assert not os.path.exists(tmp_path / "out")
@@ -0,0 +1,67 @@
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from scatter_output import DPI_PRESETS, OutputOptions, atomic_file, atomic_write, parse_dpi
+
+
+class BrokenFigure:
+    def savefig(self, *args, **kwargs):
+        raise RuntimeError("disk full")
+
+
+def make_figure():
+    fig = Figure(figsize=(1, 1))
+    FigureCanvasAgg(fig)
+    fig.subplots().plot([0, 1], [0, 1])
+    return fig
+
+
+def test_atomic_write_replaces_the_target(tmp_path):
+    path = tmp_path / "plot.png"
+    path.write_bytes(b"old")
+    assert atomic_write(str(path), b"new") == str(path)
+    assert path.read_bytes() == b"new"
+    assert [entry.name for entry in tmp_path.iterdir()] == ["plot.png"]
+
+
+def test_failed_write_keeps_the_target_and_no_temp_files(tmp_path):
+    path = tmp_path / "plot.png"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_file(str(path)) as temp_path:
+            with open(temp_path, 'wb') as f:
+                f.write(b"half")
+            raise RuntimeError("interrupted")
+    assert path.read_bytes() == b"old"
+    assert [entry.name for entry in tmp_path.iterdir()] == ["plot.png"]
+
+
+def test_failed_save_keeps_the_target_and_no_temp_files(tmp_path):
+    path = tmp_path / "plot.jpg"
+    options = OutputOptions('jpeg', dpi='draft')
+    options.save(make_figure(), str(path))
+    saved = path.read_bytes()
+    assert saved.startswith(b'\xff\xd8')
+    with pytest.raises(RuntimeError):
+        options.save(BrokenFigure(), str(path))
+    with pytest.raises(RuntimeError):
+        options.save(BrokenFigure(), str(tmp_path / "new.jpg"))
+    assert path.read_bytes() == saved
+    assert [entry.name for entry in tmp_path.iterdir()] == ["plot.jpg"]
+
+
+@pytest.mark.parametrize('kwargs', [{'format': 'gif'}, {'compress_level': 10}, {'compress_level': -1},
+                                    {'quality': 0}, {'quality': 101}, {'dpi': 0}, {'dpi': 'poster'}])
+def test_invalid_output_options(kwargs):
+    with pytest.raises(ValueError):
+        OutputOptions(**kwargs)
+
+
+def test_parse_dpi():
+    assert parse_dpi('print') == DPI_PRESETS['print']
+    assert parse_dpi('200') == 200
+    assert parse_dpi(72) == 72
+    for value in ('', None, '-5', 0):
+        with pytest.raises(ValueError):
+            parse_dpi(value)
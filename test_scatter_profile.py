@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+from scatter_profile import StageProfiler, profile_stage
+
+
+def stage_totals(seconds, calls, max_seconds, peak_bytes=0):
+    return {'seconds': seconds, 'calls': calls, 'max_seconds': max_seconds, 'peak_bytes': peak_bytes}
+
+
+def test_merge_adds_worker_totals():
+    profiler = StageProfiler()
+    profiler.record('render', 0.5, 100)
+    profiler.merge({'render': stage_totals(1.0, 3, 0.75, 50), 'save': stage_totals(0.25, 2, 0.2)})
+    profiler.merge({'render': stage_totals(2.0, 4, 0.25, 300)})
+    profiler.merge(None)
+    assert profiler.stages['render'] == {'seconds': pytest.approx(3.5), 'calls': 8, 'max_seconds': 0.75,
+                                         'peak_bytes': 300}
+    assert profiler.stages['save'] == stage_totals(0.25, 2, 0.2)
+    assert profiler.ordered_stages() == ['render', 'save']
+
+
+def test_stage_records_calls():
+    profiler = StageProfiler()
+    for _ in range(3):
+        with profile_stage(profiler, 'load'):
+            pass
+    with profile_stage(profiler, 'custom'):
+        pass
+    assert profiler.stages['load']['calls'] == 3
+    assert profiler.ordered_stages() == ['load', 'custom']
+    assert profiler.to_dict(plots=2)['stages']['load']['calls'] == 3
+    assert 'peak' not in ' '.join(profiler.summary_lines())
+
+
+def test_disabled_profiling_shares_one_null_context():
+    stage = profile_stage(None, 'render')
+    assert profile_stage(None, 'save') is stage
+    with stage:
+        with profile_stage(None, 'render'):
+            pass
+
+
+def test_write_json_creates_the_directory_and_leaves_no_temp_files(tmp_path):
+    profiler = StageProfiler()
+    profiler.record('save', 0.25)
+    path = profiler.write_json(str(tmp_path / "profiles" / "run.json"), plots=1)
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['stages']['save']['calls'] == 1
+    assert os.listdir(tmp_path / "profiles") == ["run.json"]
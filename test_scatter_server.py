@@ -0,0 +1,138 @@
+import base64
+import http.client
+import json
+import os
+import threading
+from multiprocessing import shared_memory
+
+import pytest
+
+from scatter_engine import read_plot_key
+from scatter_server import RenderService, create_server
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("server")
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "run.csv").write_text("Station,DeltaX,DeltaY,DeltaAngle\n1,0.5,0,0\n1,1.5,0,0\n2,2.5,0,0\n")
+    (tmp_path / "secret.csv").write_text("Station,DeltaX,DeltaY,DeltaAngle\n1,0.5,0,0\n")
+    service = RenderService(output_path=str(tmp_path), data_dir=str(data_dir))
+    httpd = create_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield httpd.server_address[1]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        service.close()
+
+
+def fetch(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        connection.request(method, path, body, {'Content-Type': 'application/json'} if body is not None else {})
+        response = connection.getresponse()
+        data = response.read()
+        if response.getheader('Content-Type') == 'application/json':
+            data = json.loads(data)
+        return response.status, data
+    finally:
+        connection.close()
+
+
+def render_request(**fields):
+    return {'file': 'run.csv', 'station': 1, 'data_group': 'DeltaX', 'dpi': 'draft', **fields}
+
+
+def test_health_and_unknown_paths(server):
+    status, payload = fetch(server, 'GET', '/health')
+    assert status == 200
+    assert payload['workers'] == 1 and 'cache_hits' in payload
+    assert fetch(server, 'GET', '/missing')[0] == 404
+    assert fetch(server, 'POST', '/missing', {})[0] == 404
+
+
+def test_render_returns_png(server):
+    status, data = fetch(server, 'POST', '/render', render_request())
+    assert status == 200
+    assert data.startswith(PNG_SIGNATURE)
+    status, data = fetch(server, 'GET', '/render?file=run.csv&station=2&data_group=DeltaY&dpi=draft')
+    assert status == 200
+    assert data.startswith(PNG_SIGNATURE)
+
+
+@pytest.mark.parametrize('body', [b'{not json', b'[1, 2]', b'"text"', {'requests': 5}, {'requests': "x"},
+                                  {'requests': [render_request(), 3]}])
+def test_malformed_bodies_are_rejected(server, body):
+    status, payload = fetch(server, 'POST', '/render', body)
+    assert status == 400
+    assert payload['error']
+
+
+@pytest.mark.parametrize('request_fields, expected', [
+    ({'file': '../secret.csv'}, 400),
+    ({'file': '/etc/passwd'}, 400),
+    ({'file': ['run.csv']}, 400),
+    ({'file': 'missing.csv'}, 404),
+    ({'sheet': 3}, 400),
+    ({'data_group': 'DeltaZ'}, 400),
+    ({'station': 'one'}, 400),
+    ({'station': 9}, 400),
+    ({'dpi': 0}, 400),
+    ({'format': 'gif'}, 400),
+    ({'quality': 'high'}, 400),
+    ({'file_prefix': '../run'}, 400),
+    ({'groups': {'DeltaX': 1}}, 400),
+    ({'groups': ['DeltaX']}, 400),
+    ({'render_mode': 'ascii'}, 400),
+])
+def test_invalid_requests_get_client_errors(server, request_fields, expected):
+    status, payload = fetch(server, 'POST', '/render', render_request(**request_fields))
+    assert status == expected
+    assert payload['error']
+
+
+def test_batch_reports_each_request(server):
+    status, payload = fetch(server, 'POST', '/render', {'requests': [
+        render_request(), render_request(file='missing.csv'), render_request(station=2, output='path')]})
+    assert status == 200
+    first, missing, path = payload['results']
+    assert first['status'] == 200
+    assert base64.b64decode(first['png']).startswith(PNG_SIGNATURE)
+    assert missing['status'] == 404
+    assert path == {'status': 200, 'path': path['path']}
+    assert path['path'].endswith("_Station_2_DeltaX_Plot.png")
+
+
+def test_worker_processes_render_from_shared_columns(tmp_path):
+    (tmp_path / "run.csv").write_text("Station,DeltaX,DeltaY,DeltaAngle\n1,0.5,0,0\n2,2.5,1,0\n1,1.5,0,0\n")
+    keys = {}
+    for workers in (1, 2):
+        output = tmp_path / f"workers_{workers}"
+        output.mkdir()
+        service = RenderService(output_path=str(output), data_dir=str(tmp_path), workers=workers)
+        try:
+            service.preload('run.csv')
+            assert len(service.shared) == (workers > 1)
+            requests = [render_request(station=station, data_group=group, output='path') for station in (1, 2)
+                        for group in ('DeltaX', 'DeltaY')]
+            paths = [service.submit(request).result(timeout=60) for request in requests]
+            assert service.submit(render_request()).result(timeout=60).startswith(PNG_SIGNATURE)
+            names = [block.shm.name for block in service.shared.values()]
+        finally:
+            service.close()
+        for name in names:
+            with pytest.raises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+        # the key hashes the plotted values, so equal keys mean the workers read the same station data
+        keys[workers] = [(os.path.basename(path), read_plot_key(path)) for path in paths]
+    assert keys[2] == keys[1]
+    assert len(set(key for _, key in keys[2])) == 4
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scatter_data import DATA_GROUPS, DELTA_DTYPE, StationPartitions
+from scatter_settings import DataGroupSettings
+from scatter_stats import aggregate_table, compute_group_stats, find_violations, out_of_spec_summary, spec_report
+
+
+def make_partitions(stations, values, rows=None):
+    values = np.asarray(values, dtype=DELTA_DTYPE)
+    df = pd.DataFrame({'Station': stations, **{group: values for group in DATA_GROUPS}}, index=rows)
+    return StationPartitions.from_frame(df)
+
+
+def make_settings(lines):
+    settings = DataGroupSettings()
+    for group in DATA_GROUPS:
+        settings.update_ref_lines(group, ref_lines=[], ref_styles=[], ref_colors=[], ref_labels=[])
+    settings.update_ref_lines('DeltaX', ref_lines=lines)
+    return settings
+
+
+def test_out_of_spec_summary_counts_below_and_above():
+    partitions = make_partitions([1, 1, 1, 2, 2], [-1.0, 0.5, 2.0, np.nan, 3.0])
+    summary = out_of_spec_summary(partitions, make_settings([1.0, 0.0, 0.5]))
+    assert summary.index.get_level_values('data_group').unique().tolist() == ['DeltaX']
+    assert summary.loc[(1, 'DeltaX'), ['count', 'below', 'above', 'out_of_spec']].tolist() == [3, 1, 1, 2]
+    assert summary.loc[(2, 'DeltaX'), ['count', 'below', 'above', 'out_of_spec']].tolist() == [1, 0, 1, 1]
+    assert summary.loc[(2, 'DeltaX'), 'out_of_spec_pct'] == 100.0
+
+
+def test_out_of_spec_summary_without_reference_lines():
+    summary = out_of_spec_summary(make_partitions([1], [5.0]), make_settings([]))
+    assert summary.empty
+    assert summary.index.names == ['station', 'data_group']
+
+
+def test_single_reference_line_counts_agree():
+    partitions = make_partitions([1, 1, 1], [1.0, 2.0, 3.0])
+    settings = make_settings([2.0])
+    summary = out_of_spec_summary(partitions, settings, ['DeltaX']).loc[(1, 'DeltaX')]
+    assert (summary['below'], summary['above'], summary['out_of_spec']) == (1, 1, 2)
+    assert len(find_violations(partitions, settings, ['DeltaX'])) == 2
+
+
+def test_limits_compare_in_column_dtype():
+    partitions = make_partitions([1, 1, 1], [0.1, 0.2, 0.3])
+    settings = make_settings([0.1, 0.3])
+    assert out_of_spec_summary(partitions, settings, ['DeltaX'])['out_of_spec'].sum() == 0
+    assert len(find_violations(partitions, settings, ['DeltaX'])) == 0
+
+
+def test_aggregate_table_matches_numpy():
+    rng = np.random.default_rng(0)
+    stations = rng.integers(1, 4, 500)
+    values = rng.normal(size=500).astype(DELTA_DTYPE)
+    values[::50] = np.nan
+    table = aggregate_table(make_partitions(stations, values), ['DeltaX'], window=20)
+    for station in (1, 2, 3):
+        expected = values[stations == station].astype(np.float64)
+        row = table.loc[(station, 'DeltaX')]
+        valid = expected[~np.isnan(expected)]
+        assert row['count'] == len(valid)
+        assert row['mean'] == pytest.approx(valid.mean())
+        assert [row['min'], row['q1'], row['median'], row['q3'], row['max']] == \
+            pytest.approx(np.quantile(valid, [0.0, 0.25, 0.5, 0.75, 1.0]))
+        assert row['whislo'] >= row['min'] and row['whishi'] <= row['max']
+        assert row['density'].sum() <= len(valid)
+        assert row['trend_x'][-1] == len(expected)
+        assert row['trend_mean'][-1] == pytest.approx(np.nanmean(expected[-20:]))
+
+
+def test_compute_group_stats_matches_a_per_station_loop():
+    rng = np.random.default_rng(2)
+    stations = rng.integers(1, 5, 400)
+    values = rng.normal(size=400).astype(DELTA_DTYPE)
+    values[::7] = np.nan
+    values[stations == 4] = np.nan
+    partitions = make_partitions(stations, values)
+    table = compute_group_stats(partitions, ['DeltaX'], std=True, percentiles=(10, 50, 90),
+                                bands={'DeltaX': (-1.0, 0.8)})
+    for station in (1, 2, 3):
+        station_values = values[stations == station]
+        valid = station_values[~np.isnan(station_values)].astype(np.float64)
+        row = table.loc[(station, 'DeltaX')]
+        assert row['count'] == len(valid)
+        assert (row['min'], row['max']) == (valid.min(), valid.max())
+        assert row['mean'] == pytest.approx(valid.mean())
+        assert row['std'] == pytest.approx(valid.std(ddof=1))
+        assert [row['p10'], row['p50'], row['p90']] == pytest.approx(np.percentile(valid, [10, 50, 90]))
+        low, high = DELTA_DTYPE(-1.0), DELTA_DTYPE(0.8)
+        assert row['out_of_band'] == sum(1 for value in station_values if value < low or value > high)
+    empty = table.loc[(4, 'DeltaX')]
+    assert empty['count'] == 0 and empty['out_of_band'] == 0
+    assert np.isnan([empty['min'], empty['max'], empty['mean'], empty['p50']]).all()
+
+
+def test_compute_group_stats_without_stations():
+    table = compute_group_stats(make_partitions([], []), ['DeltaX'])
+    assert table.empty
+    assert table.index.names == ['station', 'data_group']
+
+
+def test_aggregate_table_without_stations():
+    table = aggregate_table(make_partitions([], []), ['DeltaX'])
+    assert table.empty
+    assert table.index.names == ['station', 'data_group']
+
+
+def test_find_violations_orders_by_station_and_reports_source_rows():
+    partitions = make_partitions([2, 1, 2, 1, 2], [5.0, -1.0, 0.5, 3.0, -2.0], rows=[10, 11, 13, 14, 15])
+    violations = find_violations(partitions, make_settings([0.0, 1.0]), ['DeltaX'])
+    frame = violations.to_frame()
+    assert frame['station'].tolist() == [1, 1, 2, 2]
+    assert frame['row'].tolist() == [11, 14, 10, 15]
+    assert frame['limit'].tolist() == [0.0, 1.0, 1.0, 0.0]
+    assert frame['deviation'].tolist() == [-1.0, 2.0, 4.0, -2.0]
+    assert violations.rows_for(2, 'DeltaX').tolist() == [10, 15]
+    assert violations.lookup(3, 'DeltaX').empty
+    assert violations.lookup(1, 'DeltaY').empty
+
+
+def test_violation_report_picks_first_worst_row():
+    partitions = make_partitions([1, 1, 1, 1], [-2.0, 3.0, 0.5, -1.0])
+    report = find_violations(partitions, make_settings([0.0, 1.0]), ['DeltaX']).report()
+    row = report.loc[(1, 'DeltaX')]
+    assert (row['out_of_spec'], row['below'], row['above']) == (3, 2, 1)
+    assert (row['first_row'], row['last_row']) == (0, 3)
+    assert (row['worst_row'], row['worst_value'], row['worst_deviation']) == (0, -2.0, -2.0)
+
+
+def test_empty_violation_report():
+    partitions = make_partitions([1, 2], [0.5, 0.5])
+    violations = find_violations(partitions, make_settings([0.0, 1.0]), ['DeltaX'])
+    assert len(violations) == 0
+    assert violations.report().empty
+    assert violations.to_frame().empty
+
+
+def test_spec_report_keeps_stations_without_violations():
+    partitions = make_partitions([1, 1, 2, 2], [np.nan, 4.0, 0.5, 0.6])
+    report = spec_report(partitions, make_settings([0.0, 1.0]), ['DeltaX'])
+    assert report.loc[(1, 'DeltaX'), 'count'] == 1
+    assert report.loc[(1, 'DeltaX'), 'worst_row'] == 1
+    assert report.loc[(2, 'DeltaX'), 'out_of_spec'] == 0
+    assert pd.isna(report.loc[(2, 'DeltaX'), 'worst_row'])
+    assert str(report['worst_row'].dtype) == 'Int64'